@@ -0,0 +1,111 @@
+"""iCalendar 解析基准测试
+
+先检查快速解析器与 icalendar 对一组边界用例和模拟对象的解析结果一致，再分别用
+icalendar 串行解析、快速解析器串行解析和不同进程数的解析进程池解析模拟的 CalDAV
+对象，输出吞吐量和相对 icalendar 串行解析的加速比：
+
+    python benchmark_parse.py --objects 20000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from check_ical_parser import CONFORMANCE_CASES, check_conformance
+from merger.ical_parser import ParsePool
+
+
+def make_payloads(count: int) -> List[str]:
+    """生成模拟的 VCALENDAR 对象（部分为带例外实例的重复事件）"""
+    base = datetime(2024, 1, 1, 9, 0)
+    payloads = []
+    for index in range(count):
+        start = base + timedelta(hours=index * 7)
+        end = start + timedelta(hours=1)
+        lines = [
+            'BEGIN:VCALENDAR',
+            'VERSION:2.0',
+            'PRODID:-//benchmark//EN',
+            'BEGIN:VEVENT',
+            f'UID:benchmark-{index}@example.com',
+            f'SUMMARY:项目例会 {index}',
+            f'DTSTART;TZID=Asia/Shanghai:{start:%Y%m%dT%H%M%S}',
+            f'DTEND;TZID=Asia/Shanghai:{end:%Y%m%dT%H%M%S}',
+            'LOCATION:会议室 A\\, 3 楼',
+            'DESCRIPTION:讨论本周进展\\n同步下周计划',
+            'ORGANIZER;CN=张三:mailto:zhangsan@example.com',
+            'ATTENDEE;CN=李四:mailto:lisi@example.com',
+            'ATTENDEE:mailto:wangwu@example.com',
+            'CATEGORIES:工作,会议',
+            'STATUS:CONFIRMED',
+        ]
+        if index % 5 == 0:
+            lines.append('RRULE:FREQ=WEEKLY;COUNT=20')
+            lines.append(f'EXDATE;TZID=Asia/Shanghai:{start + timedelta(days=7):%Y%m%dT%H%M%S}')
+        lines.append('END:VEVENT')
+        if index % 5 == 0:
+            moved = start + timedelta(days=14)
+            lines.extend([
+                'BEGIN:VEVENT',
+                f'UID:benchmark-{index}@example.com',
+                f'RECURRENCE-ID;TZID=Asia/Shanghai:{moved:%Y%m%dT%H%M%S}',
+                f'SUMMARY:项目例会 {index}（改期）',
+                f'DTSTART;TZID=Asia/Shanghai:{moved + timedelta(hours=2):%Y%m%dT%H%M%S}',
+                f'DTEND;TZID=Asia/Shanghai:{moved + timedelta(hours=3):%Y%m%dT%H%M%S}',
+                'END:VEVENT',
+            ])
+        lines.append('END:VCALENDAR')
+        payloads.append('\r\n'.join(lines) + '\r\n')
+    return payloads
+
+
+def run(pool: ParsePool, payloads: List[str]) -> float:
+    """解析全部对象，返回耗时（秒）"""
+    items = [(data, 'benchmark', None) for data in payloads]
+    started = time.perf_counter()
+    results = pool.parse(items)
+    elapsed = time.perf_counter() - started
+    assert len(results) == len(payloads) and all(results)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='iCalendar 解析基准测试')
+    parser.add_argument('--objects', type=int, default=10000, help='对象数量')
+    parser.add_argument('--batch-size', type=int, default=200, help='每个进程任务的对象数')
+    parser.add_argument('--max-processes', type=int, default=os.cpu_count() or 1, help='最多测试的进程数')
+    parser.add_argument('--fast', action='store_true', help='进程池中使用快速解析器')
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.objects)
+    samples = [(f'模拟对象 {index}', data) for index, data in enumerate(payloads[:50])]
+    if not check_conformance(CONFORMANCE_CASES + samples):
+        sys.exit(1)
+
+    print(f"对象数: {len(payloads)}, CPU 核数: {os.cpu_count()}")
+    serial = run(ParsePool(processes=0), payloads)
+    print(f"{'icalendar':>9}: {serial:7.2f}秒 {len(payloads) / serial:9.0f} 个/秒")
+    fast = run(ParsePool(processes=0, fast_path=True), payloads)
+    print(f"{'快速解析':>7}: {fast:7.2f}秒 {len(payloads) / fast:9.0f} 个/秒 加速比 {serial / fast:.2f}x")
+
+    processes = 1
+    while processes <= args.max_processes:
+        pool = ParsePool(processes=processes, batch_size=args.batch_size, min_objects=0,
+                         fast_path=args.fast)
+        try:
+            # 预热：进程启动与模块导入不计入耗时
+            run(pool, payloads[:processes * args.batch_size])
+            elapsed = run(pool, payloads)
+        finally:
+            pool.close()
+        print(
+            f"{processes:>7}进程: {elapsed:7.2f}秒 {len(payloads) / elapsed:9.0f} 个/秒 "
+            f"加速比 {serial / elapsed:.2f}x"
+        )
+        processes *= 2
+
+
+if __name__ == '__main__':
+    main()
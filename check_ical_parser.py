@@ -0,0 +1,106 @@
+"""快速解析器一致性检查
+
+用一组边界用例比较逐行快速解析器与 icalendar 的解析结果，任一用例不一致时以非零状态退出：
+
+    python check_ical_parser.py
+
+benchmark_parse.py 在测量吞吐量之前也会运行这些用例。
+"""
+import sys
+from typing import Dict, List
+
+from merger.ical_parser import FastPathUnsupported, fast_components, parse_payload
+
+# 快速解析器的边界用例：(说明, VCALENDAR 数据)
+CONFORMANCE_CASES = [
+    ('折行与转义', (
+        'BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nUID:fold\\,1\r\n'
+        'SUMMARY:很长的标题\\, 第一\r\n 部分\\n第二行\\; 结束\\\\\r\n'
+        'DESCRIPTION:a\\Nb\r\n\tc\r\nDTSTART:20261020T100000Z\r\nDTEND:20261020T110000Z\r\n'
+        'END:VEVENT\r\nEND:VCALENDAR\r\n'
+    )),
+    ('转义的反斜杠与冒号', (
+        'BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nUID:escape\r\nSUMMARY:a\\:b\\x\r\n'
+        'DESCRIPTION:x\\\\n y\\\\\\,z\r\nDTSTART:20261020T100000Z\r\nEND:VEVENT\r\nEND:VCALENDAR\r\n'
+    )),
+    ('全天事件', (
+        'BEGIN:VCALENDAR\nBEGIN:VEVENT\nUID:allday\nDTSTART;VALUE=DATE:20261020\n'
+        'DTEND;VALUE=DATE:20261021\nSUMMARY:全天\nEND:VEVENT\nEND:VCALENDAR\n'
+    )),
+    ('TZID 与浮动时间', (
+        'BEGIN:VCALENDAR\nBEGIN:VEVENT\nUID:tz\nDTSTART;TZID="America/New_York":20260308T013000\n'
+        'DTEND:20260308T033000\nEND:VEVENT\nEND:VCALENDAR\n'
+    )),
+    ('参与者、分类与提醒', (
+        'BEGIN:VCALENDAR\nBEGIN:VEVENT\nUID:people\nDTSTART:20261020T100000Z\n'
+        'ORGANIZER;CN="张, 三":mailto:zs@example.com\nATTENDEE;CN=李四;ROLE=REQ-PARTICIPANT:mailto:ls@example.com\n'
+        'ATTENDEE;RSVP=TRUE:mailto:ww@example.com\nCATEGORIES:A,B\\,C\nCATEGORIES:D\nSTATUS:TENTATIVE\n'
+        'BEGIN:VALARM\nACTION:DISPLAY\nDESCRIPTION:提醒\nTRIGGER:-PT15M\nEND:VALARM\n'
+        'END:VEVENT\nEND:VCALENDAR\n'
+    )),
+    ('单个参与者', (
+        'BEGIN:VCALENDAR\nBEGIN:VEVENT\nUID:single\nDTSTART:20261020T100000Z\n'
+        'ATTENDEE;CN=Li:mailto:li@example.com\nCATEGORIES:A\nEND:VEVENT\nEND:VCALENDAR\n'
+    )),
+    ('重复事件与例外实例', (
+        'BEGIN:VCALENDAR\nBEGIN:VEVENT\nUID:rec\nSUMMARY:周会\nDTSTART;TZID=Asia/Shanghai:20261005T090000\n'
+        'DTEND;TZID=Asia/Shanghai:20261005T100000\nRRULE:count=10;FREQ=weekly;BYDAY=MO\n'
+        'EXDATE;TZID=Asia/Shanghai:20261012T090000,20261019T090000\nRDATE;VALUE=DATE-TIME:20261030T090000Z\n'
+        'END:VEVENT\nBEGIN:VEVENT\nUID:rec\nRECURRENCE-ID;TZID=Asia/Shanghai:20261026T090000\n'
+        'SUMMARY:周会（改期）\nDTSTART;TZID=Asia/Shanghai:20261027T140000\n'
+        'DTEND;TZID=Asia/Shanghai:20261027T150000\nSTATUS:CONFIRMED\nEND:VEVENT\nEND:VCALENDAR\n'
+    )),
+    ('自定义时区（交给 icalendar）', (
+        'BEGIN:VCALENDAR\nBEGIN:VTIMEZONE\nTZID:Custom Zone\nBEGIN:STANDARD\nDTSTART:19700101T000000\n'
+        'TZOFFSETFROM:+0300\nTZOFFSETTO:+0300\nEND:STANDARD\nEND:VTIMEZONE\nBEGIN:VEVENT\nUID:custom\n'
+        'DTSTART;TZID=Custom Zone:20261020T100000\nEND:VEVENT\nEND:VCALENDAR\n'
+    )),
+    ('PERIOD（交给 icalendar）', (
+        'BEGIN:VCALENDAR\nBEGIN:VEVENT\nUID:period\nDTSTART:20261020T100000Z\nRRULE:FREQ=DAILY;COUNT=2\n'
+        'RDATE;VALUE=PERIOD:20261025T100000Z/PT1H\nEND:VEVENT\nEND:VCALENDAR\n'
+    )),
+    ('没有 UID（交给 icalendar）', (
+        'BEGIN:VCALENDAR\nBEGIN:VEVENT\nSUMMARY:x\nDTSTART:20261020T100000Z\nEND:VEVENT\nEND:VCALENDAR\n'
+    )),
+]
+
+
+def _comparable(events) -> List[Dict]:
+    """去掉解析时间等每次不同的字段"""
+    if events is None:
+        return None
+    result = []
+    for event in events:
+        event = dict(event, metadata=dict(event['metadata']))
+        event.pop('created_time', None)
+        event['metadata'].pop('parsed_time', None)
+        result.append(event)
+    return result
+
+
+def check_conformance(cases: List[tuple]) -> bool:
+    """比较快速解析器与 icalendar 的解析结果，返回是否全部一致"""
+    passed = True
+    fast_count = 0
+    for label, data in cases:
+        try:
+            fast_components(data)
+            fast_count += 1
+        except FastPathUnsupported:
+            pass
+        expected = _comparable(parse_payload(data, 'check'))
+        actual = _comparable(parse_payload(data, 'check', fast=True))
+        if actual != expected:
+            passed = False
+            print(f"不一致: {label}\n  icalendar: {expected}\n  快速解析: {actual}")
+    print(f"一致性检查: {len(cases)} 个对象, {fast_count} 个使用快速解析, {'通过' if passed else '失败'}")
+    return passed
+
+
+def main():
+    if not check_conformance(CONFORMANCE_CASES):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
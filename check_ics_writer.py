@@ -0,0 +1,183 @@
+"""ICS 输出检查
+
+检查流式渲染的整合日历与原先整体构建 Calendar 的渲染结果逐字节相同，且符合
+RFC 5545 的要求，失败时以非零状态退出：
+
+    python check_ics_writer.py
+"""
+import random
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from icalendar import Calendar, Event
+
+from merger.ics_writer import iter_icalendar
+
+_TZID_PARAM = re.compile(r';TZID="?([^":;]+)"?[:;]')
+
+
+def make_event(uid: str, start_time: str, end_time: str, **fields) -> Dict:
+    """构造存储格式的事件"""
+    event = {
+        'uid': uid,
+        'title': uid,
+        'start_time': start_time,
+        'end_time': end_time,
+        'location': '未指定',
+        'description': '',
+        'status': 'CONFIRMED',
+        'categories': [],
+        'source_calendar': 'check',
+        'recurrence_rule': None,
+        'metadata': {}
+    }
+    event.update(fields)
+    return event
+
+
+def legacy_icalendar(events: List[Dict]) -> str:
+    """流式渲染之前的实现：整体构建 Calendar 后一次性序列化（只支持非重复事件）"""
+    calendar = Calendar()
+    calendar.add('prodid', '-//Calendar Merger//example.com//')
+    calendar.add('version', '2.0')
+    calendar.add('x-wr-calname', '整合日历')
+    calendar.add('x-wr-caldesc', '多个日历源整合')
+    calendar.add('x-wr-timezone', 'Asia/Shanghai')
+
+    for event_data in events:
+        event = Event()
+        event.add('uid', event_data['uid'])
+        event.add('summary', event_data['title'])
+        event.add('dtstart', datetime.fromisoformat(event_data['start_time']))
+        event.add('dtend', datetime.fromisoformat(event_data['end_time']))
+        if event_data['location'] and event_data['location'] != '未指定':
+            event.add('location', event_data['location'])
+        if event_data['description']:
+            event.add('description', event_data['description'])
+        event.add('status', event_data.get('status', 'CONFIRMED'))
+        if event_data['categories']:
+            event.add('categories', event_data['categories'])
+        event.add('x-source-calendar', event_data['source_calendar'])
+        calendar.add_component(event)
+
+    return calendar.to_ical().decode('utf-8')
+
+
+def single_events(count: int, seed: int = 7) -> List[Dict]:
+    """非重复事件：不同时区偏移、浮动时间、全天日期、多行与非 ASCII 文本、值中的分隔符"""
+    rng = random.Random(seed)
+    offsets = [timezone.utc, timezone(timedelta(hours=8)), timezone(timedelta(hours=-5, minutes=-30)), None]
+    texts = ['项目例会', 'Weekly sync; planning, review', '多行\n描述：第一行\n第二行', 'a\\b "quoted" \'x\'',
+             'ümlaut café naïve', '很长的标题' * 20, 'emoji 📅 日程', 'tab\tand:colon']
+    events = []
+    base = datetime(2026, 1, 1, 8, 0)
+    for index in range(count):
+        start = base + timedelta(minutes=37 * index)
+        if index % 11 == 0:
+            start_time = start.date().isoformat()
+            end_time = (start + timedelta(days=1)).date().isoformat()
+        else:
+            zone = offsets[index % len(offsets)]
+            start = start.replace(tzinfo=zone) if zone else start
+            start_time = start.isoformat()
+            end_time = (start + timedelta(minutes=rng.choice([15, 30, 60, 90]))).isoformat()
+        events.append(make_event(
+            f'event-{index}@example.com', start_time, end_time,
+            title=rng.choice(texts),
+            location=rng.choice(['未指定', '', '会议室 A, 3 楼', 'Room; 2']),
+            description=rng.choice(['', rng.choice(texts) * rng.randint(1, 5)]),
+            status=rng.choice(['CONFIRMED', 'TENTATIVE', 'confirmed']),
+            categories=rng.choice([[], ['工作'], ['A,B', 'C;D'], ['Work', 'home', '会议']]),
+            source_calendar=rng.choice(['工作/日历', 'Personal', 'team, shared'])
+        ))
+    return events
+
+
+def check_legacy_output() -> bool:
+    """非重复事件的流式渲染结果与原先整体构建 Calendar 的结果逐字节相同"""
+    events = single_events(3000)
+    expected = legacy_icalendar(events)
+    passed = True
+    for chunk_events in (1, 7, 200, 5000):
+        actual = ''.join(iter_icalendar(events, chunk_events=chunk_events))
+        if actual != expected:
+            passed = False
+            position = next((i for i, (a, b) in enumerate(zip(actual, expected)) if a != b),
+                            min(len(actual), len(expected)))
+            print(f"不一致 (chunk_events={chunk_events}) 位置 {position}:\n"
+                  f"  原实现: {expected[position - 80:position + 80]!r}\n"
+                  f"  流式: {actual[position - 80:position + 80]!r}")
+    print(f"逐字节比较: {len(events)} 个事件, {'通过' if passed else '失败'}")
+    return passed
+
+
+def check_streaming_matches_calendar() -> bool:
+    """包含重复事件时，流式结果与按相同组件顺序整体构建的 Calendar 逐字节相同"""
+    events = single_events(200, seed=11) + recurring_events()
+    random.Random(3).shuffle(events)
+    streamed = ''.join(iter_icalendar(events, chunk_events=3))
+    rebuilt = Calendar.from_ical(streamed).to_ical().decode('utf-8')
+    passed = streamed == rebuilt
+    print(f"重新序列化比较: {len(events)} 个事件, {'通过' if passed else '失败'}")
+    return passed
+
+
+def recurring_events() -> List[Dict]:
+    """不同时区的重复事件（带 EXDATE、RDATE 与例外实例）"""
+    return [
+        make_event(
+            'weekly-shanghai', '2026-10-05T09:00:00+08:00', '2026-10-05T10:00:00+08:00',
+            recurrence_rule='FREQ=WEEKLY;BYDAY=MO',
+            metadata={
+                'recurrence': True, 'tzid': 'Asia/Shanghai', 'rdate': [],
+                'exdate': ['2026-10-12T09:00:00+08:00'],
+                'overrides': [{
+                    'recurrence_id': '2026-10-19T09:00:00+08:00',
+                    'start_time': '2026-10-19T14:00:00+08:00',
+                    'end_time': '2026-10-19T15:00:00+08:00',
+                    'title': '改期'
+                }]
+            }
+        ),
+        make_event(
+            'daily-new-york', '2026-03-07T14:00:00+00:00', '2026-03-07T15:00:00+00:00',
+            recurrence_rule='FREQ=DAILY;COUNT=5',
+            metadata={
+                'recurrence': True, 'tzid': 'America/New_York',
+                'rdate': ['2026-03-20T13:00:00+00:00'], 'exdate': []
+            }
+        ),
+        make_event(
+            'weekly-shanghai-2', '2026-10-06T09:00:00+08:00', '2026-10-06T10:00:00+08:00',
+            recurrence_rule='FREQ=WEEKLY',
+            metadata={'recurrence': True, 'tzid': 'Asia/Shanghai', 'rdate': [], 'exdate': []}
+        ),
+    ]
+
+
+def check_timezones() -> bool:
+    """重复事件引用的每个 TZID 都有且只有一个对应的 VTIMEZONE"""
+    body = ''.join(iter_icalendar(recurring_events(), chunk_events=1))
+    calendar = Calendar.from_ical(body)
+
+    referenced = set(_TZID_PARAM.findall(body))
+    defined = [str(component['TZID']) for component in calendar.walk('VTIMEZONE')]
+    passed = referenced == {'Asia/Shanghai', 'America/New_York'} and sorted(defined) == sorted(referenced)
+
+    rules = [component for component in calendar.walk('VEVENT') if component.get('rrule')]
+    if len(rules) != 3 or len(calendar.walk('VEVENT')) != 4:
+        passed = False
+    print(f"VTIMEZONE 检查: 引用 {sorted(referenced)}, 定义 {defined}, {'通过' if passed else '失败'}")
+    return passed
+
+
+def main():
+    checks = [check_legacy_output, check_streaming_matches_calendar, check_timezones]
+    if not all([check() for check in checks]):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,12 +12,66 @@ class Config:
     DATA_DIR = './data'
     DATABASE_PATH = os.path.join(DATA_DIR, 'calendars.db')
     BACKUP_DIR = os.path.join(DATA_DIR, 'backups')
+    ICS_CACHE_PATH = os.path.join(DATA_DIR, 'merged_calendar.ics')  # 预渲染的整合日历
+    FEED_CACHE_SIZE = 32  # 内存中缓存的筛选订阅数量（按最近使用淘汰）
+    SOURCE_CACHE_PATH = os.path.join(DATA_DIR, 'calendar_sources.json')  # 已发现的日历地址
+    
+    # SQLite 连接配置
+    SQLITE_POOL_SIZE = 8             # 连接池保留的空闲连接数
+    SQLITE_CACHE_SIZE_KB = 20000     # 每个连接的页缓存大小（KB）
+    SQLITE_BUSY_TIMEOUT_MS = 5000    # 数据库被锁定时的等待时间（毫秒）
     
     # 日历同步配置
-    SYNC_INTERVAL = 300  # 5分钟
+    SYNC_INTERVAL = 300  # 5分钟（日历源未单独配置 sync_interval 时使用）
     SYNC_RETRY_COUNT = 3
     SYNC_TIMEOUT = 30
     
+    # 同步调度配置（按日历源独立调度）
+    SYNC_BACKOFF_BASE = 10           # 失败重试的初始退避时间（秒），每次翻倍
+    SYNC_BACKOFF_MAX = 600           # 退避时间上限（秒）
+    SYNC_JITTER = 0.1                # 同步间隔附加的随机抖动比例
+    SYNC_BREAKER_THRESHOLD = 5       # 连续失败多少次后打开熔断器
+    SYNC_BREAKER_COOLDOWN = 1800     # 熔断冷却时间（秒）
+    
+    # 并发获取配置
+    SYNC_CONCURRENT = True       # 是否并发获取所有日历源
+    SYNC_MAX_WORKERS = 8         # 并发获取线程池大小
+    SYNC_SOURCE_TIMEOUT = 120    # 单个日历源获取超时（秒）
+    SYNC_INCREMENTAL = True      # 使用 sync-token / ETag 增量同步
+    SYNC_MULTIGET_BATCH = 50     # 每个 calendar-multiget 请求下载的对象数（0 表示逐个下载）
+    
+    # iCalendar 解析进程池（对象很多时多核并行解析）
+    PARSE_PROCESSES = 0          # 解析进程数，0 表示在同步线程中串行解析
+    PARSE_BATCH_SIZE = 200       # 每个进程任务解析的对象数
+    PARSE_MIN_OBJECTS = 500      # 单次解析的对象数达到该值时才使用进程池
+    PARSE_FAST_PATH = False      # 使用逐行快速解析器，不支持的对象交给 icalendar
+    
+    # 同步时间范围（全量搜索按分块并发请求）
+    SYNC_PAST_DAYS = 0                 # 同步过去多少天的事件
+    SYNC_FUTURE_DAYS = 30              # 同步未来多少天的事件
+    SYNC_CHUNK_DAYS = 7                # 每个搜索分块的天数
+    SYNC_CHUNK_WORKERS = 4             # 单个日历源并发请求的分块数
+    SYNC_PAST_CHUNK_REFRESH = 21600    # 已完全过去的分块重新获取的间隔（秒）
+    
+    # 上游删除检测（标记-清除）
+    SYNC_SWEEP = True                # 软删除上游已删除的事件
+    SYNC_SWEEP_MAX_FRACTION = 0.5    # 单次删除超过该比例时需下次同步确认
+    SYNC_SWEEP_MIN_GUARDED = 10      # 删除数量不超过该值时不做比例检查
+    
+    # 跨源去重配置
+    DEDUP_CROSS_SOURCE = True          # 合并不同日历源中的同一事件
+    DEDUP_TIME_TOLERANCE = 300         # 起止时间允许的差异（秒）
+    DEDUP_TITLE_SIMILARITY = 0.85      # 归一化标题的最低相似度 (0~1)
+    DEDUP_PARTICIPANT_OVERLAP = 0.5    # 双方都有参与者时的最低重合度 (0~1)
+    
+    # 重复事件展开配置（occurrences 表的滚动窗口）
+    RECURRENCE_PAST_DAYS = 30      # 展开到过去多少天
+    RECURRENCE_FUTURE_DAYS = 365   # 展开到未来多少天
+    
+    # 账号未在 cal_setting.json 中指定 calendars 时同步的日历："all" 全部日历，"first" 第一个日历。
+    # 默认 "first" 与之前的版本一致；"all" 在账号有多个日历时会把源名称改为 "账号/日历名"
+    CALDAV_DEFAULT_CALENDARS = 'first'
+    
     # 从配置文件中读取 CalDAV 服务器配置
     @staticmethod
     def _load_caldav_servers():
@@ -35,6 +89,15 @@ class Config:
                             'username': server['username'],
                             'password': server['password']
                         }
+                        # 可选：该日历源单独的同步间隔（秒）
+                        if server.get('sync_interval'):
+                            validated_server['sync_interval'] = int(server['sync_interval'])
+                        # 可选：同步的日历，"all"、"first" 或日历名称列表
+                        calendars = server.get('calendars')
+                        if isinstance(calendars, str) and calendars in ('all', 'first'):
+                            validated_server['calendars'] = calendars
+                        elif isinstance(calendars, list) and calendars:
+                            validated_server['calendars'] = [str(name) for name in calendars]
                         validated_servers.append(validated_server)
                 return validated_servers
         # 如果配置文件不存在，返回空列表
@@ -45,6 +108,15 @@ class Config:
     # Web 服务配置
     WEB_TITLE = "整合日历服务"
     WEB_DESCRIPTION = "多个日历源整合服务"
+    API_MAX_PAGE_SIZE = 1000     # /api/events 每页最多返回的事件数
+    
+    # 响应压缩（gzip；安装 brotli 后同时支持 br）
+    COMPRESSION_ENABLED = True   # 按 Accept-Encoding 压缩 ICS 与 JSON 响应
+    COMPRESSION_BROTLI = True    # 客户端支持时优先使用 brotli
+    COMPRESSION_MIN_SIZE = 1024  # 小于该字节数的响应不压缩
+    
+    # 指标（/metrics，Prometheus 文本格式）
+    METRICS_ENABLED = True
     
     # 安全配置
     ALLOWED_HOSTS = ['*']
@@ -5,7 +5,6 @@
 
 import logging
 import threading
-import time
 import signal
 import sys
 import os
@@ -15,6 +14,8 @@ from config import Config
 from storage.sqlite_storage import SQLiteCalendarStorage
 from storage.json_storage import JSONCalendarStorage
 from merger.calendar_merger import CalendarMerger
+from merger.scheduler import SyncScheduler
+from merger.sync_jobs import SyncJobQueue
 from server.web_server import CalendarWebServer
 
 # 确保日志目录存在
@@ -41,7 +42,8 @@ class CalendarService:
         self.storage = None
         self.merger = None
         self.server = None
-        self.sync_thread = None
+        self.scheduler = None
+        self.startup_thread = None
         
     def initialize(self):
         """初始化服务"""
@@ -49,21 +51,40 @@ class CalendarService:
         
         try:
             # 初始化存储
-            self.storage = SQLiteCalendarStorage(Config.DATABASE_PATH)
+            self.storage = SQLiteCalendarStorage(
+                Config.DATABASE_PATH,
+                pool_size=Config.SQLITE_POOL_SIZE,
+                cache_size_kb=Config.SQLITE_CACHE_SIZE_KB,
+                busy_timeout_ms=Config.SQLITE_BUSY_TIMEOUT_MS,
+                recurrence_past_days=Config.RECURRENCE_PAST_DAYS,
+                recurrence_future_days=Config.RECURRENCE_FUTURE_DAYS
+            )
             logger.info("存储系统初始化完成")
             
-            # 初始化日历合并器
-            self.merger = CalendarMerger(self.storage)
+            # 初始化日历合并器（日历源发现在后台进行）
+            self.merger = CalendarMerger(self.storage, discover=False)
             logger.info("日历合并器初始化完成")
             
+            # 初始化同步调度器
+            self.scheduler = SyncScheduler(
+                self.merger,
+                default_interval=Config.SYNC_INTERVAL,
+                retry_count=Config.SYNC_RETRY_COUNT,
+                backoff_base=Config.SYNC_BACKOFF_BASE,
+                backoff_max=Config.SYNC_BACKOFF_MAX,
+                jitter=Config.SYNC_JITTER,
+                breaker_threshold=Config.SYNC_BREAKER_THRESHOLD,
+                breaker_cooldown=Config.SYNC_BREAKER_COOLDOWN,
+                source_timeout=Config.SYNC_SOURCE_TIMEOUT,
+                max_workers=Config.SYNC_MAX_WORKERS
+            )
+            
             # 初始化 Web 服务器
-            self.server = CalendarWebServer(self.storage, self.merger)
+            self.server = CalendarWebServer(
+                self.storage, self.merger, self.scheduler, SyncJobQueue(self.merger)
+            )
             logger.info("Web 服务器初始化完成")
             
-            # 执行初始同步
-            logger.info("执行初始日历同步...")
-            self.merger.merge_all_events()
-            
             return True
             
         except Exception as e:
@@ -71,26 +92,27 @@ class CalendarService:
             return False
     
     def start_sync_scheduler(self):
-        """启动定时同步"""
-        def sync_worker():
-            while self.running:
-                try:
-                    logger.info("开始定时同步...")
-                    self.merger.merge_all_events()
-                    logger.info(f"定时同步完成，等待 {Config.SYNC_INTERVAL} 秒")
-                except Exception as e:
-                    logger.error(f"定时同步失败: {e}")
+        """在后台发现日历源并执行初始同步，完成后启动定时同步
+        
+        Web 服务器无需等待，启动期间直接使用已有的数据库与磁盘上的 ICS 缓存提供服务。
+        """
+        def startup():
+            try:
+                self.merger.setup_calendar_sources()
+                logger.info(f"日历源就绪: {len(self.merger.source_calendars)} 个")
                 
-                # 等待下次同步
-                for _ in range(Config.SYNC_INTERVAL):
-                    if not self.running:
-                        break
-                    time.sleep(1)
+                logger.info("执行初始日历同步...")
+                self.merger.merge_all_events()
+            except Exception as e:
+                logger.error(f"初始同步失败: {e}")
+            
+            if self.running:
+                # 每个日历源按各自的间隔独立调度
+                self.scheduler.start()
+                logger.info(f"定时同步已启动，默认间隔: {Config.SYNC_INTERVAL} 秒")
         
-        self.sync_thread = threading.Thread(target=sync_worker)
-        self.sync_thread.daemon = True
-        self.sync_thread.start()
-        logger.info(f"定时同步已启动，间隔: {Config.SYNC_INTERVAL} 秒")
+        self.startup_thread = threading.Thread(target=startup, name='startup-sync', daemon=True)
+        self.startup_thread.start()
     
     def start(self):
         """启动服务"""
@@ -108,7 +130,7 @@ class CalendarService:
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
         
-        # 启动定时同步
+        # 在后台发现日历源、执行初始同步并启动定时同步
         self.start_sync_scheduler()
         
         # 启动 Web 服务器
@@ -126,8 +148,14 @@ class CalendarService:
         logger.info("正在停止日历服务...")
         self.running = False
         
-        if self.sync_thread:
-            self.sync_thread.join(timeout=5)
+        if self.scheduler:
+            self.scheduler.stop()
+        
+        if self.merger:
+            self.merger.close()
+        
+        if self.storage:
+            self.storage.close()
         
         logger.info("日历服务已停止")
 
@@ -1,183 +1,662 @@
 import caldav
-from icalendar import Calendar, Event, vCalAddress, vText
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from datetime import date, datetime
+from typing import List, Dict, Any, Optional, Set, Tuple, Iterator, Callable
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait, FIRST_COMPLETED
+import json
 import logging
+import os
+import threading
 import time
 from config import Config
+from merger.dedup import CrossSourceDeduplicator
+from merger.ical_parser import ParsePool, parse_calendar_data
+from merger.incremental_sync import IncrementalSyncer, SyncNotSupported
+from merger.feed_cache import FeedCache, feed_filter, feed_window
+from merger.ics_cache import ICSCache
+from merger.ics_writer import iter_icalendar
+from storage.base import iso_to_epoch
+from metrics import (
+    DEDUP_SECONDS, ICS_RENDER_SECONDS, PARSE_SECONDS, SOURCE_ERRORS, SOURCE_EVENTS, SOURCE_FETCH_SECONDS
+)
 
 logger = logging.getLogger(__name__)
 
+# 删除检测时同步窗口两端收缩的余量（秒）
+SWEEP_MARGIN = 86400
+
+
 class CalendarMerger:
     """日历合并器"""
     
-    def __init__(self, storage):
+    def __init__(self, storage, discover: bool = True):
         self.storage = storage
         self.source_calendars = []
-        self.setup_calendar_sources()
+        # 日历源名称 -> 所属账号与日历名，解析时写入事件的 metadata
+        self._origins: Dict[str, Dict[str, str]] = {}
+        self.parser = ParsePool(
+            processes=Config.PARSE_PROCESSES,
+            batch_size=Config.PARSE_BATCH_SIZE,
+            min_objects=Config.PARSE_MIN_OBJECTS,
+            fast_path=Config.PARSE_FAST_PATH
+        )
+        self.syncer = IncrementalSyncer(
+            storage, self._parse_calendar_data, multiget_batch=Config.SYNC_MULTIGET_BATCH,
+            parse_many=self._parse_many
+        )
+        self.ics_cache = ICSCache(Config.ICS_CACHE_PATH)
+        self.feed_cache = FeedCache(Config.FEED_CACHE_SIZE)
+        self._sweep_pending: Dict[str, bool] = {}
+        self._source_events: Dict[str, List[Dict]] = {}
+        self._apply_lock = threading.Lock()
+        self._fetch_locks: Dict[str, threading.Lock] = {}
+        # 日历源名称 -> {(分块开始, 分块结束): {'fetched', 'events'}}，全量搜索时复用过去分块的结果
+        self._chunk_cache: Dict[str, Dict[Tuple[int, int], Dict]] = {}
+        self.deduplicator = CrossSourceDeduplicator(
+            time_tolerance=Config.DEDUP_TIME_TOLERANCE,
+            title_similarity=Config.DEDUP_TITLE_SIMILARITY,
+            participant_overlap=Config.DEDUP_PARTICIPANT_OVERLAP
+        )
+        # discover 为 False 时由调用方稍后（如在后台线程中）调用 setup_calendar_sources
+        if discover:
+            self.setup_calendar_sources()
     
     def setup_calendar_sources(self):
-        """设置日历源"""
-        for server_config in Config.CALDAV_SERVERS:
-            try:
-                client = caldav.DAVClient(
-                    url=server_config['url'],
-                    username=server_config['username'],
-                    password=server_config['password'],
-                    timeout=Config.SYNC_TIMEOUT
-                )
-                
-                # 测试连接
-                principal = client.principal()
-                calendars = principal.calendars()
-                
-                if calendars:
-                    self.source_calendars.append({
-                        'name': server_config['name'],
-                        'client': client,
-                        'calendar': calendars[0],
-                        'config': server_config
-                    })
-                    logger.info(f"成功连接日历源: {server_config['name']}")
-                else:
-                    logger.warning(f"日历源 {server_config['name']} 没有找到日历")
-                    
-            except Exception as e:
-                logger.error(f"连接日历源失败 {server_config['name']}: {e}")
-    
-    def fetch_events_from_source(self, source: Dict, days: int = 30) -> List[Dict]:
-        """从单个日历源获取事件"""
-        events = []
-        try:
-            calendar = source['calendar']
-            start_date = datetime.now()
-            end_date = start_date + timedelta(days=days)
-            
-            # 搜索事件
-            caldav_events = calendar.search(
-                start=start_date,
-                end=end_date,
-                event=True
-            )
-            
-            for caldav_event in caldav_events:
+        """设置日历源
+        
+        每个账号按配置选择全部或指定名称的日历，每个日历作为一个独立的日历源，
+        同一账号的日历共用一个客户端（HTTP 会话与连接池）。上次发现的日历地址缓存在
+        磁盘上，命中缓存的账号直接使用该地址，不再执行 principal 发现；其余账号并发
+        发现。结果按配置顺序排列。
+        """
+        servers = Config.CALDAV_SERVERS
+        if not servers:
+            return
+        
+        cache = self._load_source_cache()
+        
+        def setup(server_config: Dict) -> List[Dict]:
+            cached = cache.get(server_config['name'])
+            if cached and cached.get('url') == server_config['url'] \
+                    and cached.get('username') == server_config['username'] \
+                    and cached.get('selection') == self._calendar_selection(server_config) \
+                    and cached.get('calendars'):
                 try:
-                    ical_component = caldav_event.icalendar_component
-                    if not ical_component:
-                        continue
-                    
-                    # 转换为统一格式
-                    event_data = self._parse_ical_event(ical_component, source['name'])
-                    if event_data:
-                        events.append(event_data)
-                        
+                    return self._sources_from_cache(server_config, cached['calendars'])
                 except Exception as e:
-                    logger.error(f"解析事件失败: {e}")
-                    continue
-            
-            logger.info(f"从 {source['name']} 获取到 {len(events)} 个事件")
-            
-        except Exception as e:
-            logger.error(f"从 {source['name']} 获取事件失败: {e}")
+                    logger.warning(f"使用缓存的日历地址失败 {server_config['name']}: {e}")
+            return self._discover_sources(server_config)
         
-        return events
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(Config.SYNC_MAX_WORKERS, len(servers))),
+            thread_name_prefix='caldav-discover'
+        ) as executor:
+            sources = [source for account in executor.map(setup, servers) for source in account]
+        
+        self.source_calendars = sources
+        self._origins = {
+            source['name']: {'account': source['account'], 'calendar': source['calendar_name']}
+            for source in sources
+        }
+        self._save_source_cache()
+    
+    @staticmethod
+    def _create_client(server_config: Dict):
+        """创建 CalDAV 客户端（不发起请求）"""
+        return caldav.DAVClient(
+            url=server_config['url'],
+            username=server_config['username'],
+            password=server_config['password'],
+            timeout=Config.SYNC_TIMEOUT
+        )
     
-    def _parse_ical_event(self, ical_event, source_name: str) -> Optional[Dict]:
-        """解析 iCalendar 事件为统一格式"""
+    @staticmethod
+    def _calendar_selection(server_config: Dict):
+        """账号选择的日历：'all'、'first' 或日历名称列表"""
+        return server_config.get('calendars') or Config.CALDAV_DEFAULT_CALENDARS
+    
+    @staticmethod
+    def _url_segment(calendar) -> str:
+        """日历地址的最后一段"""
+        return str(calendar.url).rstrip('/').rsplit('/', 1)[-1]
+    
+    def _calendar_label(self, calendar) -> str:
+        """日历的显示名，没有时使用地址的最后一段"""
         try:
-            # 基础信息
-            uid = str(ical_event.get('uid', ''))
-            if not uid:
-                uid = f"generated-{int(time.time())}-{hash(str(ical_event))}"
-            
-            title = str(ical_event.get('summary', '未命名事件'))
+            name = calendar.get_display_name()
+        except Exception:
+            name = None
+        return str(name) if name else self._url_segment(calendar)
+    
+    def _select_calendars(self, server_config: Dict, calendars: List[Tuple[Any, str]]) -> List[Tuple[Any, str]]:
+        """按配置从账号的日历中选择要同步的日历"""
+        selection = self._calendar_selection(server_config)
+        if selection == 'all':
+            return calendars
+        if selection == 'first':
+            return calendars[:1]
+        
+        # 按显示名或地址最后一段匹配
+        selected = [
+            (calendar, label) for calendar, label in calendars
+            if label in selection or self._url_segment(calendar) in selection
+        ]
+        matched = {label for _, label in selected} | {self._url_segment(calendar) for calendar, _ in selected}
+        missing = [name for name in selection if name not in matched]
+        if missing:
+            logger.warning(f"日历源 {server_config['name']} 中没有找到日历: {', '.join(missing)}")
+        return selected
+    
+    @staticmethod
+    def _build_sources(server_config: Dict, client, calendars: List[Tuple[Any, str]]) -> List[Dict]:
+        """为账号的每个日历构造日历源
+        
+        只选择了一个日历时源名称即账号名称，与单日历时的数据保持一致；
+        选择了多个日历时源名称为 "账号/日历名"。
+        """
+        account = server_config['name']
+        sources = []
+        names = set()
+        for calendar, label in calendars:
+            name = f"{account}/{label}" if len(calendars) > 1 else account
+            if name in names:
+                name = f"{name} ({len(names) + 1})"
+            names.add(name)
+            sources.append({
+                'name': name,
+                'account': account,
+                'calendar_name': label,
+                'client': client,
+                'calendar': calendar,
+                'config': server_config
+            })
+        return sources
+    
+    def _sources_from_cache(self, server_config: Dict, cached_calendars: List[Dict]) -> List[Dict]:
+        """根据缓存的日历地址构造日历源"""
+        client = self._create_client(server_config)
+        logger.info(f"使用缓存的日历地址: {server_config['name']} ({len(cached_calendars)} 个日历)")
+        sources = self._build_sources(server_config, client, [
+            (client.calendar(url=item['url']), item['name']) for item in cached_calendars
+        ])
+        for source in sources:
+            source['from_cache'] = True
+        return sources
+    
+    def _discover_sources(self, server_config: Dict) -> List[Dict]:
+        """通过 principal 发现账号的日历"""
+        try:
+            client = self._create_client(server_config)
             
-            # 时间处理
-            start_time = ical_event.get('dtstart')
-            end_time = ical_event.get('dtend')
+            # 测试连接
+            principal = client.principal()
+            calendars = principal.calendars()
             
-            if not start_time:
-                return None
+            if calendars:
+                selected = self._select_calendars(
+                    server_config,
+                    [(calendar, self._calendar_label(calendar)) for calendar in calendars]
+                )
+                logger.info(
+                    f"成功连接日历源: {server_config['name']} "
+                    f"(共 {len(calendars)} 个日历，同步 {len(selected)} 个)"
+                )
+                return self._build_sources(server_config, client, selected)
+            logger.warning(f"日历源 {server_config['name']} 没有找到日历")
                 
-            start_time_str = start_time.dt.isoformat()
-            end_time_str = end_time.dt.isoformat() if end_time else start_time_str
-            
-            # 其他信息
-            location = str(ical_event.get('location', '未指定'))
-            description = str(ical_event.get('description', ''))
-            organizer = str(ical_event.get('organizer', ''))
-            status = str(ical_event.get('status', 'confirmed'))
-            
-            # 参与者
-            attendees = []
-            for attendee in ical_event.get('attendee', []):
-                if hasattr(attendee, 'params') and 'CN' in attendee.params:
-                    attendees.append({
-                        'email': str(attendee),
-                        'name': attendee.params['CN']
-                    })
-                else:
-                    attendees.append(str(attendee))
-            
-            # 分类
-            categories = []
-            for category in ical_event.get('categories', []):
-                if hasattr(category, 'cats'):
-                    categories.extend(category.cats)
-                else:
-                    categories.append(str(category))
-            
-            return {
-                'uid': uid,
-                'title': title,
-                'start_time': start_time_str,
-                'end_time': end_time_str,
-                'location': location,
-                'description': description,
-                'source_calendar': source_name,
-                'source_event_id': uid,
-                'created_time': datetime.now().isoformat(),
-                'organizer': organizer,
-                'status': status,
-                'categories': categories,
-                'attendees': attendees,
-                'metadata': {
-                    'original_calendar': source_name,
-                    'parsed_time': datetime.now().isoformat(),
-                    'recurrence': bool(ical_event.get('rrule'))
-                }
-            }
-            
         except Exception as e:
-            logger.error(f"解析 iCal 事件失败: {e}")
-            return None
+            logger.error(f"连接日历源失败 {server_config['name']}: {e}")
+        return []
     
-    def merge_all_events(self) -> bool:
-        """合并所有日历源的事件"""
-        all_events = []
-        sync_start = datetime.now()
-        
+    def _rediscover(self, source: Dict):
+        """缓存的日历地址失效时重新发现，下次同步使用新地址"""
+        discovered = self._discover_sources(source['config'])
+        source.pop('from_cache', None)
+        match = next((item for item in discovered if item['name'] == source['name']), None)
+        if match is None:
+            return
+        if str(match['calendar'].url) != str(source['calendar'].url):
+            self.syncer.reset(source['name'])
+            self._chunk_cache.pop(source['name'], None)
+        source['client'] = match['client']
+        source['calendar'] = match['calendar']
+        self._save_source_cache()
+    
+    def _load_source_cache(self) -> Dict[str, Dict]:
+        """读取日历地址缓存"""
+        path = Config.SOURCE_CACHE_PATH
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"读取日历地址缓存失败: {e}")
+            return {}
+    
+    def _save_source_cache(self):
+        """原子地写入日历地址缓存（按账号保存，不包含密码）"""
+        cache: Dict[str, Dict] = {}
         for source in self.source_calendars:
+            config = source['config']
+            account = cache.setdefault(source['account'], {
+                'url': config['url'],
+                'username': config['username'],
+                'selection': self._calendar_selection(config),
+                'calendars': []
+            })
+            account['calendars'].append({
+                'url': str(source['calendar'].url),
+                'name': source['calendar_name']
+            })
+        try:
+            tmp_path = f"{Config.SOURCE_CACHE_PATH}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, Config.SOURCE_CACHE_PATH)
+        except Exception as e:
+            logger.error(f"写入日历地址缓存失败: {e}")
+    
+    def fetch_events_from_source(self, source: Dict, days: Optional[int] = None) -> List[Dict]:
+        """从单个日历源获取事件（days 为 None 时使用配置的同步范围）"""
+        try:
+            events, _ = self._fetch_source_events(source, days)
+            return events
+        except Exception as e:
+            logger.error(f"从 {source['name']} 获取事件失败: {e}")
+            return []
+    
+    @staticmethod
+    def _sync_window(days: Optional[int] = None) -> Tuple[int, int, int]:
+        """同步时间范围，返回 (开始, 结束, 分块大小) 时间戳
+        
+        范围按分块大小对齐到固定边界，使过去的分块在多次同步间保持不变，可以复用结果。
+        days 不为 None 时只同步从现在起 days 天内的事件。
+        """
+        now = time.time()
+        past_days = Config.SYNC_PAST_DAYS if days is None else 0
+        future_days = Config.SYNC_FUTURE_DAYS if days is None else days
+        chunk = max(int(Config.SYNC_CHUNK_DAYS * 86400), 3600)
+        start = int((now - past_days * 86400) // chunk * chunk)
+        end = int(-(-(now + future_days * 86400) // chunk) * chunk)
+        return start, max(end, start + chunk), chunk
+    
+    def _fetch_source_events(self, source: Dict, days: Optional[int] = None) -> Tuple[List[Dict], Dict]:
+        """从单个日历源获取事件，返回 (事件, 同步范围)，获取失败时抛出异常
+        
+        同步范围描述本次结果覆盖的时间窗口 (start/end 时间戳)、是否包含全部重复事件
+        (recurring) 以及结果是否完整 (complete)，供标记-清除删除判断哪些事件已在上游删除。
+        """
+        start, end, chunk = self._sync_window(days)
+        start_date = datetime.fromtimestamp(start)
+        end_date = datetime.fromtimestamp(end)
+        scope = {
+            'start': start,
+            'end': end,
+            'recurring': False,
+            'complete': True
+        }
+        
+        # 增量同步：只下载变更的对象，未变化的事件直接使用缓存的解析结果
+        if Config.SYNC_INCREMENTAL and not source.get('incremental_unsupported'):
             try:
-                events = self.fetch_events_from_source(source)
-                all_events.extend(events)
-                logger.info(f"从 {source['name']} 合并了 {len(events)} 个事件")
+                source_events, complete = self.syncer.fetch(source)
+                events = [
+                    event for event in source_events
+                    if self._in_window(event, start_date, end_date)
+                ]
+                # 增量同步掌握集合内的全部对象，重复事件始终保留
+                scope['recurring'] = True
+                scope['complete'] = complete
+                logger.info(f"从 {source['name']} 获取到 {len(events)} 个事件")
+                return events, scope
+            except SyncNotSupported as e:
+                logger.warning(f"{source['name']} 不支持增量同步，改用全量搜索: {e}")
+                source['incremental_unsupported'] = True
+        
+        events, scope['complete'] = self._search_chunks(source, start, end, chunk)
+        logger.info(f"从 {source['name']} 获取到 {len(events)} 个事件")
+        return events, scope
+    
+    def _search_chunks(self, source: Dict, start: int, end: int, chunk: int) -> Tuple[List[Dict], bool]:
+        """分块并发搜索时间范围内的事件，返回 (按 UID 去重的事件, 是否完整)
+        
+        完全位于过去的分块在 SYNC_PAST_CHUNK_REFRESH 内复用上次的结果。失败的分块
+        使用上次的结果（没有时为空）并将结果标记为不完整，全部分块失败时抛出异常。
+        """
+        now = time.time()
+        chunks = [(chunk_start, min(chunk_start + chunk, end)) for chunk_start in range(start, end, chunk)]
+        cache = self._chunk_cache.setdefault(source['name'], {})
+        
+        results: Dict[Tuple[int, int], Tuple[List[Dict], bool]] = {}
+        pending = []
+        for key in chunks:
+            cached = cache.get(key)
+            if cached and key[1] <= now and now - cached['fetched'] < Config.SYNC_PAST_CHUNK_REFRESH:
+                results[key] = (cached['events'], True)
+            else:
+                pending.append(key)
+        
+        errors = []
+        if pending:
+            with ThreadPoolExecutor(
+                max_workers=max(1, min(Config.SYNC_CHUNK_WORKERS, len(pending))),
+                thread_name_prefix='caldav-chunk'
+            ) as executor:
+                futures = {executor.submit(self._search_chunk, source, *key): key for key in pending}
+                for future, key in futures.items():
+                    try:
+                        events, complete = future.result()
+                    except Exception as e:
+                        logger.error(
+                            f"搜索 {source['name']} 的分块 "
+                            f"{datetime.fromtimestamp(key[0]).date()} ~ {datetime.fromtimestamp(key[1]).date()} 失败: {e}"
+                        )
+                        errors.append(e)
+                        cached = cache.get(key)
+                        results[key] = (cached['events'] if cached else [], False)
+                        continue
+                    results[key] = (events, complete)
+                    if complete:
+                        cache[key] = {'fetched': now, 'events': events}
+        
+        if len(errors) == len(chunks):
+            raise errors[0]
+        
+        # 同步范围移动后不再使用的分块
+        for key in set(cache) - set(chunks):
+            del cache[key]
+        
+        # 跨越分块边界的事件和重复事件会出现在多个分块中
+        merged: Dict[str, Dict] = {}
+        complete = True
+        for key in chunks:
+            events, chunk_complete = results[key]
+            complete = complete and chunk_complete
+            for event in events:
+                merged.setdefault(event['uid'], event)
+        return list(merged.values()), complete
+    
+    def _search_chunk(self, source: Dict, start: int, end: int) -> Tuple[List[Dict], bool]:
+        """搜索单个分块内的事件，返回 (事件, 是否全部解析成功)"""
+        caldav_events = source['calendar'].search(
+            start=datetime.fromtimestamp(start),
+            end=datetime.fromtimestamp(end),
+            event=True
+        )
+        
+        payloads = []
+        complete = True
+        for caldav_event in caldav_events:
+            try:
+                data = caldav_event.data
             except Exception as e:
-                logger.error(f"合并 {source['name']} 事件失败: {e}")
+                logger.error(f"读取事件数据失败: {e}")
+                complete = False
                 continue
+            if data:
+                payloads.append(data)
+        
+        # 转换为统一格式（重复事件的例外实例合并到主事件）
+        events = []
+        for parsed in self._parse_many(payloads, source['name']):
+            if parsed is None:
+                complete = False
+                continue
+            events.extend(parsed)
+        return events, complete
+    
+    def _origin(self, source_name: str) -> Dict[str, str]:
+        """日历源所属的账号与日历名"""
+        return self._origins.get(source_name, {'account': source_name, 'calendar': source_name})
+    
+    @PARSE_SECONDS.timed(mode='object')
+    def _parse_calendar_data(self, data: str, source_name: str) -> List[Dict]:
+        """解析 CalDAV 对象的原始 VCALENDAR 数据"""
+        return parse_calendar_data(data, source_name, self._origin(source_name), Config.PARSE_FAST_PATH)
+    
+    @PARSE_SECONDS.timed(mode='batch')
+    def _parse_many(self, payloads: List[str], source_name: str) -> List[Optional[List[Dict]]]:
+        """解析同一日历源的多个对象（对象较多时交给解析进程池），无法解析的对象为 None"""
+        origin = self._origin(source_name)
+        return self.parser.parse([(data, source_name, origin) for data in payloads])
+    
+    @staticmethod
+    def _in_window(event: Dict, start_date: datetime, end_date: datetime) -> bool:
+        """判断事件是否落在同步时间窗口内（重复事件始终保留）"""
+        metadata = event.get('metadata', {})
+        if metadata.get('recurrence') or metadata.get('rdate'):
+            return True
+        start = event.get('start_epoch', iso_to_epoch(event.get('start_time')))
+        end = event.get('end_epoch', iso_to_epoch(event.get('end_time')))
+        if start is None or end is None:
+            return True
+        return end >= start_date.timestamp() and start <= end_date.timestamp()
+    
+    def close(self):
+        """释放解析进程池"""
+        self.parser.close()
+    
+    def merge_all_events(self) -> bool:
+        """合并所有日历源的事件"""
+        return self.sync_sources(list(self.source_calendars))
+    
+    def sync_sources(self, sources: List[Dict], progress: Optional[Callable] = None) -> bool:
+        """获取给定日历源的事件，并与其他源最近一次的结果合并保存"""
+        sync_start = time.monotonic()
+        results = self._fetch_all_sources(sources, progress)
+        return self.apply_results(sources, results, sync_start)
+    
+    def apply_results(self, sources: List[Dict], results: List[Tuple],
+                      sync_start: Optional[float] = None) -> bool:
+        """合并保存日历源的获取结果
+        
+        每个源最近一次成功获取的事件保存在内存中，只同步部分源时其余源沿用上次结果，
+        跨源去重始终基于全部日历源进行。失败的源保留上次结果，且不做删除检测。
+        """
+        if sync_start is None:
+            sync_start = time.monotonic()
         
+        with self._apply_lock:
+            source_total = 0.0
+            for source, (events, duration, scope) in zip(sources, results):
+                source_total += duration
+                if scope is not None:
+                    self._source_events[source['name']] = events
+                logger.info(f"从 {source['name']} 合并了 {len(events)} 个事件, 耗时 {duration:.2f}秒")
+            
+            # 按 source_calendars 顺序合并，保证结果与并发完成顺序无关
+            all_events = []
+            for source in self.source_calendars:
+                all_events.extend(self._source_events.get(source['name'], []))
+            
+            return self._save_merged(all_events, sources, results, sync_start, source_total)
+    
+    def _save_merged(self, all_events: List[Dict], sources: List[Dict], results: List[Tuple],
+                     sync_start: float, source_total: float) -> bool:
+        """去重并保存合并后的事件，更新 ICS 快照"""
         # 去重处理
-        unique_events = self._remove_duplicates(all_events)
+        with DEDUP_SECONDS.time():
+            unique_events = self._remove_duplicates(all_events)
+            if Config.DEDUP_CROSS_SOURCE:
+                unique_events = self.deduplicator.deduplicate(unique_events)
+                merged_away = self._merged_by_absent_sources()
+                if merged_away:
+                    unique_events = [event for event in unique_events if event['uid'] not in merged_away]
         
-        # 保存到存储
-        if self.storage.save_events(unique_events):
-            sync_duration = (datetime.now() - sync_start).total_seconds()
-            logger.info(f"同步完成: 共 {len(unique_events)} 个事件, 耗时 {sync_duration:.2f}秒")
+        # 保存到存储（只写入有变化的事件）
+        stats = self.storage.upsert_events(unique_events)
+        if not unique_events or stats['failed'] < len(unique_events):
+            # 被去重合并到其他事件的重复事件可能在之前的同步中已保存，需要软删除
+            kept = {event['uid'] for event in unique_events}
+            folded = sorted({event['uid'] for event in all_events} - kept)
+            deleted = self.storage.delete_events(folded)
+            
+            # 标记-清除：上游已删除的事件软删除
+            deleted += self._sweep_deleted(sources, results)
+            
+            # 数据有变化时重新渲染 ICS 快照，未变化时继续使用原快照与 ETag
+            if stats['inserted'] or stats['updated'] or deleted or self.ics_cache.get() is None:
+                self.refresh_icalendar()
+            
+            sync_duration = time.monotonic() - sync_start
+            logger.info(
+                f"同步完成: 共 {len(unique_events)} 个事件 "
+                f"(新增 {stats['inserted']}, 更新 {stats['updated']}, 未变化 {stats['unchanged']}, "
+                f"删除 {deleted}), "
+                f"耗时 {sync_duration:.2f}秒 (各源累计 {source_total:.2f}秒)"
+            )
             return True
         else:
             logger.error("保存合并后的事件失败")
             return False
     
+    def _merged_by_absent_sources(self) -> Set[str]:
+        """已保存的事件中，被本进程尚未成功获取过的日历源合并掉的重复事件 UID
+        
+        这些源（如启动时获取失败）没有事件参与本次去重，其保留事件的 merged_from
+        中记录的重复事件不应被重新写入。
+        """
+        absent = [source['name'] for source in self.source_calendars
+                  if source['name'] not in self._source_events]
+        if not absent:
+            return set()
+        
+        merged_away = set()
+        for event in self.storage.iter_feed_events(sources=absent):
+            for item in (event.get('metadata') or {}).get('merged_from', []):
+                merged_away.add(item.get('uid'))
+        return merged_away
+    
+    def _sweep_deleted(self, sources: List[Dict], results: List[Tuple]) -> int:
+        """软删除各日历源在同步范围内本次未出现的事件，返回删除数量
+        
+        获取失败、超时或结果不完整的源不做清除。一次清除超过 SYNC_SWEEP_MAX_FRACTION
+        的事件时视为可疑，需要连续两次同步得到相同结果才执行。
+        """
+        if not Config.SYNC_SWEEP:
+            return 0
+        
+        deleted = 0
+        for source, (events, _, scope) in zip(sources, results):
+            name = source['name']
+            if scope is None or not scope['complete']:
+                logger.warning(f"{name} 本次获取失败或不完整，跳过删除检测")
+                continue
+            
+            # 窗口两端各收缩一段余量，避免服务器与本地对全天/浮动时间的理解差异误删边界事件
+            result = self.storage.sweep_events(
+                name,
+                {event['uid'] for event in events},
+                scope['start'] + SWEEP_MARGIN,
+                scope['end'] - SWEEP_MARGIN,
+                include_recurring=scope['recurring'],
+                max_fraction=1.0 if self._sweep_pending.get(name) else Config.SYNC_SWEEP_MAX_FRACTION,
+                min_guarded=Config.SYNC_SWEEP_MIN_GUARDED
+            )
+            
+            if result['blocked']:
+                self._sweep_pending[name] = True
+                logger.warning(
+                    f"{name} 有 {result['candidates']}/{result['total']} 个事件未出现在本次同步中，"
+                    f"超过安全阈值，下次同步确认后再删除"
+                )
+                continue
+            
+            self._sweep_pending.pop(name, None)
+            if result['deleted']:
+                logger.info(f"{name} 已删除 {result['deleted']} 个上游不存在的事件")
+            deleted += result['deleted']
+        
+        return deleted
+    
+    def fetch_source(self, source: Dict) -> Tuple[List[Dict], float, Optional[Dict]]:
+        """获取单个日历源的事件，返回 (事件, 耗时, 同步范围)，失败时同步范围为 None"""
+        started = time.monotonic()
+        # 同一日历源同一时间只有一个请求（定时调度与手动同步可能同时获取同一源）
+        lock = self._fetch_locks.setdefault(source['name'], threading.Lock())
+        with lock:
+            try:
+                events, scope = self._fetch_source_events(source)
+            except Exception as e:
+                logger.error(f"从 {source['name']} 获取事件失败: {e}")
+                events, scope = [], None
+                if source.get('from_cache'):
+                    self._rediscover(source)
+        
+        duration = time.monotonic() - started
+        SOURCE_FETCH_SECONDS.observe(duration, source=source['name'])
+        if scope is None:
+            SOURCE_ERRORS.inc(source=source['name'], kind='failed')
+        else:
+            SOURCE_EVENTS.set(len(events), source=source['name'])
+            if not scope['complete']:
+                SOURCE_ERRORS.inc(source=source['name'], kind='partial')
+        return events, duration, scope
+    
+    def _fetch_all_sources(self, sources: List[Dict],
+                           progress: Optional[Callable] = None) -> List[Tuple[List[Dict], float, Optional[Dict]]]:
+        """获取给定日历源的事件，结果顺序与 sources 一致
+        
+        progress(source, status, result) 在每个源开始 ('running')、完成 ('done')
+        或超时 ('timeout') 时调用。
+        """
+        timeout = Config.SYNC_SOURCE_TIMEOUT
+        results: List[Tuple[List[Dict], float, Optional[Dict]]] = [([], 0.0, None)] * len(sources)
+        started_at: Dict[int, float] = {}
+        
+        def run(index: int) -> Tuple[List[Dict], float, Optional[Dict]]:
+            started_at[index] = time.monotonic()
+            if progress:
+                progress(sources[index], 'running', None)
+            result = self.fetch_source(sources[index])
+            if progress:
+                progress(sources[index], 'done', result)
+            return result
+        
+        def timed_out(index: int, elapsed: float):
+            logger.error(f"获取 {sources[index]['name']} 事件超时 ({timeout}秒)，本次同步跳过该源")
+            results[index] = ([], elapsed, None)
+            SOURCE_ERRORS.inc(source=sources[index]['name'], kind='timeout')
+            if progress:
+                progress(sources[index], 'timeout', results[index])
+        
+        if not Config.SYNC_CONCURRENT or len(sources) <= 1:
+            # 串行获取时每个源也在单独的线程中执行，以便同样应用超时；超时的线程不等待其结束
+            for index in range(len(sources)):
+                executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='caldav-fetch')
+                try:
+                    results[index] = executor.submit(run, index).result(timeout=timeout)
+                except FutureTimeoutError:
+                    timed_out(index, time.monotonic() - started_at.get(index, time.monotonic()))
+                finally:
+                    executor.shutdown(wait=False)
+            return results
+        
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, min(Config.SYNC_MAX_WORKERS, len(sources))),
+            thread_name_prefix='caldav-fetch'
+        )
+        try:
+            pending = {executor.submit(run, index): index for index in range(len(sources))}
+            while pending:
+                done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    results[index] = future.result()
+                
+                # 超时只从该源真正开始执行时计算，排队等待的时间不计入
+                now = time.monotonic()
+                for future, index in list(pending.items()):
+                    started = started_at.get(index)
+                    if started is not None and now - started > timeout:
+                        del pending[future]
+                        timed_out(index, now - started)
+        finally:
+            # 超时的线程无法强制终止，不等待其结束
+            executor.shutdown(wait=False)
+        
+        return results
+    
     def _remove_duplicates(self, events: List[Dict]) -> List[Dict]:
         """基于关键信息去重"""
         seen = set()
@@ -199,41 +678,66 @@ class CalendarMerger:
         logger.info(f"去重后剩余 {len(unique_events)} 个事件 (原 {len(events)} 个)")
         return unique_events
     
+    def get_icalendar_snapshot(self) -> Dict[str, Any]:
+        """获取当前同步版本的 ICS 快照，尚未渲染时立即渲染"""
+        snapshot = self.ics_cache.get()
+        if snapshot is None:
+            snapshot = self.refresh_icalendar()
+        return snapshot
+    
+    def refresh_icalendar(self) -> Optional[Dict[str, Any]]:
+        """重新渲染 ICS 并更新缓存"""
+        try:
+            with ICS_RENDER_SECONDS.time(feed='full'):
+                ical_data = self.generate_icalendar()
+            return self.ics_cache.update(ical_data)
+        except Exception as e:
+            logger.error(f"渲染 ICS 失败: {e}")
+            return self.ics_cache.get()
+    
     def generate_icalendar(self) -> str:
         """生成 iCalendar 格式数据"""
-        events = self.storage.load_events()
-        
-        # 创建日历
-        calendar = Calendar()
-        calendar.add('prodid', '-//Calendar Merger//example.com//')
-        calendar.add('version', '2.0')
-        calendar.add('x-wr-calname', '整合日历')
-        calendar.add('x-wr-caldesc', '多个日历源整合')
-        calendar.add('x-wr-timezone', 'Asia/Shanghai')
-        
-        # 添加事件
-        for event_data in events:
-            event = Event()
-            event.add('uid', event_data['uid'])
-            event.add('summary', event_data['title'])
-            event.add('dtstart', datetime.fromisoformat(event_data['start_time']))
-            event.add('dtend', datetime.fromisoformat(event_data['end_time']))
-            
-            if event_data['location'] and event_data['location'] != '未指定':
-                event.add('location', event_data['location'])
-            
-            if event_data['description']:
-                event.add('description', event_data['description'])
-            
-            event.add('status', event_data.get('status', 'CONFIRMED'))
-            
-            # 添加分类
-            if event_data['categories']:
-                event.add('categories', event_data['categories'])
-            
-            # 添加来源信息
-            event.add('x-source-calendar', event_data['source_calendar'])
-            
-            calendar.add_component(event)
+        return ''.join(self.iter_icalendar())
+    
+    def iter_icalendar(self) -> Iterator[str]:
+        """流式生成 iCalendar 数据，按游标逐批读取存储中的事件"""
+        return iter_icalendar(self.storage.iter_events())
+    
+    def get_feed_snapshot(self, sources: Optional[List[str]] = None,
+                          categories: Optional[List[str]] = None,
+                          past_days: Optional[int] = None,
+                          future_days: Optional[int] = None) -> Dict[str, Any]:
+        """筛选后的 ICS 快照，按筛选条件与同步版本缓存"""
+        sources, categories, past_days, future_days = key = feed_filter(
+            sources, categories, past_days, future_days
+        )
+        today = date.today()
+        if past_days is not None or future_days is not None:
+            # 滚动窗口每天变化，日期也是缓存键的一部分
+            key += (today.isoformat(),)
+        start_epoch, end_epoch = feed_window(past_days, future_days, today)
+        
+        @ICS_RENDER_SECONDS.timed(feed='filtered')
+        def render() -> str:
+            events = self.storage.iter_feed_events(list(sources), list(categories), start_epoch, end_epoch)
+            return ''.join(iter_icalendar(events))
+        
+        snapshot = self.ics_cache.get()
+        return self.feed_cache.get_or_render(
+            self.ics_cache.generation,
+            key,
+            render,
+            snapshot['last_modified'] if snapshot else None
+        )
+    
+    def stream_icalendar(self) -> Iterator[str]:
+        """流式输出 iCalendar 数据，输出完成后写入 ICS 缓存
         
-        return calendar.to_ical().decode('utf-8')
\ No newline at end of file
+        输出期间同步已刷新快照时不写入，避免旧数据覆盖新快照。
+        """
+        generation = self.ics_cache.generation
+        chunks = []
+        for chunk in self.iter_icalendar():
+            chunks.append(chunk)
+            yield chunk
+        self.ics_cache.update(''.join(chunks), expected_generation=generation)
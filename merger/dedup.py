@@ -0,0 +1,205 @@
+import logging
+import unicodedata
+from difflib import SequenceMatcher
+from typing import List, Dict, Set, Tuple, Iterator, Optional
+
+from storage.base import iso_to_epoch
+
+logger = logging.getLogger(__name__)
+
+# 单个分块内每个事件最多比较的候选数，避免大量同名同时段事件退化为平方复杂度
+MAX_BLOCK_CANDIDATES = 100
+
+# 每个事件参与分块的参与者数量上限
+MAX_PARTICIPANT_KEYS = 20
+
+
+def normalize_title(title: str) -> str:
+    """标题归一化：全半角统一、忽略大小写，只保留字母数字（含中文）"""
+    title = unicodedata.normalize('NFKC', title or '').casefold()
+    return ''.join(ch for ch in title if ch.isalnum())
+
+
+def _participants(event: Dict) -> Set[str]:
+    """组织者与参与者的邮箱集合"""
+    values = [event.get('organizer') or '']
+    for attendee in event.get('attendees', []):
+        values.append(attendee.get('email', '') if isinstance(attendee, dict) else str(attendee))
+
+    emails = set()
+    for value in values:
+        value = value.strip().lower()
+        if value.startswith('mailto:'):
+            value = value[len('mailto:'):]
+        if value:
+            emails.add(value)
+    return emails
+
+
+class CrossSourceDeduplicator:
+    """跨日历源的模糊去重
+
+    同一会议被邀请到多个账号时，各源中的事件标题、地点可能略有差异。
+    按 UID 以及 (时间分桶, 标题首尾) / (时间分桶, 参与者) 分块生成候选对，
+    只在候选对之间比较标题相似度、时间差与参与者重合度，整体接近线性。
+    被合并的事件记录在保留事件的 metadata['merged_from'] 中。
+    """
+
+    def __init__(self, time_tolerance: int = 300, title_similarity: float = 0.85,
+                 participant_overlap: float = 0.5):
+        self.time_tolerance = max(int(time_tolerance), 0)
+        self.title_similarity = title_similarity
+        self.participant_overlap = participant_overlap
+        # 分桶宽度不小于容差，相邻桶即可覆盖容差范围内的全部事件
+        self.bucket_size = max(self.time_tolerance, 60)
+
+    def deduplicate(self, events: List[Dict]) -> List[Dict]:
+        """合并跨源重复事件，保留每组中最先出现的事件"""
+        if len(events) < 2:
+            return list(events)
+
+        features = [self._features(event) for event in events]
+        parent = list(range(len(events)))
+
+        def find(index: int) -> int:
+            while parent[index] != index:
+                parent[index] = parent[parent[index]]
+                index = parent[index]
+            return index
+
+        # 每组包含的来源：同一来源的两个事件即使经由其他来源间接相似也不合并
+        sources = [{feature['source']} for feature in features]
+
+        blocks = self._build_blocks(features)
+        compared: Set[Tuple[int, int]] = set()
+        for index, feature in enumerate(features):
+            for key in self._probe_keys(feature):
+                for other in blocks.get(key, [])[:MAX_BLOCK_CANDIDATES]:
+                    if other == index:
+                        continue
+                    pair = (index, other) if index < other else (other, index)
+                    if pair in compared:
+                        continue
+                    compared.add(pair)
+                    if self._is_duplicate(feature, features[other]):
+                        root_a, root_b = find(index), find(other)
+                        if root_a == root_b or sources[root_a] & sources[root_b]:
+                            continue
+                        # 以列表中靠前的事件为代表
+                        root, child = min(root_a, root_b), max(root_a, root_b)
+                        parent[child] = root
+                        sources[root] |= sources[child]
+
+        groups: Dict[int, List[int]] = {}
+        for index in range(len(events)):
+            groups.setdefault(find(index), []).append(index)
+
+        result = []
+        for index, event in enumerate(events):
+            members = groups.get(index)
+            if members is None:
+                continue
+            if len(members) == 1:
+                result.append(event)
+                continue
+            result.append(self._fold(event, [events[member] for member in members[1:]]))
+
+        merged = len(events) - len(result)
+        if merged:
+            logger.info(f"跨源去重合并了 {merged} 个事件 (比较 {len(compared)} 对候选)")
+        return result
+
+    def _features(self, event: Dict) -> Dict:
+        """提取比较所需的特征"""
+        return {
+            'uid': event.get('uid'),
+            'source': event.get('source_calendar', ''),
+            'title': normalize_title(event.get('title', '')),
+            'start': event.get('start_epoch', iso_to_epoch(event.get('start_time'))),
+            'end': event.get('end_epoch', iso_to_epoch(event.get('end_time'))),
+            'participants': _participants(event)
+        }
+
+    def _bucket(self, feature: Dict) -> int:
+        """事件开始时间所在的时间桶"""
+        return feature['start'] // self.bucket_size
+
+    def _keys(self, feature: Dict, bucket: int) -> Iterator[tuple]:
+        """事件在指定时间桶中的分块键"""
+        # 标题首尾各取一段，只在前缀或后缀不同的标题仍能进入同一分块
+        yield ('title', bucket, feature['title'][:4])
+        yield ('title_end', bucket, feature['title'][-4:])
+        for email in sorted(feature['participants'])[:MAX_PARTICIPANT_KEYS]:
+            yield ('participant', bucket, email)
+
+    def _build_blocks(self, features: List[Dict]) -> Dict[tuple, List[int]]:
+        """按 UID 与事件所在时间桶建立分块"""
+        blocks: Dict[tuple, List[int]] = {}
+        for index, feature in enumerate(features):
+            if feature['uid']:
+                blocks.setdefault(('uid', feature['uid']), []).append(index)
+            if feature['start'] is None:
+                continue
+            for key in self._keys(feature, self._bucket(feature)):
+                blocks.setdefault(key, []).append(index)
+        return blocks
+
+    def _probe_keys(self, feature: Dict) -> Iterator[tuple]:
+        """查找候选时使用的分块键（包含相邻时间桶）"""
+        if feature['uid']:
+            yield ('uid', feature['uid'])
+        if feature['start'] is None:
+            return
+        bucket = self._bucket(feature)
+        for offset in (-1, 0, 1):
+            yield from self._keys(feature, bucket + offset)
+
+    def _is_duplicate(self, a: Dict, b: Dict) -> bool:
+        """判断两个不同来源的事件是否为同一事件"""
+        if a['source'] == b['source']:
+            return False
+        if a['start'] is None or b['start'] is None:
+            return False
+        if abs(a['start'] - b['start']) > self.time_tolerance:
+            return False
+        if a['end'] is not None and b['end'] is not None \
+                and abs(a['end'] - b['end']) > self.time_tolerance:
+            return False
+
+        # 邀请到多个账号的同一会议通常保留相同的 UID
+        if a['uid'] and a['uid'] == b['uid']:
+            return True
+
+        if a['participants'] and b['participants']:
+            overlap = len(a['participants'] & b['participants']) / len(a['participants'] | b['participants'])
+            if overlap < self.participant_overlap:
+                return False
+
+        return self._similar_titles(a['title'], b['title'])
+
+    def _similar_titles(self, a: str, b: str) -> bool:
+        """归一化标题的相似度是否达到阈值（先用上界快速排除）"""
+        if a == b:
+            return True
+        if not a or not b:
+            return False
+        matcher = SequenceMatcher(None, a, b)
+        if matcher.real_quick_ratio() < self.title_similarity:
+            return False
+        if matcher.quick_ratio() < self.title_similarity:
+            return False
+        return matcher.ratio() >= self.title_similarity
+
+    @staticmethod
+    def _fold(primary: Dict, duplicates: List[Dict]) -> Dict:
+        """生成保留事件的副本，记录被合并的源事件（不修改增量同步缓存中的原对象）"""
+        metadata = dict(primary.get('metadata') or {})
+        metadata['merged_from'] = [
+            {
+                'source_calendar': duplicate.get('source_calendar'),
+                'uid': duplicate.get('uid'),
+                'title': duplicate.get('title')
+            }
+            for duplicate in duplicates
+        ]
+        return dict(primary, metadata=metadata)
@@ -0,0 +1,105 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Any, Callable, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def feed_filter(sources: Optional[List[str]] = None, categories: Optional[List[str]] = None,
+                past_days: Optional[int] = None, future_days: Optional[int] = None) -> Tuple:
+    """规范化筛选条件：日历源与分类去重排序，分类不区分大小写，空条件视为不筛选"""
+    return (
+        tuple(sorted({name.strip() for name in sources or [] if name.strip()})),
+        tuple(sorted({name.strip().lower() for name in categories or [] if name.strip()})),
+        past_days,
+        future_days
+    )
+
+
+def feed_window(past_days: Optional[int], future_days: Optional[int],
+                today: Optional[date] = None) -> Tuple[Optional[int], Optional[int]]:
+    """滚动窗口的 (起点, 终点) 时间戳，按本地日期整天对齐，未限制的一端为 None"""
+    today = today or date.today()
+    start = end = None
+    if past_days is not None:
+        start = int(datetime.combine(today - timedelta(days=past_days), time.min).timestamp())
+    if future_days is not None:
+        end = int(datetime.combine(today + timedelta(days=future_days + 1), time.min).timestamp()) - 1
+    return start, end
+
+
+class FeedCache:
+    """筛选订阅的 ICS 缓存
+
+    按 (同步版本, 规范化的筛选条件) 缓存渲染结果，超出容量时淘汰最久未使用的条目；
+    同步版本变化后旧版本的条目不会再命中，写入新条目时一并清除。
+    快照结构与 ICSCache 相同，压缩结果也随快照缓存。
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._render_lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[int, Hashable], Dict[str, Any]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get_or_render(self, generation: int, key: Hashable, render: Callable[[], str],
+                      last_modified: Optional[datetime] = None) -> Dict[str, Any]:
+        """返回缓存的快照，未命中时调用 render 渲染并缓存
+
+        渲染串行执行，同一筛选条件的并发请求只渲染一次。
+        """
+        cache_key = (generation, key)
+        snapshot = self._lookup(cache_key)
+        if snapshot is not None:
+            return snapshot
+
+        with self._render_lock:
+            snapshot = self._lookup(cache_key, count_miss=True)
+            if snapshot is not None:
+                return snapshot
+
+            body = render().encode('utf-8')
+            snapshot = {
+                'body': body,
+                'etag': hashlib.sha256(body).hexdigest()[:32],
+                'last_modified': last_modified or datetime.now(timezone.utc).replace(microsecond=0),
+                'generation': generation
+            }
+            with self._lock:
+                for stale in [k for k in self._entries if k[0] != generation]:
+                    del self._entries[stale]
+                self._entries[cache_key] = snapshot
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        logger.debug(f"已渲染筛选订阅 {key}: {len(body)} 字节")
+        return snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存条目数、容量与命中率"""
+        with self._lock:
+            requests = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': sum(len(snapshot['body']) for snapshot in self._entries.values()),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / requests, 4) if requests else None
+            }
+
+    def _lookup(self, cache_key: Tuple[int, Hashable], count_miss: bool = False) -> Optional[Dict[str, Any]]:
+        """查找条目并更新 LRU 顺序与命中计数"""
+        with self._lock:
+            snapshot = self._entries.get(cache_key)
+            if snapshot is not None:
+                self._entries.move_to_end(cache_key)
+                self._hits += 1
+            elif count_miss:
+                self._misses += 1
+            return snapshot
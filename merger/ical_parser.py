@@ -0,0 +1,520 @@
+import logging
+import multiprocessing
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timezone, tzinfo
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+from zoneinfo import ZoneInfo
+from icalendar import Calendar
+from icalendar.prop import vRecur
+from storage.base import iso_to_epoch
+
+logger = logging.getLogger(__name__)
+
+# 进程池任务：(VCALENDAR 原文, 日历源名称, 所属账号与日历)
+ParseItem = Tuple[str, str, Optional[Dict[str, str]]]
+
+
+def parse_payload(data: str, source_name: str, origin: Optional[Dict[str, str]] = None,
+                  fast: bool = False) -> Optional[List[Dict]]:
+    """解析 CalDAV 对象的原始 VCALENDAR 数据，无法解析时返回 None
+
+    fast 为 True 时先尝试逐行的快速解析，遇到不支持的内容再交给 icalendar。
+    """
+    if fast:
+        try:
+            components = fast_components(data)
+        except Exception as e:
+            logger.debug(f"快速解析不支持该对象，改用 icalendar: {e}")
+        else:
+            return parse_components(components, source_name, origin)
+
+    try:
+        calendar = Calendar.from_ical(data)
+    except Exception as e:
+        logger.error(f"解析日历数据失败: {e}")
+        return None
+
+    return parse_components(calendar.walk('VEVENT'), source_name, origin)
+
+
+def parse_calendar_data(data: str, source_name: str, origin: Optional[Dict[str, str]] = None,
+                        fast: bool = False) -> List[Dict]:
+    """解析 CalDAV 对象的原始 VCALENDAR 数据"""
+    return parse_payload(data, source_name, origin, fast) or []
+
+
+def parse_components(components: List, source_name: str,
+                     origin: Optional[Dict[str, str]] = None) -> List[Dict]:
+    """解析同一 CalDAV 对象中的 VEVENT
+
+    对象中带 RECURRENCE-ID 的 VEVENT 是重复事件的例外实例，记录到主事件的
+    metadata['overrides'] 中，由存储层展开实例时替换对应的实例。
+    """
+    if not components:
+        return []
+
+    master = next((c for c in components if c.get('recurrence-id') is None), None)
+    if master is None:
+        # 只收到例外实例（如只被邀请参加其中一次）时按普通事件处理
+        master = components[0]
+
+    event_data = parse_ical_event(master, source_name, origin)
+    if not event_data:
+        return []
+
+    if event_data['recurrence_rule'] or event_data['metadata'].get('rdate'):
+        overrides = []
+        for component in components:
+            if component is master or component.get('recurrence-id') is None:
+                continue
+            override = parse_override(component)
+            if override:
+                overrides.append(override)
+        if overrides:
+            event_data['metadata']['overrides'] = overrides
+
+    return [event_data]
+
+
+def parse_override(ical_event) -> Optional[Dict]:
+    """解析 RECURRENCE-ID 例外实例"""
+    try:
+        start_time = ical_event.get('dtstart')
+        end_time = ical_event.get('dtend')
+        if not start_time:
+            return None
+        override = {
+            'recurrence_id': ical_event.get('recurrence-id').dt.isoformat(),
+            'start_time': start_time.dt.isoformat(),
+            'end_time': end_time.dt.isoformat() if end_time else start_time.dt.isoformat()
+        }
+        for field, prop in (('title', 'summary'), ('location', 'location'),
+                            ('description', 'description'), ('status', 'status')):
+            if ical_event.get(prop) is not None:
+                override[field] = str(ical_event.get(prop))
+        return override
+    except Exception as e:
+        logger.error(f"解析例外实例失败: {e}")
+        return None
+
+
+def date_list(ical_event, name: str) -> List[str]:
+    """读取 EXDATE / RDATE 等日期列表属性（PERIOD 取开始时间）"""
+    prop = ical_event.get(name)
+    if prop is None:
+        return []
+    values = []
+    for item in (prop if isinstance(prop, list) else [prop]):
+        for value in getattr(item, 'dts', []):
+            dt = value.dt[0] if isinstance(value.dt, tuple) else value.dt
+            values.append(dt.isoformat())
+    return values
+
+
+def parse_ical_event(ical_event, source_name: str,
+                     origin: Optional[Dict[str, str]] = None) -> Optional[Dict]:
+    """解析 iCalendar 事件为统一格式"""
+    try:
+        # 基础信息
+        uid = str(ical_event.get('uid', ''))
+        if not uid:
+            uid = f"generated-{int(time.time())}-{hash(str(ical_event))}"
+
+        title = str(ical_event.get('summary', '未命名事件'))
+
+        # 时间处理
+        start_time = ical_event.get('dtstart')
+        end_time = ical_event.get('dtend')
+
+        if not start_time:
+            return None
+
+        start_time_str = start_time.dt.isoformat()
+        end_time_str = end_time.dt.isoformat() if end_time else start_time_str
+
+        # 其他信息
+        location = str(ical_event.get('location', '未指定'))
+        description = str(ical_event.get('description', ''))
+        organizer = str(ical_event.get('organizer', ''))
+        status = str(ical_event.get('status', 'confirmed'))
+
+        # 参与者（只有一个 ATTENDEE 时 icalendar 返回单个值而不是列表）
+        attendee_props = ical_event.get('attendee', [])
+        if not isinstance(attendee_props, list):
+            attendee_props = [attendee_props]
+        attendees = []
+        for attendee in attendee_props:
+            if hasattr(attendee, 'params') and 'CN' in attendee.params:
+                attendees.append({
+                    'email': str(attendee),
+                    'name': attendee.params['CN']
+                })
+            else:
+                attendees.append(str(attendee))
+
+        # 分类
+        categories = []
+        for category in ical_event.get('categories', []):
+            if hasattr(category, 'cats'):
+                categories.extend(category.cats)
+            else:
+                categories.append(str(category))
+
+        # 重复规则：RRULE 原文保存在 recurrence_rule，RDATE / EXDATE 与 DTSTART
+        # 的时区保存在 metadata 中，供存储层展开实例
+        rrule = ical_event.get('rrule')
+        if isinstance(rrule, list):
+            rrule = rrule[0] if rrule else None
+        recurrence_rule = rrule.to_ical().decode('utf-8') if rrule else None
+
+        metadata = {
+            'original_calendar': source_name,
+            **(origin or {'account': source_name, 'calendar': source_name}),
+            'parsed_time': datetime.now().isoformat(),
+            'recurrence': bool(rrule)
+        }
+        rdate = date_list(ical_event, 'rdate')
+        exdate = date_list(ical_event, 'exdate')
+        if recurrence_rule or rdate:
+            metadata['tzid'] = start_time.params.get('TZID')
+            metadata['rdate'] = rdate
+            metadata['exdate'] = exdate
+
+        return {
+            'uid': uid,
+            'title': title,
+            'start_time': start_time_str,
+            'end_time': end_time_str,
+            'start_epoch': iso_to_epoch(start_time_str),
+            'end_epoch': iso_to_epoch(end_time_str),
+            'location': location,
+            'description': description,
+            'source_calendar': source_name,
+            'source_event_id': uid,
+            'created_time': datetime.now().isoformat(),
+            'organizer': organizer,
+            'status': status,
+            'categories': categories,
+            'attendees': attendees,
+            'recurrence_rule': recurrence_rule,
+            'metadata': metadata
+        }
+
+    except Exception as e:
+        logger.error(f"解析 iCal 事件失败: {e}")
+        return None
+
+
+# 快速解析器读取的属性，其余属性（包括 VALARM 等子组件中的属性）直接跳过
+_TEXT_PROPERTIES = {'UID', 'SUMMARY', 'LOCATION', 'DESCRIPTION', 'STATUS'}
+_DATE_PROPERTIES = {'DTSTART', 'DTEND', 'RECURRENCE-ID'}
+_DATE_LIST_PROPERTIES = {'RDATE', 'EXDATE'}
+_ADDRESS_PROPERTIES = {'ORGANIZER', 'ATTENDEE'}
+_MULTI_PROPERTIES = {'ATTENDEE', 'CATEGORIES', 'RDATE', 'EXDATE'}
+_FAST_PROPERTIES = (_TEXT_PROPERTIES | _DATE_PROPERTIES | _DATE_LIST_PROPERTIES
+                    | _ADDRESS_PROPERTIES | {'CATEGORIES', 'RRULE'})
+
+_DATE_TIME = re.compile(r'(\d{4})(\d{2})(\d{2})T(\d{2})(\d{2})(\d{2})(Z?)$')
+_TEXT_ESCAPE = re.compile(r'\\([\\;,nN:])')
+
+
+class FastPathUnsupported(Exception):
+    """快速解析器无法处理的内容，需要交给 icalendar 解析"""
+    pass
+
+
+class _FastProperty(str):
+    """带参数的属性值（ORGANIZER / ATTENDEE）"""
+    params: Dict[str, str] = {}
+
+
+class _FastDate:
+    """日期或日期时间属性，与 icalendar 的 vDDDTypes 一样提供 dt 与 params"""
+
+    def __init__(self, dt, params: Dict[str, str]):
+        self.dt = dt
+        self.params = params
+
+
+class _FastDateList:
+    """RDATE / EXDATE 属性，与 icalendar 的 vDDDLists 一样提供 dts"""
+
+    def __init__(self, dts: List[_FastDate]):
+        self.dts = dts
+
+
+class _FastComponent:
+    """快速解析得到的 VEVENT，提供 parse_ical_event 用到的 get() 接口"""
+
+    def __init__(self):
+        self.properties: Dict[str, Any] = {}
+
+    def get(self, name: str, default=None):
+        return self.properties.get(name.upper(), default)
+
+
+def _unfold(data: str) -> Iterator[str]:
+    """逐行输出展开折行后的内容行（以空格或制表符开头的行接续上一行）"""
+    parts: List[str] = []
+    for line in data.split('\n'):
+        if line.endswith('\r'):
+            line = line[:-1]
+        if line[:1] in (' ', '\t'):
+            if not parts:
+                raise FastPathUnsupported('第一行不能是折行')
+            parts.append(line[1:])
+            continue
+        if parts:
+            yield ''.join(parts)
+        parts = [line]
+    if parts and parts[0]:
+        yield ''.join(parts)
+
+
+def _unescape_text(value: str) -> str:
+    """TEXT 值反转义：单次扫描替换转义序列，未定义的转义原样保留（与 icalendar 一致）"""
+    if '\\' not in value:
+        return value
+    return _TEXT_ESCAPE.sub(lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+
+def _split_text_list(value: str) -> List[str]:
+    """按未转义的逗号拆分多值 TEXT（如 CATEGORIES）"""
+    items = []
+    start = 0
+    index = 0
+    while index < len(value):
+        char = value[index]
+        if char == '\\':
+            index += 2
+            continue
+        if char == ',':
+            items.append(value[start:index])
+            start = index + 1
+        index += 1
+    items.append(value[start:])
+    return [_unescape_text(item) for item in items]
+
+
+def _split_line(line: str) -> Tuple[str, Dict[str, str], str]:
+    """拆分内容行为 (属性名, 参数, 值)，参数值去掉引号"""
+    length = len(line)
+    index = 0
+    while index < length and line[index] not in ';:':
+        index += 1
+    name = line[:index].upper()
+
+    params: Dict[str, str] = {}
+    while index < length and line[index] == ';':
+        equals = line.find('=', index + 1)
+        if equals < 0:
+            raise FastPathUnsupported(f'参数格式错误: {name}')
+        key = line[index + 1:equals].upper()
+        index = equals + 1
+        if index < length and line[index] == '"':
+            close = line.find('"', index + 1)
+            if close < 0:
+                raise FastPathUnsupported(f'参数引号未闭合: {name}')
+            value = line[index + 1:close]
+            index = close + 1
+        else:
+            start = index
+            while index < length and line[index] not in ';:,':
+                index += 1
+            value = line[start:index]
+        if index < length and line[index] == ',':
+            raise FastPathUnsupported(f'多值参数: {name};{key}')
+        if '^' in value:
+            raise FastPathUnsupported(f'参数值转义: {name};{key}')
+        params[key] = value
+
+    if index >= length or line[index] != ':':
+        raise FastPathUnsupported(f'内容行格式错误: {name}')
+    return name, params, line[index + 1:]
+
+
+@lru_cache(maxsize=256)
+def _zone(tzid: str) -> tzinfo:
+    """TZID 对应的 IANA 时区，无法识别（如自定义 VTIMEZONE）时交给 icalendar"""
+    try:
+        return ZoneInfo(tzid)
+    except Exception:
+        raise FastPathUnsupported(f'未知时区: {tzid}')
+
+
+def _fast_date_value(value: str, params: Dict[str, str]):
+    """解析 DATE / DATE-TIME 值（支持 UTC、TZID 与浮动时间）"""
+    kind = params.get('VALUE', '').upper()
+    if kind == 'DATE' or (not kind and len(value) == 8):
+        if len(value) != 8 or not value.isdigit():
+            raise FastPathUnsupported(f'日期格式错误: {value}')
+        return date(int(value[:4]), int(value[4:6]), int(value[6:]))
+    if kind not in ('', 'DATE-TIME'):
+        raise FastPathUnsupported(f'不支持的值类型: {kind}')
+
+    match = _DATE_TIME.match(value)
+    if match is None:
+        raise FastPathUnsupported(f'日期时间格式错误: {value}')
+    parsed = datetime(*(int(part) for part in match.groups()[:6]))
+    tzid = params.get('TZID')
+    if match.group(7):
+        if tzid:
+            raise FastPathUnsupported(f'UTC 时间带有 TZID: {value}')
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.replace(tzinfo=_zone(tzid)) if tzid else parsed
+
+
+def _add_property(component: _FastComponent, name: str, params: Dict[str, str], value: str):
+    """转换属性值并加入组件"""
+    if name in _TEXT_PROPERTIES:
+        converted: Any = _unescape_text(value)
+    elif name in _DATE_PROPERTIES:
+        converted = _FastDate(_fast_date_value(value, params), params)
+    elif name in _DATE_LIST_PROPERTIES:
+        if params.get('VALUE', '').upper() == 'PERIOD':
+            raise FastPathUnsupported(f'{name} 使用 PERIOD')
+        converted = _FastDateList([
+            _FastDate(_fast_date_value(item, params), params) for item in value.split(',')
+        ])
+    elif name in _ADDRESS_PROPERTIES:
+        converted = _FastProperty(value)
+        converted.params = params
+    elif name == 'CATEGORIES':
+        converted = _split_text_list(value)
+    else:
+        converted = vRecur.from_ical(value)
+
+    properties = component.properties
+    if name == 'CATEGORIES':
+        properties.setdefault(name, []).extend(converted)
+    elif name in _MULTI_PROPERTIES:
+        properties.setdefault(name, []).append(converted)
+    elif name in properties:
+        raise FastPathUnsupported(f'重复的属性: {name}')
+    else:
+        properties[name] = converted
+
+
+def fast_components(data: str) -> List[_FastComponent]:
+    """逐行提取 VCALENDAR 中的 VEVENT，只转换 parse_ical_event 用到的属性
+
+    处理折行、TEXT 转义、TZID（IANA 时区）、UTC、浮动时间与 VALUE=DATE；
+    遇到无法保证与 icalendar 结果一致的内容时抛出 FastPathUnsupported。
+    """
+    if not isinstance(data, str):
+        raise FastPathUnsupported('数据不是文本')
+
+    components: List[_FastComponent] = []
+    stack: List[str] = []
+    current: Optional[_FastComponent] = None
+    for line in _unfold(data):
+        if not line:
+            continue
+        end = len(line)
+        for separator in (';', ':'):
+            position = line.find(separator)
+            if 0 <= position < end:
+                end = position
+        name = line[:end].upper()
+
+        if name == 'BEGIN' or name == 'END':
+            component_name = line.partition(':')[2].strip().upper()
+            if name == 'BEGIN':
+                if not stack and component_name != 'VCALENDAR':
+                    raise FastPathUnsupported('不是 VCALENDAR 数据')
+                if component_name == 'VEVENT':
+                    if current is not None:
+                        raise FastPathUnsupported('VEVENT 嵌套')
+                    current = _FastComponent()
+                    components.append(current)
+                stack.append(component_name)
+            else:
+                if not stack or stack[-1] != component_name:
+                    raise FastPathUnsupported(f'组件未正确结束: {component_name}')
+                stack.pop()
+                if component_name == 'VEVENT':
+                    current = None
+            continue
+
+        if current is None or stack[-1] != 'VEVENT' or name not in _FAST_PROPERTIES:
+            continue
+        _add_property(current, *_split_line(line))
+
+    if stack or not components and 'BEGIN:VCALENDAR' not in data.upper():
+        raise FastPathUnsupported('VCALENDAR 数据不完整')
+    for component in components:
+        if not component.properties.get('UID'):
+            # 没有 UID 时 parse_ical_event 根据 icalendar 组件生成 UID
+            raise FastPathUnsupported('VEVENT 没有 UID')
+    return components
+
+
+def _parse_batch(items: List[ParseItem], fast: bool = False) -> List[Optional[List[Dict]]]:
+    """进程池中解析一批对象"""
+    return [parse_payload(data, source_name, origin, fast) for data, source_name, origin in items]
+
+
+class ParsePool:
+    """iCalendar 解析进程池
+
+    icalendar 解析是纯 CPU 计算，对象很多时在同步线程中串行解析只能用满一个核。
+    对象数达到 min_objects 时按 batch_size 分批交给进程池解析，进程只返回事件字典；
+    进程数为 0、对象较少或进程池出错时在当前线程串行解析。fast_path 为 True 时
+    使用快速解析器，不支持的对象交给 icalendar。
+    """
+
+    def __init__(self, processes: int = 0, batch_size: int = 200, min_objects: int = 500,
+                 fast_path: bool = False):
+        self.processes = max(int(processes or 0), 0)
+        self.batch_size = max(int(batch_size), 1)
+        self.min_objects = min_objects
+        self.fast_path = fast_path
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._disabled = False
+        self._lock = threading.Lock()
+
+    def parse(self, items: List[ParseItem]) -> List[Optional[List[Dict]]]:
+        """解析多个对象，结果与 items 一一对应，无法解析的对象为 None"""
+        if self.processes < 1 or self._disabled or len(items) < self.min_objects:
+            return _parse_batch(items, self.fast_path)
+
+        try:
+            executor = self._get_executor()
+            futures = [
+                executor.submit(_parse_batch, items[index:index + self.batch_size], self.fast_path)
+                for index in range(0, len(items), self.batch_size)
+            ]
+            results: List[Optional[List[Dict]]] = []
+            for future in futures:
+                results.extend(future.result())
+            return results
+        except Exception as e:
+            logger.error(f"解析进程池不可用，改为串行解析: {e}")
+            self._disabled = True
+            self.close()
+            return _parse_batch(items, self.fast_path)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """首次使用时创建进程池
+
+        同步在多线程中进行，fork 出的子进程可能继承被其他线程持有的锁，
+        因此优先使用 forkserver 启动进程。
+        """
+        with self._lock:
+            if self._executor is None:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+                logger.info(f"已启动 {self.processes} 个解析进程")
+            return self._executor
+
+    def close(self):
+        """关闭进程池"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
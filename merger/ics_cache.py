@@ -0,0 +1,109 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ICSCache:
+    """整合日历 ICS 缓存
+
+    每个同步版本 (generation) 只渲染一次 ICS，结果保存在内存并写入磁盘，
+    同时计算强 ETag 与 Last-Modified，供订阅端轮询时做条件请求。
+    """
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self.meta_path = f"{cache_path}.meta.json"
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._generation = 0
+        self._load()
+
+    @property
+    def generation(self) -> int:
+        """当前同步版本号"""
+        return self._generation
+
+    def get(self) -> Optional[Dict[str, Any]]:
+        """返回当前快照 (body, etag, last_modified, generation)，没有时返回 None"""
+        return self._snapshot
+
+    def update(self, ical_data: str, expected_generation: Optional[int] = None) -> Dict[str, Any]:
+        """保存新渲染的 ICS，内容与当前快照相同时保持原 ETag 与版本号
+
+        指定 expected_generation 时，只有版本号仍等于该值才写入；渲染期间已有更新的
+        快照时放弃写入并返回当前快照，避免较旧的渲染结果覆盖新快照。
+        """
+        body = ical_data.encode('utf-8')
+        etag = hashlib.sha256(body).hexdigest()[:32]
+
+        with self._lock:
+            current = self._snapshot
+            if expected_generation is not None and self._generation != expected_generation:
+                logger.debug(f"ICS 缓存已更新到版本 {self._generation}，丢弃基于版本 {expected_generation} 的渲染结果")
+                return current
+            if current is not None and current['etag'] == etag:
+                return current
+
+            self._generation += 1
+            snapshot = {
+                'body': body,
+                'etag': etag,
+                'last_modified': datetime.now(timezone.utc).replace(microsecond=0),
+                'generation': self._generation
+            }
+            self._snapshot = snapshot
+            self._save(snapshot)
+
+        logger.info(f"ICS 缓存已更新: 版本 {snapshot['generation']}, {len(body)} 字节")
+        return snapshot
+
+    def _load(self):
+        """从磁盘加载上次保存的快照"""
+        if not os.path.exists(self.cache_path) or not os.path.exists(self.meta_path):
+            return
+
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(self.cache_path, 'rb') as f:
+                body = f.read()
+
+            if hashlib.sha256(body).hexdigest()[:32] != meta.get('etag'):
+                logger.warning("ICS 缓存文件与元数据不一致，忽略磁盘缓存")
+                return
+
+            self._generation = int(meta.get('generation', 0))
+            self._snapshot = {
+                'body': body,
+                'etag': meta['etag'],
+                'last_modified': datetime.fromisoformat(meta['last_modified']),
+                'generation': self._generation
+            }
+            logger.info(f"已加载 ICS 缓存: 版本 {self._generation}")
+        except Exception as e:
+            logger.error(f"加载 ICS 缓存失败: {e}")
+
+    def _save(self, snapshot: Dict[str, Any]):
+        """原子地写入快照文件与元数据"""
+        try:
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(snapshot['body'])
+            os.replace(tmp_path, self.cache_path)
+
+            tmp_meta = f"{self.meta_path}.tmp"
+            with open(tmp_meta, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'etag': snapshot['etag'],
+                    'last_modified': snapshot['last_modified'].isoformat(),
+                    'generation': snapshot['generation']
+                }, f)
+            os.replace(tmp_meta, self.meta_path)
+        except Exception as e:
+            logger.error(f"写入 ICS 缓存失败: {e}")
@@ -0,0 +1,148 @@
+from icalendar import Calendar, Event, Timezone, vRecur
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# 每次输出的事件数量
+CHUNK_EVENTS = 200
+
+CALENDAR_END = 'END:VCALENDAR\r\n'
+
+
+def _calendar_header() -> str:
+    """生成 VCALENDAR 头部（属性顺序与编码由 icalendar 决定）"""
+    calendar = Calendar()
+    calendar.add('prodid', '-//Calendar Merger//example.com//')
+    calendar.add('version', '2.0')
+    calendar.add('x-wr-calname', '整合日历')
+    calendar.add('x-wr-caldesc', '多个日历源整合')
+    calendar.add('x-wr-timezone', 'Asia/Shanghai')
+
+    ical = calendar.to_ical().decode('utf-8')
+    return ical[:-len(CALENDAR_END)]
+
+
+def _zone(event_data: Dict) -> Optional[ZoneInfo]:
+    """重复事件 DTSTART 的原始时区，未知或非重复事件返回 None"""
+    tzid = (event_data.get('metadata') or {}).get('tzid')
+    if not tzid:
+        return None
+    try:
+        return ZoneInfo(tzid)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=None)
+def _timezone_component(tzid: str) -> str:
+    """IANA 时区对应的 VTIMEZONE 组件（序列化结果按时区缓存）"""
+    return Timezone.from_tzid(tzid).to_ical().decode('utf-8')
+
+
+def _parse_time(value: str, zone: Optional[ZoneInfo]) -> datetime:
+    """解析 ISO 时间；重复事件换算回原时区，使客户端按当地时间展开跨夏令时的实例"""
+    parsed = datetime.fromisoformat(value)
+    if zone is not None and parsed.tzinfo is not None:
+        parsed = parsed.astimezone(zone)
+    return parsed
+
+
+def build_event(event_data: Dict) -> Event:
+    """将存储中的事件转换为 VEVENT 组件
+
+    重复事件同时写出 RRULE、RDATE 与 EXDATE，例外实例由 build_overrides 生成。
+    """
+    zone = _zone(event_data)
+    event = Event()
+    event.add('uid', event_data['uid'])
+    event.add('summary', event_data['title'])
+    event.add('dtstart', _parse_time(event_data['start_time'], zone))
+    event.add('dtend', _parse_time(event_data['end_time'], zone))
+
+    metadata = event_data.get('metadata') or {}
+    if event_data.get('recurrence_rule'):
+        event.add('rrule', vRecur.from_ical(event_data['recurrence_rule']))
+    if metadata.get('rdate'):
+        event.add('rdate', [_parse_time(value, zone) for value in metadata['rdate']])
+    if metadata.get('exdate'):
+        event.add('exdate', [_parse_time(value, zone) for value in metadata['exdate']])
+
+    if event_data['location'] and event_data['location'] != '未指定':
+        event.add('location', event_data['location'])
+
+    if event_data['description']:
+        event.add('description', event_data['description'])
+
+    event.add('status', event_data.get('status', 'CONFIRMED'))
+
+    # 添加分类
+    if event_data['categories']:
+        event.add('categories', event_data['categories'])
+
+    # 添加来源信息
+    event.add('x-source-calendar', event_data['source_calendar'])
+
+    return event
+
+
+def build_overrides(event_data: Dict) -> List[Event]:
+    """重复事件的 RECURRENCE-ID 例外实例，未覆盖的字段沿用主事件"""
+    metadata = event_data.get('metadata') or {}
+    if not metadata.get('overrides'):
+        return []
+
+    zone = _zone(event_data)
+    components = []
+    for override in metadata['overrides']:
+        event = Event()
+        event.add('uid', event_data['uid'])
+        event.add('recurrence-id', _parse_time(override['recurrence_id'], zone))
+        event.add('summary', override.get('title', event_data['title']))
+        event.add('dtstart', _parse_time(override['start_time'], zone))
+        event.add('dtend', _parse_time(override['end_time'], zone))
+
+        location = override.get('location', event_data['location'])
+        if location and location != '未指定':
+            event.add('location', location)
+
+        description = override.get('description', event_data['description'])
+        if description:
+            event.add('description', description)
+
+        event.add('status', override.get('status', event_data.get('status', 'CONFIRMED')))
+        event.add('x-source-calendar', event_data['source_calendar'])
+        components.append(event)
+    return components
+
+
+def iter_icalendar(events: Iterable[Dict], chunk_events: int = CHUNK_EVENTS) -> Iterator[str]:
+    """流式生成整合日历
+
+    逐个事件序列化 VEVENT（折行与转义与 icalendar 完全一致），每累计
+    chunk_events 个事件输出一次，不在内存中构建完整的 Calendar 对象树。
+    拼接后的结果与整体构建 Calendar 再 to_ical() 逐字节相同。
+
+    重复事件使用原始 TZID，每个时区在首次被引用的事件之前写出一次 VTIMEZONE
+    （RFC 5545 要求日历中每个 TZID 都有对应的 VTIMEZONE，组件之间不要求顺序）。
+    """
+    yield _calendar_header()
+
+    timezones = set()
+    chunk = []
+    for event_data in events:
+        zone = _zone(event_data)
+        if zone is not None and zone.key not in timezones:
+            timezones.add(zone.key)
+            chunk.append(_timezone_component(zone.key))
+        chunk.append(build_event(event_data).to_ical().decode('utf-8'))
+        for override in build_overrides(event_data):
+            chunk.append(override.to_ical().decode('utf-8'))
+        if len(chunk) >= chunk_events:
+            yield ''.join(chunk)
+            chunk = []
+
+    if chunk:
+        yield ''.join(chunk)
+
+    yield CALENDAR_END
@@ -0,0 +1,384 @@
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from urllib.parse import quote, unquote, urlparse
+from xml.sax.saxutils import escape
+import logging
+import threading
+from caldav.lib import error as caldav_error
+
+logger = logging.getLogger(__name__)
+
+DAV_NS = '{DAV:}'
+CS_NS = '{http://calendarserver.org/ns/}'
+CALDAV_NS = '{urn:ietf:params:xml:ns:caldav}'
+
+# RFC 6578 sync-collection 报告
+SYNC_COLLECTION_BODY = '''<?xml version="1.0" encoding="utf-8"?>
+<d:sync-collection xmlns:d="DAV:">
+  <d:sync-token>{token}</d:sync-token>
+  <d:sync-level>1</d:sync-level>
+  <d:prop>
+    <d:getetag/>
+  </d:prop>
+</d:sync-collection>'''
+
+PROPFIND_CTAG_BODY = '''<?xml version="1.0" encoding="utf-8"?>
+<d:propfind xmlns:d="DAV:" xmlns:cs="http://calendarserver.org/ns/">
+  <d:prop>
+    <cs:getctag/>
+    <d:sync-token/>
+  </d:prop>
+</d:propfind>'''
+
+PROPFIND_ETAG_BODY = '''<?xml version="1.0" encoding="utf-8"?>
+<d:propfind xmlns:d="DAV:">
+  <d:prop>
+    <d:getetag/>
+    <d:resourcetype/>
+  </d:prop>
+</d:propfind>'''
+
+# RFC 4791 calendar-multiget 报告，一次请求下载多个对象
+MULTIGET_BODY = '''<?xml version="1.0" encoding="utf-8"?>
+<c:calendar-multiget xmlns:d="DAV:" xmlns:c="urn:ietf:params:xml:ns:caldav">
+  <d:prop>
+    <d:getetag/>
+    <c:calendar-data/>
+  </d:prop>
+{hrefs}
+</c:calendar-multiget>'''
+
+# sync-collection 截断时最多继续请求的次数
+MAX_SYNC_ROUNDS = 20
+
+
+class SyncNotSupported(Exception):
+    """服务器不支持增量同步（sync-collection 与 ETag 列表均不可用）"""
+    pass
+
+
+class InvalidSyncToken(Exception):
+    """服务器拒绝了已保存的 sync-token"""
+    pass
+
+
+class MultigetNotSupported(Exception):
+    """服务器拒绝了 calendar-multiget 报告"""
+    pass
+
+
+def _normalize_href(href: str) -> str:
+    """统一 href 形式（只保留解码后的路径）"""
+    return unquote(urlparse(href.strip()).path)
+
+
+def _iter_responses(tree):
+    """遍历 multistatus 中的 response，返回 (href, status, props)"""
+    if tree is None:
+        return
+    for response in tree.iter(f'{DAV_NS}response'):
+        href_element = response.find(f'{DAV_NS}href')
+        if href_element is None or not href_element.text:
+            continue
+        
+        status_element = response.find(f'{DAV_NS}status')
+        status = status_element.text if status_element is not None else ''
+        
+        props = {}
+        for propstat in response.findall(f'{DAV_NS}propstat'):
+            propstat_status = propstat.find(f'{DAV_NS}status')
+            if propstat_status is not None and ' 200' not in (propstat_status.text or ''):
+                continue
+            prop = propstat.find(f'{DAV_NS}prop')
+            if prop is None:
+                continue
+            for child in prop:
+                props[child.tag] = child
+        
+        yield href_element.text, status or '', props
+
+
+def _prop_text(props: Dict, tag: str) -> Optional[str]:
+    """读取属性文本"""
+    element = props.get(tag)
+    if element is None or element.text is None:
+        return None
+    return element.text.strip()
+
+
+class IncrementalSyncer:
+    """日历源增量同步器
+    
+    为每个日历源记录 sync-token (RFC 6578) 或 ctag，以及每个对象的 ETag
+    和解析结果。后续同步只下载新增或变更的对象，删除的对象从缓存中移除；
+    服务器不支持 sync-collection 时退回到 ctag + ETag 列表比对。变更的对象
+    通过 calendar-multiget 每 multiget_batch 个一批下载，服务器不支持时逐个 GET。
+    提供 parse_many 时下载的对象一次性批量解析。
+    """
+    
+    def __init__(self, storage, parse_calendar_data: Callable[[str, str], List[Dict]],
+                 multiget_batch: int = 50,
+                 parse_many: Optional[Callable[[List[str], str], List[Optional[List[Dict]]]]] = None):
+        self.storage = storage
+        self.parse_calendar_data = parse_calendar_data
+        self.multiget_batch = multiget_batch
+        self.parse_many = parse_many
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def fetch(self, source: Dict) -> Tuple[List[Dict], bool]:
+        """同步日历源，返回 (当前全部事件, 是否所有对象都已成功下载)"""
+        name = source['name']
+        calendar = source['calendar']
+        client = source['client']
+        state = self._get_state(name)
+        
+        collection_url = str(calendar.url)
+        collection_path = _normalize_href(collection_url)
+        
+        if state.get('sync_supported', True):
+            try:
+                changed, removed, sync_token, full = self._sync_collection(
+                    client, collection_url, collection_path, state
+                )
+                ctag = state.get('ctag')
+            except SyncNotSupported as e:
+                logger.info(f"{name} 不支持 sync-collection，改用 ETag 比对: {e}")
+                state['sync_supported'] = False
+                changed, removed, ctag, full = self._etag_listing(
+                    client, collection_url, collection_path, state
+                )
+                sync_token = None
+        else:
+            changed, removed, ctag, full = self._etag_listing(
+                client, collection_url, collection_path, state
+            )
+            sync_token = None
+        
+        objects = state['objects']
+        if full:
+            removed = [href for href in objects if href not in changed]
+            # 完整列表中 ETag 未变化的对象无需重新下载
+            changed = {
+                href: etag for href, etag in changed.items()
+                if etag is None or objects.get(href, {}).get('etag') != etag
+            }
+        
+        updated, failed = self._download(client, calendar, name, changed, state)
+        
+        for href in removed:
+            objects.pop(href, None)
+        objects.update(updated)
+        
+        # 有对象下载失败时保留旧的 sync-token / ctag，下次同步重试这些对象
+        if failed:
+            sync_token = state.get('sync_token')
+            ctag = state.get('ctag')
+        state['sync_token'] = sync_token
+        state['ctag'] = ctag
+        
+        self.storage.save_sync_state(name, sync_token, ctag, updated, removed)
+        
+        logger.info(
+            f"{name} 增量同步: {len(updated)} 个对象更新, {len(removed)} 个删除, "
+            f"{len(failed)} 个失败, 共 {len(objects)} 个对象"
+        )
+        
+        events = []
+        for entry in objects.values():
+            events.extend(entry['events'])
+        return events, not failed
+    
+    def reset(self, source_name: str):
+        """清除日历源的增量同步状态，下次同步执行完整比对"""
+        with self._lock:
+            self._states.pop(source_name, None)
+        self.storage.save_sync_state(source_name, None, None, {}, [], reset=True)
+    
+    def _get_state(self, name: str) -> Dict[str, Any]:
+        """获取日历源的同步状态（首次使用时从存储加载）"""
+        with self._lock:
+            state = self._states.get(name)
+            if state is None:
+                stored = self.storage.load_sync_state(name) or {}
+                if self._outdated(stored.get('objects', {})):
+                    # 旧版本缓存的解析结果不含重复规则或所属日历，丢弃后执行一次完整同步
+                    logger.info(f"{name} 的同步缓存格式已过期，将执行完整同步")
+                    self.storage.save_sync_state(name, None, None, {}, [], reset=True)
+                    stored = {}
+                state = {
+                    'sync_token': stored.get('sync_token'),
+                    'ctag': stored.get('ctag'),
+                    'objects': stored.get('objects', {})
+                }
+                self._states[name] = state
+            return state
+    
+    @staticmethod
+    def _outdated(objects: Dict[str, Dict]) -> bool:
+        """缓存的解析结果是否缺少当前版本的字段"""
+        return any(
+            'recurrence_rule' not in event or 'calendar' not in event.get('metadata', {})
+            for entry in objects.values() for event in entry.get('events', [])
+        )
+    
+    def _sync_collection(self, client, collection_url: str, collection_path: str,
+                         state: Dict) -> Tuple[Dict[str, Optional[str]], List[str], str, bool]:
+        """执行 sync-collection 报告，返回 (变更, 删除, 新 token, 是否完整列表)"""
+        token = state.get('sync_token')
+        try:
+            return self._sync_collection_rounds(client, collection_url, collection_path, token)
+        except InvalidSyncToken:
+            if not token:
+                raise SyncNotSupported('初始 sync-collection 被拒绝')
+            logger.info(f"sync-token 已失效，重新执行完整同步: {collection_url}")
+            return self._sync_collection_rounds(client, collection_url, collection_path, None)
+    
+    def _sync_collection_rounds(self, client, collection_url: str, collection_path: str,
+                                token: Optional[str]) -> Tuple[Dict[str, Optional[str]], List[str], str, bool]:
+        """发送 sync-collection 请求，服务器截断结果 (507) 时继续请求"""
+        changed: Dict[str, Optional[str]] = {}
+        removed: List[str] = []
+        full = not token
+        
+        for _ in range(MAX_SYNC_ROUNDS):
+            try:
+                response = client.report(
+                    collection_url,
+                    SYNC_COLLECTION_BODY.format(token=token or ''),
+                    depth=1
+                )
+            except caldav_error.DAVError as e:
+                raise InvalidSyncToken(str(e))
+            
+            if response.status in (403, 409):
+                raise InvalidSyncToken(f"HTTP {response.status}")
+            if response.status != 207 or response.tree is None:
+                if token:
+                    raise InvalidSyncToken(f"HTTP {response.status}")
+                raise SyncNotSupported(f"HTTP {response.status}")
+            
+            truncated = False
+            for href, status, props in _iter_responses(response.tree):
+                path = _normalize_href(href)
+                if path.rstrip('/') == collection_path.rstrip('/'):
+                    truncated = truncated or ' 507' in status
+                    continue
+                if ' 404' in status:
+                    changed.pop(path, None)
+                    removed.append(path)
+                else:
+                    changed[path] = _prop_text(props, f'{DAV_NS}getetag')
+            
+            token_element = response.tree.find(f'.//{DAV_NS}sync-token')
+            if token_element is None or not token_element.text:
+                raise SyncNotSupported('响应中没有 sync-token')
+            token = token_element.text.strip()
+            
+            if not truncated:
+                break
+        
+        return changed, removed, token, full
+    
+    def _etag_listing(self, client, collection_url: str, collection_path: str,
+                      state: Dict) -> Tuple[Dict[str, Optional[str]], List[str], Optional[str], bool]:
+        """通过 ctag + PROPFIND ETag 列表比对变更"""
+        ctag = None
+        try:
+            response = client.propfind(collection_url, PROPFIND_CTAG_BODY, depth=0)
+            if response.status == 207:
+                for _, _, props in _iter_responses(response.tree):
+                    ctag = _prop_text(props, f'{CS_NS}getctag') or _prop_text(props, f'{DAV_NS}sync-token')
+        except caldav_error.DAVError as e:
+            logger.debug(f"获取 ctag 失败 {collection_url}: {e}")
+        
+        # ctag 未变化说明集合内容没有变化
+        if ctag and ctag == state.get('ctag') and state['objects']:
+            return {}, [], ctag, False
+        
+        try:
+            response = client.propfind(collection_url, PROPFIND_ETAG_BODY, depth=1)
+        except caldav_error.DAVError as e:
+            raise SyncNotSupported(f"PROPFIND 失败: {e}")
+        if response.status != 207 or response.tree is None:
+            raise SyncNotSupported(f"PROPFIND 返回 HTTP {response.status}")
+        
+        listing: Dict[str, Optional[str]] = {}
+        for href, _, props in _iter_responses(response.tree):
+            path = _normalize_href(href)
+            if path.rstrip('/') == collection_path.rstrip('/'):
+                continue
+            resource_type = props.get(f'{DAV_NS}resourcetype')
+            if resource_type is not None and len(resource_type):
+                continue  # 子集合
+            listing[path] = _prop_text(props, f'{DAV_NS}getetag')
+        
+        return listing, [], ctag, True
+    
+    def _download(self, client, calendar, source_name: str, changed: Dict[str, Optional[str]],
+                  state: Dict) -> Tuple[Dict[str, Dict], List[str]]:
+        """下载并解析变更的对象，返回 (更新项, 失败的 href)"""
+        payloads: Dict[str, Tuple[Optional[str], str]] = {}
+        failed: List[str] = []
+        
+        remaining = dict(changed)
+        if self.multiget_batch > 0 and state.get('multiget_supported', True) and len(changed) > 1:
+            hrefs = list(changed)
+            for index in range(0, len(hrefs), self.multiget_batch):
+                batch = hrefs[index:index + self.multiget_batch]
+                try:
+                    bodies = self._multiget(client, str(calendar.url), batch)
+                except MultigetNotSupported as e:
+                    logger.info(f"{source_name} 不支持 calendar-multiget，改为逐个下载: {e}")
+                    state['multiget_supported'] = False
+                    break
+                for href, (etag, data) in bodies.items():
+                    if href in remaining:
+                        # 变更列表中没有 ETag 时使用 multiget 返回的 ETag
+                        payloads[href] = (remaining.pop(href) or etag, data)
+        
+        # multiget 不可用或未返回的对象逐个下载
+        for href, etag in remaining.items():
+            try:
+                caldav_object = calendar.event_by_url(calendar.url.join(href))
+                caldav_object.load()
+                payloads[href] = (etag, caldav_object.data)
+            except Exception as e:
+                logger.error(f"下载对象失败 {href}: {e}")
+                failed.append(href)
+        
+        hrefs = list(payloads)
+        if self.parse_many:
+            parsed = self.parse_many([payloads[href][1] for href in hrefs], source_name)
+        else:
+            parsed = [self.parse_calendar_data(payloads[href][1], source_name) for href in hrefs]
+        
+        # 无法解析的对象按下载失败处理：保留旧的 ETag 与事件，本次同步视为不完整，下次同步重试
+        updated = {}
+        for href, events in zip(hrefs, parsed):
+            if events is None:
+                logger.error(f"解析对象失败 {href}")
+                failed.append(href)
+                continue
+            updated[href] = {'etag': payloads[href][0], 'events': events}
+        return updated, failed
+    
+    @staticmethod
+    def _multiget(client, collection_url: str, hrefs: List[str]) -> Dict[str, Tuple[Optional[str], str]]:
+        """发送 calendar-multiget 报告，返回 {href: (ETag, 日历数据)}"""
+        body = MULTIGET_BODY.format(hrefs='\n'.join(
+            f"  <d:href>{escape(quote(href, safe='/:@!$&()*+,;=~'))}</d:href>" for href in hrefs
+        ))
+        try:
+            response = client.report(collection_url, body, depth=1)
+        except caldav_error.DAVError as e:
+            raise MultigetNotSupported(str(e))
+        if response.status != 207 or response.tree is None:
+            raise MultigetNotSupported(f"HTTP {response.status}")
+        
+        bodies: Dict[str, Tuple[Optional[str], str]] = {}
+        for href, status, props in _iter_responses(response.tree):
+            data = _prop_text(props, f'{CALDAV_NS}calendar-data')
+            if ' 404' in status or not data:
+                continue
+            bodies[_normalize_href(href)] = (_prop_text(props, f'{DAV_NS}getetag'), data)
+        return bodies
@@ -0,0 +1,256 @@
+import heapq
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# 熔断器状态
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+
+
+class SyncScheduler:
+    """按日历源独立调度的同步器
+
+    每个日历源有自己的同步间隔，到期时间保存在优先队列中，由线程池并发执行，
+    慢源或失效源不会推迟其他源。失败后按指数退避加随机抖动重试，连续失败达到
+    阈值时打开熔断器，冷却期内不再请求该源，冷却结束后放行一次试探同步。
+    """
+
+    def __init__(self, merger, default_interval: int = 300, retry_count: int = 3,
+                 backoff_base: float = 10, backoff_max: float = 600, jitter: float = 0.1,
+                 breaker_threshold: int = 5, breaker_cooldown: float = 1800,
+                 source_timeout: float = 120, max_workers: int = 8):
+        self.merger = merger
+        self.default_interval = default_interval
+        self.retry_count = retry_count
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.source_timeout = source_timeout
+        self.max_workers = max_workers
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._queue: List[tuple] = []
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._sequence = 0
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self, run_now: bool = False):
+        """启动调度线程
+
+        run_now 为 True 时所有日历源立即（加少量抖动）同步，否则各自在一个同步间隔后首次同步。
+        """
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            for source in self.merger.source_calendars:
+                self._add_source(source, run_now)
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, self.max_workers),
+            thread_name_prefix='caldav-sync'
+        )
+        self._thread = threading.Thread(target=self._run, name='sync-scheduler', daemon=True)
+        self._thread.start()
+        logger.info(f"同步调度器已启动: {len(self._states)} 个日历源")
+
+    def stop(self, timeout: float = 5):
+        """停止调度线程（正在执行的同步不会被中断）"""
+        with self._lock:
+            self._running = False
+            self._wakeup.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    def get_status(self) -> List[Dict[str, Any]]:
+        """各日历源的调度状态"""
+        with self._lock:
+            return [self._public_state(state) for state in self._states.values()]
+
+    def _add_source(self, source: Dict, run_now: bool):
+        """登记日历源（调用方持有锁）"""
+        config = source.get('config') or {}
+        interval = int(config.get('sync_interval') or self.default_interval)
+        delay = 0 if run_now else interval
+        due = time.time() + delay + self._jitter_for(delay)
+        state = {
+            'name': source['name'],
+            'source': source,
+            'interval': interval,
+            'next_run': due,
+            'running': False,
+            'active': 0,
+            'run_id': 0,
+            'started_at': None,
+            'last_run': None,
+            'last_success': None,
+            'last_outcome': None,
+            'last_error': None,
+            'last_duration': None,
+            'consecutive_failures': 0,
+            'breaker': BREAKER_CLOSED
+        }
+        self._states[source['name']] = state
+        self._schedule(state, due)
+
+    def _schedule(self, state: Dict, due: float):
+        """设置下次执行时间并放入优先队列（调用方持有锁）
+
+        队列中同一日历源的旧条目不删除，出队时与 next_run 比对后丢弃。
+        """
+        state['next_run'] = due
+        self._sequence += 1
+        heapq.heappush(self._queue, (due, self._sequence, state['name']))
+
+    def _jitter_for(self, delay: float) -> float:
+        """在 delay 基础上附加的随机抖动，避免多个源同时请求"""
+        return random.uniform(0, max(delay, 1) * self.jitter)
+
+    def _run(self):
+        """调度主循环：取出到期的日历源提交到线程池，并检查执行超时"""
+        while True:
+            with self._lock:
+                if not self._running:
+                    return
+
+                now = time.time()
+                self._check_timeouts(now)
+
+                due_states = []
+                while self._queue and self._queue[0][0] <= now:
+                    due, _, name = heapq.heappop(self._queue)
+                    state = self._states.get(name)
+                    if state is None or state['running'] or state['next_run'] != due:
+                        continue
+                    if state['active']:
+                        # 上次超时的请求仍未返回，不与其并发访问同一日历源
+                        self._schedule(state, now + 5)
+                        continue
+                    due_states.append(self._begin(state, now))
+
+                timeout = 1.0
+                if self._queue:
+                    timeout = min(timeout, max(self._queue[0][0] - now, 0.05))
+
+                # 在锁内提交：stop() 在锁内清除 _running 后才关闭线程池，不会向已关闭的线程池提交
+                for state, run_id in due_states:
+                    self._executor.submit(self._execute, state, run_id)
+
+            with self._lock:
+                if self._running and not due_states:
+                    self._wakeup.wait(timeout)
+
+    def _begin(self, state: Dict, now: float) -> tuple:
+        """标记日历源开始执行（调用方持有锁）"""
+        if state['breaker'] == BREAKER_OPEN:
+            state['breaker'] = BREAKER_HALF_OPEN
+            logger.info(f"{state['name']} 熔断冷却结束，尝试恢复同步")
+        state['running'] = True
+        state['active'] += 1
+        state['run_id'] += 1
+        state['started_at'] = now
+        return state, state['run_id']
+
+    def _check_timeouts(self, now: float):
+        """执行超时的同步视为失败，其结果在完成后丢弃（调用方持有锁）"""
+        for state in self._states.values():
+            if state['running'] and now - state['started_at'] > self.source_timeout:
+                logger.error(f"同步 {state['name']} 超时 ({self.source_timeout}秒)")
+                state['run_id'] += 1
+                self._record(state, now, 'timeout', f"超时 ({self.source_timeout}秒)")
+
+    def _execute(self, state: Dict, run_id: int):
+        """获取日历源并合并结果"""
+        source = state['source']
+        outcome, error = 'success', None
+        try:
+            result = self.merger.fetch_source(source)
+            scope = result[2]
+            if scope is None:
+                outcome, error = 'failed', '获取事件失败'
+            elif not scope['complete']:
+                outcome, error = 'partial', '部分对象获取失败'
+
+            with self._lock:
+                stale = state['run_id'] != run_id
+            if stale:
+                logger.warning(f"{state['name']} 的同步结果已超时，丢弃")
+                outcome = 'stale'
+            elif scope is not None and not self.merger.apply_results([source], [result]):
+                outcome, error = 'failed', '保存事件失败'
+        except Exception as e:
+            logger.error(f"同步 {state['name']} 失败: {e}")
+            outcome, error = 'failed', str(e)
+
+        with self._lock:
+            state['active'] -= 1
+            if state['run_id'] == run_id:
+                self._record(state, time.time(), outcome, error)
+                self._wakeup.notify_all()
+
+    def _record(self, state: Dict, now: float, outcome: str, error: Optional[str]):
+        """记录执行结果并计算下次执行时间（调用方持有锁）"""
+        state['running'] = False
+        state['last_run'] = now
+        state['last_duration'] = now - state['started_at'] if state['started_at'] else None
+        state['last_outcome'] = outcome
+        state['last_error'] = error
+
+        if outcome == 'success':
+            if state['breaker'] != BREAKER_CLOSED:
+                logger.info(f"{state['name']} 已恢复，关闭熔断器")
+            state['last_success'] = now
+            state['consecutive_failures'] = 0
+            state['breaker'] = BREAKER_CLOSED
+            delay = state['interval'] + self._jitter_for(state['interval'])
+        else:
+            state['consecutive_failures'] += 1
+            failures = state['consecutive_failures']
+            if state['breaker'] == BREAKER_HALF_OPEN or failures >= self.breaker_threshold:
+                state['breaker'] = BREAKER_OPEN
+                delay = self.breaker_cooldown + self._jitter_for(self.breaker_cooldown)
+                logger.warning(f"{state['name']} 连续失败 {failures} 次，熔断 {delay:.0f} 秒")
+            elif failures <= self.retry_count:
+                # 指数退避，抖动取退避时间的后半段
+                backoff = min(self.backoff_base * (2 ** (failures - 1)), self.backoff_max)
+                delay = random.uniform(backoff / 2, backoff)
+                logger.info(f"{state['name']} 第 {failures} 次失败，{delay:.0f} 秒后重试")
+            else:
+                delay = state['interval'] + self._jitter_for(state['interval'])
+
+        self._schedule(state, now + delay)
+
+    @staticmethod
+    def _public_state(state: Dict) -> Dict[str, Any]:
+        """转换为 API 输出格式"""
+        def iso(value: Optional[float]) -> Optional[str]:
+            return datetime.fromtimestamp(value).isoformat() if value else None
+
+        return {
+            'name': state['name'],
+            'interval': state['interval'],
+            'running': state['running'],
+            'next_run': iso(state['next_run']),
+            'last_run': iso(state['last_run']),
+            'last_success': iso(state['last_success']),
+            'last_outcome': state['last_outcome'],
+            'last_error': state['last_error'],
+            'last_duration': round(state['last_duration'], 3) if state['last_duration'] is not None else None,
+            'consecutive_failures': state['consecutive_failures'],
+            'breaker': state['breaker']
+        }
@@ -0,0 +1,125 @@
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 保留的历史任务数量
+MAX_JOB_HISTORY = 50
+
+
+class SyncJobQueue:
+    """手动同步任务队列
+
+    触发同步时立即返回任务 ID，同步在后台线程中执行。已有任务在排队或执行时，
+    新的触发合并到该任务中，同一时间最多只有一个手动同步在运行。
+    """
+
+    def __init__(self, merger, max_history: int = MAX_JOB_HISTORY):
+        self.merger = merger
+        self.max_history = max_history
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._active: Optional[str] = None
+
+    def submit(self) -> Tuple[Dict[str, Any], bool]:
+        """提交同步任务，返回 (任务, 是否合并到已有任务)"""
+        with self._lock:
+            if self._active is not None:
+                job = self._jobs[self._active]
+                job['triggers'] += 1
+                return self._snapshot(job), True
+
+            sources = list(self.merger.source_calendars)
+            job = {
+                'id': uuid.uuid4().hex[:16],
+                'status': 'queued',
+                'created': datetime.now().isoformat(),
+                'started': None,
+                'finished': None,
+                'triggers': 1,
+                'sources': {
+                    source['name']: {'status': 'pending', 'events': None, 'duration': None, 'error': None}
+                    for source in sources
+                },
+                'result': None
+            }
+            self._jobs[job['id']] = job
+            self._active = job['id']
+            while len(self._jobs) > self.max_history:
+                self._jobs.popitem(last=False)
+            snapshot = self._snapshot(job)
+
+        thread = threading.Thread(
+            target=self._run, args=(job, sources), name=f"sync-job-{job['id']}", daemon=True
+        )
+        thread.start()
+        return snapshot, False
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务状态，不存在时返回 None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job is not None else None
+
+    def _run(self, job: Dict[str, Any], sources: list):
+        """执行同步任务"""
+        with self._lock:
+            job['status'] = 'running'
+            job['started'] = datetime.now().isoformat()
+
+        try:
+            success = self.merger.sync_sources(
+                sources,
+                progress=lambda source, status, result: self._progress(job, source, status, result)
+            )
+            result = {'success': success, 'message': '同步完成' if success else '同步失败'}
+        except Exception as e:
+            logger.error(f"同步任务 {job['id']} 失败: {e}")
+            success = False
+            result = {'success': False, 'message': '同步失败', 'error': str(e)}
+
+        with self._lock:
+            result['failed_sources'] = [
+                name for name, item in job['sources'].items() if item['status'] != 'success'
+            ]
+            job['status'] = 'success' if success else 'failed'
+            job['finished'] = datetime.now().isoformat()
+            job['result'] = result
+            if self._active == job['id']:
+                self._active = None
+        logger.info(f"同步任务 {job['id']} 结束: {job['status']}")
+
+    def _progress(self, job: Dict[str, Any], source: Dict, status: str, result: Optional[tuple]):
+        """记录单个日历源的进度"""
+        with self._lock:
+            item = job['sources'].get(source['name'])
+            if item is None or item['status'] == 'timeout':
+                # 超时后迟到的结果已被本次同步丢弃
+                return
+            if status == 'running':
+                item['status'] = 'running'
+                return
+
+            events, duration, scope = result
+            item['duration'] = round(duration, 3)
+            if status == 'timeout':
+                item['status'] = 'timeout'
+                item['error'] = '获取超时'
+            elif scope is None:
+                item['status'] = 'failed'
+                item['error'] = '获取事件失败'
+            else:
+                item['status'] = 'success' if scope['complete'] else 'partial'
+                item['events'] = len(events)
+
+    @staticmethod
+    def _snapshot(job: Dict[str, Any]) -> Dict[str, Any]:
+        """任务状态的副本（调用方持有锁）"""
+        snapshot = dict(job)
+        snapshot['sources'] = {name: dict(item) for name, item in job['sources'].items()}
+        snapshot['result'] = dict(job['result']) if job['result'] else None
+        return snapshot
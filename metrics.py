@@ -0,0 +1,224 @@
+"""
+进程内指标，按 Prometheus 文本格式输出
+
+记录指标只在内存中累加（每次一次加锁和二分查找），只有 /metrics 被抓取时才生成文本，
+没有抓取端时几乎没有额外开销。Config.METRICS_ENABLED 为 False 时记录操作直接返回。
+"""
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import Config
+
+# 默认的耗时分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    """转义标签值中的反斜杠、双引号和换行"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    """格式化标签，extra 为附加在最后的已格式化标签（如 le）"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    """格式化样本值，整数不带小数点"""
+    if value == float('inf'):
+        return '+Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    """指标基类：按标签值分组保存样本"""
+
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        """标签值元组，标签名必须与定义一致"""
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} 的标签应为 {self.labelnames}: {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        """输出 HELP / TYPE 行与全部样本行"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, value in series:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key: Tuple[str, ...], value) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}']
+
+
+class Counter(_Metric):
+    """只增计数器"""
+
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        if not Config.METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """可任意设置的当前值"""
+
+    type_name = 'gauge'
+
+    def set(self, value: float, **labels):
+        if not Config.METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+
+class Histogram(_Metric):
+    """分桶直方图：每个标签组合保存各桶计数、总和与次数"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not Config.METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._series.get(key)
+            if state is None:
+                # [各桶计数（最后一个为 +Inf）, 总和, 次数]
+                state = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """记录 with 块的耗时（异常退出时同样记录）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def timed(self, **labels) -> Callable:
+        """装饰器：记录函数每次调用的耗时"""
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _samples(self, key: Tuple[str, ...], value) -> List[str]:
+        counts, total, count = value[0][:], value[1], value[2]
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = f'le="{_format_value(bound)}"' if bound != float('inf') else 'le="+Inf"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        """注册指标，同名指标只注册一次（返回已注册的实例）"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        """按文本格式 0.0.4 输出全部指标"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def counter(name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+              buckets: Optional[Tuple[float, ...]] = None) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets or DEFAULT_BUCKETS))
+
+
+# 同步
+SOURCE_FETCH_SECONDS = histogram(
+    'calendar_source_fetch_seconds', '获取单个日历源的耗时（秒）', ('source',)
+)
+SOURCE_EVENTS = gauge(
+    'calendar_source_events', '日历源最近一次成功获取的事件数', ('source',)
+)
+SOURCE_ERRORS = counter(
+    'calendar_source_errors_total', '日历源获取失败 (failed)、部分失败 (partial) 与超时 (timeout) 的次数',
+    ('source', 'kind')
+)
+PARSE_SECONDS = histogram(
+    'calendar_parse_seconds', '解析 CalDAV 对象的耗时（秒），mode 为 object（单个对象）或 batch（一批对象）',
+    ('mode',),
+    (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+DEDUP_SECONDS = histogram('calendar_dedup_seconds', '合并后事件去重的耗时（秒）')
+
+# 存储与渲染
+STORAGE_SECONDS = histogram(
+    'calendar_storage_seconds', '存储操作耗时（秒）', ('operation',)
+)
+ICS_RENDER_SECONDS = histogram(
+    'calendar_ics_render_seconds', '渲染 iCalendar 订阅的耗时（秒），feed 为 full 或 filtered', ('feed',)
+)
+
+# Web 请求
+HTTP_REQUEST_SECONDS = histogram(
+    'http_request_duration_seconds', 'HTTP 请求耗时（秒），流式响应只计到开始输出',
+    ('method', 'route', 'status')
+)
@@ -0,0 +1,87 @@
+import threading
+import zlib
+from typing import Dict, Any, Iterable, Iterator, Optional, Union
+
+from config import Config
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只支持 gzip
+    brotli = None
+
+# 会被压缩的响应类型
+COMPRESSIBLE_MIMETYPES = ('text/calendar', 'application/json', 'application/x-ndjson', 'text/html', 'text/plain')
+
+# 压缩级别：预压缩的内容（每个版本只压缩一次）使用较高级别，逐请求压缩的内容使用较快的级别
+GZIP_LEVEL = {'static': 9, 'dynamic': 6}
+BROTLI_QUALITY = {'static': 9, 'dynamic': 4}
+
+_variant_lock = threading.Lock()
+
+
+def available_encodings() -> list:
+    """服务端支持的编码，按优先级排列"""
+    if not Config.COMPRESSION_ENABLED:
+        return []
+    encodings = ['gzip']
+    if brotli is not None and Config.COMPRESSION_BROTLI:
+        encodings.insert(0, 'br')
+    return encodings
+
+
+def negotiate(accept_encodings) -> Optional[str]:
+    """根据请求的 Accept-Encoding 选择编码，不压缩时返回 None
+
+    accept_encodings 为 werkzeug 的 Accept 对象；质量相同时按服务端优先级选择。
+    """
+    best, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str, static: bool = False) -> bytes:
+    """压缩完整的响应体"""
+    mode = 'static' if static else 'dynamic'
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY[mode])
+    compressor = zlib.compressobj(GZIP_LEVEL[mode], zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def compress_stream(chunks: Iterable[Union[str, bytes]], encoding: str) -> Iterator[bytes]:
+    """逐块压缩流式响应，压缩器缓冲满时才输出"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY['dynamic'])
+        process, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL['dynamic'], zlib.DEFLATED, 31)
+        process, finish = compressor.compress, compressor.flush
+
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def cached_variant(snapshot: Dict[str, Any], encoding: Optional[str]) -> bytes:
+    """快照按 encoding 压缩后的内容
+
+    压缩结果保存在快照的 encoded 字典中，随快照（即同步版本）一起失效；
+    同一快照的每种编码只压缩一次，并发请求等待首个请求的压缩结果。
+    """
+    if encoding is None:
+        return snapshot['body']
+    encoded = snapshot.get('encoded')
+    if encoded is not None and encoding in encoded:
+        return encoded[encoding]
+    with _variant_lock:
+        encoded = snapshot.setdefault('encoded', {})
+        if encoding not in encoded:
+            encoded[encoding] = compress(snapshot['body'], encoding, static=True)
+        return encoded[encoding]
@@ -1,9 +1,80 @@
-from flask import Flask, Response, request, jsonify, render_template_string
+from flask import Flask, Response, g, request, jsonify, render_template_string, stream_with_context
+import base64
+import hashlib
+import itertools
+import json
 import logging
+import time
 from datetime import datetime
+from typing import Dict, Iterator, List, Optional
 from merger.calendar_merger import CalendarMerger
+from merger.sync_jobs import SyncJobQueue
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, HTTP_REQUEST_SECONDS, REGISTRY
+from server.compression import COMPRESSIBLE_MIMETYPES, cached_variant, compress, compress_stream, negotiate
+from storage.base import EVENT_FIELDS, normalize_fields
 from config import Config
 
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# 筛选订阅的查询参数与取值上限
+FEED_FILTER_ARGS = ('sources', 'categories', 'past_days', 'future_days')
+FEED_MAX_VALUES = 50
+FEED_MAX_DAYS = 3650
+
+
+def _split_arg(value: Optional[str]) -> List[str]:
+    """逗号分隔的参数值"""
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+def _days_arg(value: Optional[str]) -> Optional[int]:
+    """天数参数，未指定时返回 None，无效时抛出 ValueError"""
+    if value is None or value == '':
+        return None
+    try:
+        days = int(value)
+    except ValueError:
+        raise ValueError(f"无效的天数: {value}") from None
+    if not 0 <= days <= FEED_MAX_DAYS:
+        raise ValueError(f"天数需在 0 ~ {FEED_MAX_DAYS} 之间: {value}")
+    return days
+
+
+def _date_arg(value: Optional[str]) -> Optional[str]:
+    """ISO 日期/时间参数，原样返回，无效时抛出 ValueError"""
+    if value:
+        try:
+            datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"无效的日期: {value}") from None
+    return value
+
+
+def _cursor_scope(start_date: Optional[str], end_date: Optional[str], source: Optional[str]) -> str:
+    """游标所属查询条件的摘要，防止游标用于其他查询"""
+    digest = hashlib.sha1(json.dumps([start_date, end_date, source]).encode('utf-8'))
+    return digest.hexdigest()[:8]
+
+
+def _encode_cursor(key: tuple, scope: str) -> str:
+    """把排序键编码为不透明的分页游标"""
+    raw = json.dumps(list(key) + [scope], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor: str, scope: str) -> tuple:
+    """解析分页游标，格式错误或不属于当前查询时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        epoch, uid, recurrence_id, cursor_scope = json.loads(raw)
+    except Exception as e:
+        raise ValueError(f"无效的游标: {cursor}") from e
+    if (cursor_scope != scope or not isinstance(uid, str) or not isinstance(recurrence_id, str) or
+            not (epoch is None or isinstance(epoch, int))):
+        raise ValueError(f"无效的游标: {cursor}")
+    return epoch, uid, recurrence_id
+
+
 # HTML 模板
 INDEX_HTML = """
 <!DOCTYPE html>
@@ -54,14 +125,29 @@ INDEX_HTML = """
             <strong>GET /calendar.ics</strong> - 订阅/下载 iCalendar 文件
         </div>
         <div class="endpoint">
-            <strong>GET /api/events</strong> - 获取事件列表 (JSON)
+            <strong>GET /calendar/&lt;source&gt;.ics</strong> - 单个日历源的订阅（/calendar.ics 也支持 sources、categories、past_days、future_days 筛选）
+        </div>
+        <div class="endpoint">
+            <strong>GET /api/events</strong> - 获取事件列表 (JSON，支持 fields 投影、limit/cursor 分页与 format=ndjson/compact)
+        </div>
+        <div class="endpoint">
+            <strong>GET /api/events/&lt;uid&gt;</strong> - 获取单个事件 (JSON)
+        </div>
+        <div class="endpoint">
+            <strong>POST /api/sync</strong> - 手动触发同步（返回任务 ID）
+        </div>
+        <div class="endpoint">
+            <strong>GET /api/sync/&lt;job_id&gt;</strong> - 查询同步任务进度 (JSON)
         </div>
         <div class="endpoint">
-            <strong>POST /api/sync</strong> - 手动触发同步
+            <strong>GET /api/sources</strong> - 各日历源的同步状态 (JSON)
         </div>
         <div class="endpoint">
             <strong>GET /api/stats</strong> - 获取统计信息
         </div>
+        <div class="endpoint">
+            <strong>GET /metrics</strong> - Prometheus 指标
+        </div>
     </div>
     
     <script>
@@ -101,15 +187,34 @@ INDEX_HTML = """
 class CalendarWebServer:
     """日历 Web 服务器"""
     
-    def __init__(self, storage, merger):
+    def __init__(self, storage, merger, scheduler=None, sync_jobs=None):
         self.storage = storage
         self.merger = merger
+        self.scheduler = scheduler
+        self.sync_jobs = sync_jobs or SyncJobQueue(merger)
         self.app = Flask(__name__)
         self._setup_routes()
     
     def _setup_routes(self):
         """设置路由"""
         
+        @self.app.before_request
+        def start_timer():
+            g.request_started = time.perf_counter()
+        
+        @self.app.after_request
+        def record_request(response):
+            """记录请求耗时（注册在压缩之前，因此在压缩之后执行）"""
+            started = g.pop('request_started', None)
+            if started is not None:
+                HTTP_REQUEST_SECONDS.observe(
+                    time.perf_counter() - started,
+                    method=request.method,
+                    route=request.url_rule.rule if request.url_rule else '<unmatched>',
+                    status=response.status_code
+                )
+            return response
+        
         @self.app.route('/')
         def index():
             """主页"""
@@ -123,34 +228,147 @@ class CalendarWebServer:
         
         @self.app.route('/calendar.ics')
         def download_calendar():
-            """下载 iCalendar 文件"""
-            ical_data = self.merger.generate_icalendar()
-            return Response(
-                ical_data,
-                mimetype='text/calendar',
-                headers={
-                    'Content-Disposition': 'attachment; filename=merged_calendar.ics'
-                }
-            )
+            """下载 iCalendar 文件（每个同步版本只渲染和压缩一次，支持 ETag / 304）
+            
+            带 sources / categories / past_days / future_days 参数时返回筛选后的订阅。
+            """
+            if any(name in request.args for name in FEED_FILTER_ARGS):
+                return self._feed_response()
+            
+            snapshot = self.merger.ics_cache.get()
+            if snapshot is None:
+                # 尚无快照时流式输出，首字节无需等待整个日历渲染完成
+                return Response(
+                    stream_with_context(self.merger.stream_icalendar()),
+                    mimetype='text/calendar',
+                    headers={
+                        'Content-Disposition': 'attachment; filename=merged_calendar.ics'
+                    }
+                )
+            return self._ics_response(snapshot, 'merged_calendar.ics')
+        
+        @self.app.route('/calendar/<path:source>.ics')
+        def download_source_calendar(source):
+            """下载单个日历源的 iCalendar 文件（可再按分类与时间窗口筛选）"""
+            return self._feed_response([source])
         
         @self.app.route('/api/events')
         def get_events():
-            """获取事件列表 API"""
+            """获取事件列表 API（支持字段投影、紧凑格式、游标分页与 NDJSON 流式输出）"""
+            start_date = request.args.get('start_date')
+            end_date = request.args.get('end_date')
+            source = request.args.get('source')
+            include_attendees = request.args.get('attendees', 'true').lower() not in ('false', '0', 'no')
+            output_format = request.args.get('format')
+            if output_format is None and request.accept_mimetypes.best == NDJSON_MIMETYPE:
+                output_format = 'ndjson'
+            ndjson = output_format == 'ndjson'
+            compact = output_format == 'compact'
+            scope = _cursor_scope(start_date, end_date, source)
+            
             try:
-                start_date = request.args.get('start_date')
-                end_date = request.args.get('end_date')
-                source = request.args.get('source')
+                _date_arg(start_date)
+                _date_arg(end_date)
+                fields = request.args.get('fields')
+                if fields is not None:
+                    fields = [field.strip() for field in fields.split(',') if field.strip()]
+                    fields = list(normalize_fields(fields))
+                    if not include_attendees and 'attendees' in fields:
+                        fields.remove('attendees')
+                elif compact:
+                    # 紧凑格式需要固定的列顺序，未指定 fields 时输出全部字段
+                    fields = [
+                        field for field in EVENT_FIELDS
+                        if (field != 'attendees' or include_attendees) and
+                        (field != 'recurrence_id' or start_date or end_date)
+                    ]
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
+            
+            try:
+                limit = request.args.get('limit')
+                if limit is not None:
+                    limit = int(limit)
+                    if limit < 1:
+                        raise ValueError(limit)
+                    limit = min(limit, Config.API_MAX_PAGE_SIZE)
+                cursor = request.args.get('cursor')
+                after = _decode_cursor(cursor, scope) if cursor else None
+            except ValueError:
+                return jsonify({
+                    'success': False,
+                    'error': 'Invalid limit or cursor'
+                }), 400
+            
+            try:
+                if limit is not None and not ndjson:
+                    events, next_key = self.storage.load_events_page(
+                        start_date=start_date,
+                        end_date=end_date,
+                        source_calendar=source,
+                        include_attendees=include_attendees,
+                        limit=limit,
+                        after=after,
+                        fields=fields
+                    )
+                    body = {
+                        'success': True,
+                        'data': events,
+                        'count': len(events),
+                        'next_cursor': _encode_cursor(next_key, scope) if next_key else None,
+                        'timestamp': datetime.now().isoformat()
+                    }
+                    if compact:
+                        body['fields'] = fields
+                        body['data'] = [[event.get(field) for field in fields] for event in events]
+                    return jsonify(body)
                 
-                events = self.storage.load_events(
+                events = self.storage.iter_events(
                     start_date=start_date,
                     end_date=end_date,
-                    source_calendar=source
+                    source_calendar=source,
+                    include_attendees=include_attendees,
+                    after=after,
+                    fields=fields
                 )
+                if limit is not None:
+                    events = itertools.islice(events, limit)
+                # 先取出第一个事件，查询出错时仍能返回错误响应
+                first = next(events, None)
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+            
+            rows = itertools.chain([first], events) if first is not None else iter(())
+            if ndjson:
+                return Response(
+                    stream_with_context(self._stream_ndjson(rows)),
+                    mimetype=NDJSON_MIMETYPE
+                )
+            return Response(
+                stream_with_context(self._stream_events_json(rows, fields if compact else None)),
+                mimetype='application/json'
+            )
+        
+        @self.app.route('/api/events/<path:event_uid>')
+        def get_event(event_uid):
+            """获取单个事件 API"""
+            try:
+                event = self.storage.get_event(event_uid)
+                if event is None:
+                    return jsonify({
+                        'success': False,
+                        'error': 'Event not found'
+                    }), 404
                 
                 return jsonify({
                     'success': True,
-                    'data': events,
-                    'count': len(events),
+                    'data': event,
                     'timestamp': datetime.now().isoformat()
                 })
             except Exception as e:
@@ -161,25 +379,63 @@ class CalendarWebServer:
         
         @self.app.route('/api/sync', methods=['POST'])
         def sync_calendars():
-            """手动触发同步"""
+            """手动触发同步（后台执行，立即返回任务 ID）"""
             try:
-                success = self.merger.merge_all_events()
+                job, coalesced = self.sync_jobs.submit()
                 return jsonify({
-                    'success': success,
-                    'message': '同步完成' if success else '同步失败',
+                    'success': True,
+                    'message': '已合并到正在进行的同步' if coalesced else '同步已开始',
+                    'job_id': job['id'],
+                    'status': job['status'],
+                    'coalesced': coalesced,
+                    'status_url': f"/api/sync/{job['id']}",
                     'timestamp': datetime.now().isoformat()
-                })
+                }), 202
             except Exception as e:
                 return jsonify({
                     'success': False,
                     'error': str(e)
                 }), 500
         
+        @self.app.route('/api/sync/<job_id>')
+        def get_sync_job(job_id):
+            """查询同步任务进度 API"""
+            job = self.sync_jobs.get(job_id)
+            if job is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Job not found'
+                }), 404
+            
+            return jsonify({
+                'success': True,
+                'data': job,
+                'timestamp': datetime.now().isoformat()
+            })
+        
+        @self.app.route('/api/sources')
+        def get_sources():
+            """获取各日历源的同步调度状态 API"""
+            if self.scheduler is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Scheduler not running'
+                }), 503
+            
+            sources = self.scheduler.get_status()
+            return jsonify({
+                'success': True,
+                'data': sources,
+                'count': len(sources),
+                'timestamp': datetime.now().isoformat()
+            })
+        
         @self.app.route('/api/stats')
         def get_stats():
             """获取统计信息 API"""
             try:
                 stats = self.storage.get_stats()
+                stats['feed_cache'] = self.merger.feed_cache.stats()
                 return jsonify({
                     'success': True,
                     'data': stats,
@@ -191,6 +447,21 @@ class CalendarWebServer:
                     'error': str(e)
                 }), 500
         
+        @self.app.route('/metrics')
+        def metrics():
+            """Prometheus 文本格式的指标"""
+            if not Config.METRICS_ENABLED:
+                return jsonify({
+                    'success': False,
+                    'error': 'Metrics disabled'
+                }), 404
+            return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+        
+        @self.app.after_request
+        def compress_response(response):
+            """按 Accept-Encoding 压缩未压缩过的响应"""
+            return self._compress_response(response)
+        
         @self.app.errorhandler(404)
         def not_found(error):
             return jsonify({
@@ -198,6 +469,117 @@ class CalendarWebServer:
                 'error': 'Endpoint not found'
             }), 404
     
+    def _feed_response(self, sources: Optional[List[str]] = None) -> Response:
+        """按请求参数渲染（或从缓存读取）筛选后的订阅"""
+        try:
+            sources = (sources or []) + _split_arg(request.args.get('sources'))
+            categories = _split_arg(request.args.get('categories'))
+            if len(sources) > FEED_MAX_VALUES or len(categories) > FEED_MAX_VALUES:
+                raise ValueError(f"最多指定 {FEED_MAX_VALUES} 个日历源或分类")
+            past_days = _days_arg(request.args.get('past_days'))
+            future_days = _days_arg(request.args.get('future_days'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        try:
+            snapshot = self.merger.get_feed_snapshot(sources, categories, past_days, future_days)
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+        return self._ics_response(snapshot, 'calendar.ics')
+    
+    def _ics_response(self, snapshot: Dict, filename: str) -> Response:
+        """返回 ICS 快照，按 Accept-Encoding 使用快照缓存的压缩结果，支持条件请求"""
+        encoding = None
+        if len(snapshot['body']) >= Config.COMPRESSION_MIN_SIZE:
+            encoding = negotiate(request.accept_encodings)
+        response = Response(
+            cached_variant(snapshot, encoding),
+            mimetype='text/calendar',
+            headers={
+                'Content-Disposition': f'attachment; filename={filename}',
+                'Cache-Control': 'no-cache'
+            }
+        )
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            # 不同编码是不同的表示，强 ETag 需要区分
+            response.headers['Content-Encoding'] = encoding
+            response.set_etag(f"{snapshot['etag']}-{encoding}")
+        else:
+            response.set_etag(snapshot['etag'])
+        response.last_modified = snapshot['last_modified']
+        return response.make_conditional(request)
+    
+    def _compress_response(self, response: Response) -> Response:
+        """压缩 JSON、NDJSON 与流式输出的 ICS 响应
+        
+        流式响应先缓冲到 COMPRESSION_MIN_SIZE 字节再决定是否压缩，之后逐块压缩输出。
+        """
+        if (response.status_code < 200 or response.status_code in (204, 304) or
+                request.method == 'HEAD' or 'Content-Encoding' in response.headers or
+                response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+        
+        if not response.is_streamed:
+            body = response.get_data()
+            if len(body) < Config.COMPRESSION_MIN_SIZE:
+                return response
+            response.set_data(compress(body, encoding))
+        else:
+            chunks = iter(response.response)
+            head, size = [], 0
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                head.append(chunk)
+                size += len(chunk)
+                if size >= Config.COMPRESSION_MIN_SIZE:
+                    break
+            else:
+                # 整个响应都小于阈值，直接输出缓冲的内容
+                response.response = head
+                return response
+            response.response = compress_stream(itertools.chain(head, chunks), encoding)
+        
+        response.headers['Content-Encoding'] = encoding
+        return response
+    
+    def _stream_ndjson(self, events: Iterator[Dict]) -> Iterator[str]:
+        """每行输出一个事件的 JSON"""
+        dumps = self.app.json.dumps
+        for event in events:
+            yield dumps(event) + '\n'
+    
+    def _stream_events_json(self, events: Iterator[Dict],
+                            compact_fields: Optional[List[str]] = None) -> Iterator[str]:
+        """逐个事件输出与 jsonify 相同结构的事件列表响应
+        
+        指定 compact_fields 时为紧凑格式：每个事件输出为按 compact_fields 顺序排列的数组。
+        """
+        dumps = self.app.json.dumps
+        if compact_fields is None:
+            yield '{"success": true, "data": ['
+        else:
+            yield f'{{"success": true, "fields": {dumps(compact_fields)}, "data": ['
+        count = 0
+        for event in events:
+            if compact_fields is not None:
+                event = [event.get(field) for field in compact_fields]
+            yield (',' if count else '') + dumps(event)
+            count += 1
+        yield f'], "count": {count}, "timestamp": {dumps(datetime.now().isoformat())}}}\n'
+    
     def run(self, host=None, port=None, debug=None, use_reloader=None):
         """运行服务器"""
         host = host or Config.HOST
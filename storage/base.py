@@ -1,8 +1,47 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Set, Tuple
 from datetime import datetime
 import json
 
+# 可通过 fields 投影返回的事件字段（recurrence_id 仅实例查询返回，attendees 来自参与者表）
+EVENT_FIELDS = (
+    'id', 'uid', 'title', 'start_time', 'end_time', 'location', 'description',
+    'source_calendar', 'source_event_id', 'created_time', 'last_updated', 'recurrence_rule',
+    'organizer', 'status', 'categories', 'priority', 'metadata', 'is_deleted',
+    'recurrence_id', 'attendees'
+)
+
+
+def iso_to_epoch(value: Optional[str]) -> Optional[int]:
+    """ISO 时间/日期字符串转 UTC 时间戳（无时区信息及全天日期按本地时间处理），无效时返回 None
+    
+    存储的时间戳、展开的实例时间戳与跨源去重的时间窗口都使用该函数换算，保持一致。
+    """
+    if not value:
+        return None
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+def normalize_fields(fields: Optional[List[str]]) -> Optional[Tuple[str, ...]]:
+    """校验并去重投影字段（保持顺序），None 表示全部字段，包含未知字段时抛出 ValueError"""
+    if fields is None:
+        return None
+    unknown = [field for field in fields if field not in EVENT_FIELDS]
+    if unknown:
+        raise ValueError(f"未知的事件字段: {', '.join(unknown)}")
+    return tuple(dict.fromkeys(fields))
+
+
+def project_event(event: Dict, fields: Optional[Tuple[str, ...]]) -> Dict:
+    """只保留 fields 中的字段"""
+    if fields is None:
+        return event
+    return {field: event[field] for field in fields if field in event}
+
+
 class BaseCalendarStorage(ABC):
     """日历存储基础接口"""
     
@@ -11,18 +50,116 @@ class BaseCalendarStorage(ABC):
         """保存事件列表"""
         pass
     
+    def upsert_events(self, events: List[Dict]) -> Dict[str, int]:
+        """保存事件并返回 inserted/updated/unchanged/failed 计数
+        
+        默认直接调用 save_events，无法区分新增与更新时全部计为 updated。
+        """
+        if self.save_events(events):
+            return {'inserted': 0, 'updated': len(events), 'unchanged': 0, 'failed': 0}
+        return {'inserted': 0, 'updated': 0, 'unchanged': 0, 'failed': len(events)}
+    
     @abstractmethod
     def load_events(self, start_date: Optional[str] = None, 
                    end_date: Optional[str] = None,
-                   source_calendar: Optional[str] = None) -> List[Dict]:
+                   source_calendar: Optional[str] = None,
+                   include_attendees: bool = True) -> List[Dict]:
         """加载事件列表"""
         pass
     
+    def close(self):
+        """释放存储占用的资源（连接等），默认无操作"""
+        pass
+    
+    def iter_events(self, start_date: Optional[str] = None,
+                    end_date: Optional[str] = None,
+                    source_calendar: Optional[str] = None,
+                    include_attendees: bool = False,
+                    after: Optional[tuple] = None,
+                    fields: Optional[List[str]] = None) -> Iterator[Dict]:
+        """按 (开始时间戳, UID) 顺序逐个返回排序键 after 之后的事件，默认基于 load_events 实现
+        
+        fields 为要返回的字段（见 EVENT_FIELDS），None 表示全部字段。
+        """
+        fields = normalize_fields(fields)
+        for _, event in self._sorted_events(start_date, end_date, source_calendar, include_attendees, after, fields):
+            yield project_event(event, fields)
+    
+    def load_events_page(self, start_date: Optional[str] = None,
+                         end_date: Optional[str] = None,
+                         source_calendar: Optional[str] = None,
+                         include_attendees: bool = True,
+                         limit: int = 100,
+                         after: Optional[tuple] = None,
+                         fields: Optional[List[str]] = None) -> Tuple[List[Dict], Optional[tuple]]:
+        """按 (开始时间戳, UID) 顺序分页加载事件，返回 (事件, 下一页的起点)，没有下一页时起点为 None
+        
+        默认基于 load_events 在内存中排序分页。
+        """
+        fields = normalize_fields(fields)
+        page = self._sorted_events(start_date, end_date, source_calendar, include_attendees, after, fields)
+        page = [(key, project_event(event, fields)) for key, event in page[:limit + 1]]
+        if len(page) <= limit:
+            return [event for _, event in page], None
+        return [event for _, event in page[:limit]], page[limit - 1][0]
+    
+    def iter_feed_events(self, sources: Optional[List[str]] = None,
+                         categories: Optional[List[str]] = None,
+                         start_epoch: Optional[int] = None,
+                         end_epoch: Optional[int] = None) -> Iterator[Dict]:
+        """按日历源、分类与时间窗口过滤主事件（不含参与者），用于渲染筛选后的订阅
+        
+        默认基于 iter_events 过滤：重复事件不判断实例，只要求首次开始不晚于窗口结束。
+        """
+        wanted = {category.lower() for category in categories or []}
+        for event in self.iter_events():
+            if sources and event.get('source_calendar') not in sources:
+                continue
+            if wanted and not wanted & {str(category).lower() for category in event.get('categories') or []}:
+                continue
+            if start_epoch is not None or end_epoch is not None:
+                try:
+                    start = datetime.fromisoformat(event['start_time']).timestamp()
+                    end = datetime.fromisoformat(event.get('end_time') or event['start_time']).timestamp()
+                except (KeyError, ValueError):
+                    continue
+                if end_epoch is not None and start > end_epoch:
+                    continue
+                if start_epoch is not None and end < start_epoch and not event.get('recurrence_rule'):
+                    continue
+            yield event
+    
+    def _sorted_events(self, start_date: Optional[str], end_date: Optional[str],
+                       source_calendar: Optional[str], include_attendees: bool,
+                       after: Optional[tuple], fields: Optional[Tuple[str, ...]] = None) -> List[tuple]:
+        """加载事件并按 (开始时间戳, UID) 排序，返回 after 之后的 (排序键, 事件)，排序键为 (开始时间戳, UID, RECURRENCE-ID)"""
+        def order(key: tuple) -> tuple:
+            # 开始时间无法解析的事件排在最前
+            return (key[0] is not None, key[0] or 0, key[1], key[2])
+        
+        if fields is not None and 'attendees' not in fields:
+            include_attendees = False
+        keyed = []
+        for event in self.load_events(start_date, end_date, source_calendar, include_attendees):
+            epoch = iso_to_epoch(event.get('start_time'))
+            keyed.append(((epoch, event.get('uid') or '', event.get('recurrence_id') or ''), event))
+        keyed.sort(key=lambda item: order(item[0]))
+        if after is not None:
+            keyed = [item for item in keyed if order(item[0]) > order(tuple(after))]
+        return keyed
+    
     @abstractmethod
     def delete_event(self, event_uid: str) -> bool:
         """删除事件"""
         pass
     
+    def delete_events(self, event_uids: List[str]) -> int:
+        """批量删除事件，返回实际删除的数量
+        
+        默认逐个调用 delete_event。
+        """
+        return sum(1 for uid in event_uids if self.delete_event(uid))
+    
     @abstractmethod
     def get_event(self, event_uid: str) -> Optional[Dict]:
         """获取单个事件"""
@@ -36,4 +173,32 @@ class BaseCalendarStorage(ABC):
     @abstractmethod
     def get_stats(self) -> Dict[str, Any]:
         """获取统计信息"""
-        pass
\ No newline at end of file
+        pass
+    
+    def load_sync_state(self, source_calendar: str) -> Optional[Dict[str, Any]]:
+        """加载日历源的增量同步状态（sync-token、ctag 及各对象 ETag）
+        
+        默认不持久化，返回 None 表示没有保存的状态。
+        """
+        return None
+    
+    def save_sync_state(self, source_calendar: str, sync_token: Optional[str],
+                        ctag: Optional[str], updated: Dict[str, Dict],
+                        removed: List[str], reset: bool = False) -> bool:
+        """保存日历源的增量同步状态
+        
+        updated 为 {href: {'etag': ..., 'events': [...]}}，removed 为已删除的 href 列表，
+        reset 为 True 时先清空该日历源的全部状态。默认不持久化。
+        """
+        return False
+    
+    def sweep_events(self, source_calendar: str, seen_uids: Set[str],
+                     start_epoch: int, end_epoch: int, include_recurring: bool = False,
+                     max_fraction: float = 1.0, min_guarded: int = 0) -> Dict[str, Any]:
+        """软删除日历源在同步范围内、本次同步未出现的事件
+        
+        同步范围为与 [start_epoch, end_epoch] 重叠的非重复事件，include_recurring 为 True 时
+        还包括该源的全部重复事件。待删除数量超过 min_guarded 且超过范围内事件的 max_fraction
+        时不执行删除并返回 blocked。默认不支持删除检测。
+        """
+        return {'deleted': 0, 'candidates': 0, 'total': 0, 'blocked': False}
@@ -14,6 +14,10 @@ class JSONCalendarStorage(BaseCalendarStorage):
         self.storage_dir = storage_dir
         os.makedirs(storage_dir, exist_ok=True)
         self.latest_file = os.path.join(storage_dir, 'calendar_events_latest.json')
+        
+        # UID 索引缓存，文件修改时间变化时重建
+        self._uid_index: Dict[str, Dict] = {}
+        self._uid_index_mtime: Optional[float] = None
     
     def save_events(self, events: List[Dict]) -> bool:
         """保存事件到JSON文件"""
@@ -33,6 +37,7 @@ class JSONCalendarStorage(BaseCalendarStorage):
             # 保存最新版本
             with open(self.latest_file, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
+            self._uid_index_mtime = None
             
             # 创建时间戳备份
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -49,7 +54,8 @@ class JSONCalendarStorage(BaseCalendarStorage):
     
     def load_events(self, start_date: Optional[str] = None, 
                    end_date: Optional[str] = None,
-                   source_calendar: Optional[str] = None) -> List[Dict]:
+                   source_calendar: Optional[str] = None,
+                   include_attendees: bool = True) -> List[Dict]:
         """从JSON文件加载事件"""
         if not os.path.exists(self.latest_file):
             return []
@@ -72,6 +78,9 @@ class JSONCalendarStorage(BaseCalendarStorage):
                 if source_calendar and event.get('source_calendar') != source_calendar:
                     continue
                 
+                if not include_attendees:
+                    event.pop('attendees', None)
+                
                 filtered_events.append(event)
             
             return filtered_events
@@ -92,12 +101,19 @@ class JSONCalendarStorage(BaseCalendarStorage):
         return False
     
     def get_event(self, event_uid: str) -> Optional[Dict]:
-        """获取单个事件"""
-        events = self.load_events()
-        for event in events:
-            if event.get('uid') == event_uid:
-                return event
-        return None
+        """获取单个事件（通过内存中的 UID 索引查找）"""
+        if not os.path.exists(self.latest_file):
+            return None
+        
+        mtime = os.path.getmtime(self.latest_file)
+        if mtime != self._uid_index_mtime:
+            self._uid_index = {
+                event.get('uid'): event for event in self.load_events()
+            }
+            self._uid_index_mtime = mtime
+        
+        event = self._uid_index.get(event_uid)
+        return dict(event) if event is not None else None
     
     def backup(self) -> str:
         """创建备份（JSON存储本身就是备份）"""
@@ -0,0 +1,197 @@
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Optional, Tuple
+from dateutil import tz
+from dateutil.rrule import rrulestr, rruleset
+from .base import iso_to_epoch
+
+logger = logging.getLogger(__name__)
+
+# 单个重复事件在窗口内最多展开的实例数，防止异常规则（如 FREQ=SECONDLY）耗尽资源
+MAX_OCCURRENCES = 5000
+
+# 例外实例可以覆盖的字段
+OVERRIDE_FIELDS = ('title', 'location', 'description', 'status')
+
+
+def _parse_time(value: str, reference: datetime) -> Optional[datetime]:
+    """解析 ISO 时间，并与 DTSTART 的时区形式保持一致（同为带时区或同为本地时间）"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if reference.tzinfo is not None:
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=reference.tzinfo)
+        return parsed.astimezone(reference.tzinfo)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def _epoch(value: datetime) -> int:
+    """时间转 UTC 时间戳（无时区信息按本地时间处理）"""
+    return int(value.timestamp())
+
+
+def _format(value: datetime, all_day: bool) -> str:
+    """按原事件的格式输出实例时间（全天事件只保留日期）"""
+    return value.date().isoformat() if all_day else value.isoformat()
+
+
+def _dtstart(event: Dict) -> Tuple[datetime, bool]:
+    """计算展开用的 DTSTART，返回 (dtstart, 是否全天)
+    
+    带时区的时间换算回原 TZID 对应的时区，使跨夏令时的实例保持相同的本地时刻。
+    """
+    start_time = event['start_time']
+    all_day = len(start_time) == 10
+    dtstart = datetime.fromisoformat(start_time)
+    
+    tzid = (event.get('metadata') or {}).get('tzid')
+    if dtstart.tzinfo is not None and tzid:
+        zone = tz.gettz(tzid)
+        if zone is not None:
+            dtstart = dtstart.astimezone(zone)
+    return dtstart, all_day
+
+
+def _build_rule(rule: str, dtstart: datetime):
+    """解析 RRULE，UNTIL 与 DTSTART 时区形式不一致时自动换算"""
+    try:
+        return rrulestr(rule, dtstart=dtstart)
+    except ValueError:
+        parts = []
+        for part in rule.split(';'):
+            key, _, value = part.partition('=')
+            if key.upper() == 'UNTIL' and value:
+                until = _parse_until(value, dtstart)
+                if until is None:
+                    continue
+                value = until
+            parts.append(f"{key}={value}" if value else key)
+        return rrulestr(';'.join(parts), dtstart=dtstart)
+
+
+def _parse_until(value: str, dtstart: datetime) -> Optional[str]:
+    """将 UNTIL 换算为与 DTSTART 匹配的形式（带时区时使用 UTC）"""
+    try:
+        if len(value) == 8:
+            until = datetime.strptime(value, '%Y%m%d').replace(hour=23, minute=59, second=59)
+        else:
+            until = datetime.strptime(value.rstrip('Z'), '%Y%m%dT%H%M%S')
+            if value.endswith('Z'):
+                until = until.replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    
+    if dtstart.tzinfo is not None:
+        if until.tzinfo is None:
+            until = until.replace(tzinfo=dtstart.tzinfo)
+        return until.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    if until.tzinfo is not None:
+        until = until.astimezone().replace(tzinfo=None)
+    return until.strftime('%Y%m%dT%H%M%S')
+
+
+def _override_values(override: Dict) -> Optional[str]:
+    """例外实例中与主事件不同的字段（JSON），没有时返回 None"""
+    values = {key: override[key] for key in OVERRIDE_FIELDS if override.get(key) is not None}
+    return json.dumps(values, ensure_ascii=False) if values else None
+
+
+def expand_event(event: Dict, window_start: int, window_end: int) -> List[tuple]:
+    """展开事件在窗口内的实例
+    
+    返回 occurrences 表的行 (event_uid, start_epoch, end_epoch, start_time, end_time,
+    recurrence_id, overrides)。非重复事件始终返回自身一行；重复事件按 RRULE、RDATE、
+    EXDATE 展开，并用 RECURRENCE-ID 例外实例替换对应的实例。
+    """
+    uid = event['uid']
+    rule = event.get('recurrence_rule')
+    metadata = event.get('metadata') or {}
+    
+    if not rule and not metadata.get('rdate'):
+        start_epoch = event.get('start_epoch', iso_to_epoch(event['start_time']))
+        end_epoch = event.get('end_epoch', iso_to_epoch(event['end_time']))
+        if start_epoch is None or end_epoch is None:
+            return []
+        return [(uid, start_epoch, end_epoch, event['start_time'], event['end_time'], None, None)]
+    
+    dtstart, all_day = _dtstart(event)
+    dtend = _parse_time(event['end_time'], dtstart) if event.get('end_time') else None
+    duration = (dtend - dtstart) if dtend is not None and dtend >= dtstart else timedelta(0)
+    
+    ruleset = rruleset()
+    if rule:
+        ruleset.rrule(_build_rule(rule, dtstart))
+    else:
+        ruleset.rdate(dtstart)
+    for value in metadata.get('rdate', []):
+        rdate = _parse_time(value, dtstart)
+        if rdate is not None:
+            ruleset.rdate(rdate)
+    for value in metadata.get('exdate', []):
+        exdate = _parse_time(value, dtstart)
+        if exdate is not None:
+            ruleset.exdate(exdate)
+    
+    # 例外实例按原实例的时间戳索引
+    overrides: Dict[int, Dict] = {}
+    for override in metadata.get('overrides', []):
+        recurrence_id = _parse_time(override.get('recurrence_id', ''), dtstart)
+        if recurrence_id is not None:
+            overrides[_epoch(recurrence_id)] = override
+    
+    if dtstart.tzinfo is not None:
+        window_from = datetime.fromtimestamp(window_start, timezone.utc) - duration
+        window_to = datetime.fromtimestamp(window_end, timezone.utc)
+    else:
+        window_from = datetime.fromtimestamp(window_start) - duration
+        window_to = datetime.fromtimestamp(window_end)
+    
+    rows = []
+    for occurrence in ruleset.xafter(window_from, count=MAX_OCCURRENCES, inc=True):
+        if occurrence > window_to:
+            break
+        occurrence_epoch = _epoch(occurrence)
+        recurrence_id = _format(occurrence, all_day)
+        override = overrides.pop(occurrence_epoch, None)
+        if override is None:
+            end = occurrence + duration
+            rows.append((
+                uid, occurrence_epoch, _epoch(end),
+                recurrence_id, _format(end, all_day), recurrence_id, None
+            ))
+        else:
+            row = _override_row(uid, override, recurrence_id)
+            if row:
+                rows.append(row)
+    else:
+        if len(rows) >= MAX_OCCURRENCES:
+            logger.warning(f"重复事件 {uid} 在窗口内的实例超过 {MAX_OCCURRENCES} 个，已截断")
+    
+    # 被移入窗口、但原实例时间在窗口外的例外实例
+    for override in overrides.values():
+        row = _override_row(uid, override, override.get('recurrence_id'))
+        if row and row[2] >= window_start and row[1] <= window_end:
+            rows.append(row)
+    
+    return rows
+
+
+def _override_row(uid: str, override: Dict, recurrence_id: str) -> Optional[tuple]:
+    """例外实例对应的行，已取消的实例返回 None"""
+    if str(override.get('status', '')).upper() == 'CANCELLED':
+        return None
+    start_epoch = iso_to_epoch(override.get('start_time'))
+    end_epoch = iso_to_epoch(override.get('end_time') or override.get('start_time'))
+    if start_epoch is None or end_epoch is None:
+        return None
+    return (
+        uid, start_epoch, end_epoch,
+        override['start_time'], override.get('end_time') or override['start_time'],
+        recurrence_id, _override_values(override)
+    )
+
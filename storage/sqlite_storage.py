@@ -1,24 +1,75 @@
 import sqlite3
 import json
 import os
+import hashlib
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Any, Optional
-from .base import BaseCalendarStorage
+from typing import List, Dict, Any, Optional, Iterator, Set, Tuple
+from .base import BaseCalendarStorage, EVENT_FIELDS, iso_to_epoch, normalize_fields, project_event
+from .recurrence import expand_event
+from metrics import STORAGE_SECONDS
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 参与内容哈希计算的事件字段
+HASHED_FIELDS = (
+    'uid', 'title', 'start_time', 'end_time', 'location', 'description',
+    'source_calendar', 'source_event_id', 'recurrence_rule', 'organizer',
+    'status', 'categories', 'priority'
+)
+
+# 每次解析都会变化、不代表内容变更的 metadata 字段
+VOLATILE_METADATA_KEYS = ('parsed_time',)
+
+# 仅供内部使用、不返回给调用方的列
+INTERNAL_COLUMNS = ('content_hash', 'start_epoch', 'end_epoch', 'sort_epoch', 'sort_recurrence')
+
+# 事件表中可投影的列（recurrence_id 与 attendees 不在事件表中）
+EVENT_COLUMNS = tuple(field for field in EVENT_FIELDS if field not in ('recurrence_id', 'attendees'))
+
+# SQLite IN 查询的分批大小（低于默认变量数上限）
+SQL_IN_CHUNK = 500
+
+# 游标逐批读取的行数
+FETCH_BATCH = 500
+
+# 实例展开窗口的滚动步长（秒），窗口按天移动，避免每次写入都重新展开
+WINDOW_STEP = 86400
+
+
 class SQLiteCalendarStorage(BaseCalendarStorage):
     """SQLite 日历存储实现"""
     
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, pool_size: int = 8, cache_size_kb: int = 20000,
+                 busy_timeout_ms: int = 5000, recurrence_past_days: int = 30,
+                 recurrence_future_days: int = 365):
         self.db_path = db_path
+        self.pool_size = pool_size
+        self.cache_size_kb = cache_size_kb
+        self.busy_timeout_ms = busy_timeout_ms
+        self.recurrence_past_days = recurrence_past_days
+        self.recurrence_future_days = recurrence_future_days
+        
+        # 空闲连接池：Web 请求线程与同步线程复用连接，不再每次调用都新建连接
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._pool_lock = threading.Lock()
+        self._closed = False
+        self._max_duration_cache: Optional[int] = None
+        
         self._init_database()
     
     def _init_database(self):
         """初始化数据库表结构"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            self._create_tables(cursor)
+            self._roll_occurrence_window(cursor)
+    
+    def _create_tables(self, cursor):
+        """创建表结构与索引"""
         
         # 事件主表
         cursor.execute('''
@@ -82,189 +133,792 @@ class SQLiteCalendarStorage(BaseCalendarStorage):
             )
         ''')
         
+        # 增量同步状态表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_state (
+                source_calendar TEXT PRIMARY KEY,
+                sync_token TEXT,
+                ctag TEXT,
+                last_sync TEXT
+            )
+        ''')
+        
+        # 增量同步对象表（每个 CalDAV 对象的 ETag 与解析结果）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_objects (
+                source_calendar TEXT NOT NULL,
+                href TEXT NOT NULL,
+                etag TEXT,
+                events TEXT,
+                PRIMARY KEY (source_calendar, href)
+            )
+        ''')
+        
+        # 事件实例表：非重复事件一行，重复事件在滚动窗口内每个实例一行
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS occurrences (
+                event_uid TEXT NOT NULL,
+                start_epoch INTEGER NOT NULL,
+                end_epoch INTEGER NOT NULL,
+                start_time TEXT NOT NULL,
+                end_time TEXT NOT NULL,
+                recurrence_id TEXT,
+                overrides TEXT
+            )
+        ''')
+        
+        # 当前已展开的实例窗口（单行）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS occurrence_window (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                window_start INTEGER NOT NULL,
+                window_end INTEGER NOT NULL
+            )
+        ''')
+        
+        self._migrate_schema(cursor)
+        
         # 创建索引
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_uid ON events(uid)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_time ON events(start_time, end_time)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_source ON events(source_calendar)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_deleted ON events(is_deleted)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendees_event ON attendees(event_uid)')
+        # 时间范围查询改为查询 occurrences 表，事件表上的时间索引不再被使用，只会拖慢写入
+        cursor.execute('DROP INDEX IF EXISTS idx_events_time')
+        cursor.execute('DROP INDEX IF EXISTS idx_events_epoch')
+        # 主事件列表按 (开始时间戳, UID) 排序分页
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_events_start ON events(is_deleted, start_epoch, uid)'
+        )
+        # 实例按 (开始时间戳, UID, RECURRENCE-ID) 排序分页，索引顺序即输出顺序；
+        # rowid 在实例重新展开后会变化，不能作为分页游标的一部分
+        cursor.execute('DROP INDEX IF EXISTS idx_occurrences_epoch')
+        cursor.execute('DROP INDEX IF EXISTS idx_occurrences_start')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_occurrences_order ON occurrences(start_epoch, event_uid, recurrence_id)'
+        )
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_occurrences_event ON occurrences(event_uid)')
+    
+    def _migrate_schema(self, cursor):
+        """为旧版本数据库补充新增的列"""
+        cursor.execute('PRAGMA table_info(events)')
+        columns = {row[1] for row in cursor.fetchall()}
         
-        conn.commit()
-        conn.close()
+        if 'content_hash' not in columns:
+            cursor.execute('ALTER TABLE events ADD COLUMN content_hash TEXT')
+        
+        if 'start_epoch' not in columns:
+            cursor.execute('ALTER TABLE events ADD COLUMN start_epoch INTEGER')
+            cursor.execute('ALTER TABLE events ADD COLUMN end_epoch INTEGER')
+            self._backfill_epochs(cursor)
+    
+    @staticmethod
+    def _backfill_epochs(cursor):
+        """根据 ISO 时间字符串回填 UTC 时间戳列"""
+        cursor.execute('SELECT id, start_time, end_time FROM events')
+        rows = [
+            (iso_to_epoch(start_time), iso_to_epoch(end_time), row_id)
+            for row_id, start_time, end_time in cursor.fetchall()
+        ]
+        cursor.executemany('UPDATE events SET start_epoch = ?, end_epoch = ? WHERE id = ?', rows)
+        if rows:
+            logger.info(f"已回填 {len(rows)} 个事件的时间戳列")
     
     def _get_connection(self):
-        """获取数据库连接"""
-        return sqlite3.connect(self.db_path)
+        """创建新的数据库连接（WAL 模式，读操作不会被写事务阻塞）"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        return conn
+    
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """从连接池借出连接，使用完毕后归还
+        
+        正常退出时提交未结束的事务，异常时回滚。连接同一时间只被一个线程使用。
+        """
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._get_connection()
+        
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+    
+    def _release(self, conn: sqlite3.Connection):
+        """归还连接，连接池已满或已关闭时直接关闭连接"""
+        with self._pool_lock:
+            if not self._closed and self._pool.qsize() < self.pool_size:
+                self._pool.put_nowait(conn)
+                return
+        conn.close()
+    
+    def close(self):
+        """关闭连接池中的所有连接"""
+        with self._pool_lock:
+            self._closed = True
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+        logger.info("SQLite 连接已关闭")
     
     def save_events(self, events: List[Dict]) -> bool:
         """保存事件列表到数据库"""
         if not events:
             return True
-            
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        
+        stats = self.upsert_events(events)
+        return stats['failed'] < len(events)
+    
+    @STORAGE_SECONDS.timed(operation='save_events')
+    def upsert_events(self, events: List[Dict]) -> Dict[str, int]:
+        """批量写入事件，只写入内容发生变化的事件
+        
+        在单个事务中用 executemany 插入新事件、更新内容哈希变化的事件，
+        哈希未变化的事件不产生任何写入。返回 inserted/updated/unchanged/failed 计数。
+        """
+        stats = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+        if not events:
+            return stats
         
         current_time = datetime.now().isoformat()
-        success_count = 0
+        errors = []
         
+        # 同一 UID 出现多次时以最后一个为准（与 INSERT OR REPLACE 行为一致）
+        pending: Dict[str, Dict] = {}
         for event in events:
-            try:
-                # 插入或更新事件
-                cursor.execute('''
-                    INSERT OR REPLACE INTO events (
-                        uid, title, start_time, end_time, location, description,
-                        source_calendar, source_event_id, created_time, last_updated,
-                        recurrence_rule, organizer, status, categories, priority, metadata, is_deleted
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, ?), ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    event.get('uid'),
-                    event.get('title', ''),
-                    event.get('start_time'),
-                    event.get('end_time'),
-                    event.get('location', ''),
-                    event.get('description', ''),
-                    event.get('source_calendar', 'unknown'),
-                    event.get('source_event_id'),
-                    event.get('created_time'),
-                    current_time,
-                    current_time,
-                    event.get('recurrence_rule'),
-                    event.get('organizer'),
-                    event.get('status', 'confirmed'),
-                    json.dumps(event.get('categories', []), ensure_ascii=False),
-                    event.get('priority', 0),
-                    json.dumps(event.get('metadata', {}), ensure_ascii=False),
-                    0  # is_deleted
+            uid = event.get('uid')
+            if not uid or not event.get('start_time') or not event.get('end_time'):
+                stats['failed'] += 1
+                errors.append((current_time, 'save_events', f"保存事件失败 {uid}", '缺少 uid 或起止时间'))
+                continue
+            pending[uid] = event
+        
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            self._write_events(conn, cursor, events, pending, errors, stats, current_time)
+        
+        logger.info(
+            f"保存 {len(events)} 个事件: 新增 {stats['inserted']}, 更新 {stats['updated']}, "
+            f"未变化 {stats['unchanged']}, 失败 {stats['failed']}"
+        )
+        return stats
+    
+    def _write_events(self, conn, cursor, events: List[Dict], pending: Dict[str, Dict],
+                      errors: List[tuple], stats: Dict[str, int], current_time: str):
+        """在单个事务中写入有变化的事件"""
+        try:
+            existing = self._load_content_hashes(cursor, list(pending))
+            
+            inserts = []
+            updates = []
+            for uid, event in pending.items():
+                content_hash = self._content_hash(event)
+                if uid not in existing:
+                    inserts.append((event, content_hash))
+                elif existing[uid] != (content_hash, 0):
+                    updates.append((event, content_hash))
+                else:
+                    stats['unchanged'] += 1
+            
+            cursor.executemany('''
+                INSERT INTO events (
+                    uid, title, start_time, end_time, location, description,
+                    source_calendar, source_event_id, recurrence_rule, organizer, status,
+                    categories, priority, metadata, content_hash, last_updated, start_epoch, end_epoch,
+                    is_deleted, created_time
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
+            ''', [
+                self._event_row(event, content_hash, current_time)
+                + (event.get('created_time') or current_time,)
+                for event, content_hash in inserts
+            ])
+            
+            cursor.executemany('''
+                UPDATE events SET
+                    uid = ?, title = ?, start_time = ?, end_time = ?, location = ?, description = ?,
+                    source_calendar = ?, source_event_id = ?, recurrence_rule = ?, organizer = ?, status = ?,
+                    categories = ?, priority = ?, metadata = ?, content_hash = ?, last_updated = ?,
+                    start_epoch = ?, end_epoch = ?, is_deleted = 0
+                WHERE uid = ?
+            ''', [
+                self._event_row(event, content_hash, current_time) + (event['uid'],)
+                for event, content_hash in updates
+            ])
+            
+            # 只重写有变化事件的参与者
+            changed = [event for event, _ in inserts + updates]
+            cursor.executemany(
+                'DELETE FROM attendees WHERE event_uid = ?',
+                [(event['uid'],) for event in changed]
+            )
+            cursor.executemany('''
+                INSERT INTO attendees (event_uid, email, name, role, status)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [
+                row for event in changed for row in self._attendee_rows(event)
+            ])
+            
+            # 只重新展开有变化事件的实例，窗口滚动时再展开全部重复事件
+            self._materialize_occurrences(cursor, changed, self._occurrence_window())
+            self._roll_occurrence_window(cursor)
+            
+            if errors:
+                self._log_errors(cursor, errors)
+            
+            conn.commit()
+            stats['inserted'] = len(inserts)
+            stats['updated'] = len(updates)
+            if inserts or updates:
+                self._max_duration_cache = None
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"批量保存事件失败: {e}")
+            self._log_errors(cursor, [(current_time, 'save_events', '批量保存事件失败', str(e))])
+            conn.commit()
+            stats['failed'] = len(events)
+    
+    @staticmethod
+    def _content_hash(event: Dict) -> str:
+        """计算事件内容哈希（忽略每次解析都会变化的字段）"""
+        metadata = {
+            key: value for key, value in (event.get('metadata') or {}).items()
+            if key not in VOLATILE_METADATA_KEYS
+        }
+        content = [event.get(field) for field in HASHED_FIELDS]
+        content.append(metadata)
+        content.append(event.get('attendees', []))
+        payload = json.dumps(content, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def _event_row(event: Dict, content_hash: str, current_time: str) -> tuple:
+        """构造事件表的写入参数"""
+        return (
+            event.get('uid'),
+            event.get('title', ''),
+            event.get('start_time'),
+            event.get('end_time'),
+            event.get('location', ''),
+            event.get('description', ''),
+            event.get('source_calendar', 'unknown'),
+            event.get('source_event_id'),
+            event.get('recurrence_rule'),
+            event.get('organizer'),
+            event.get('status', 'confirmed'),
+            json.dumps(event.get('categories', []), ensure_ascii=False),
+            event.get('priority', 0),
+            json.dumps(event.get('metadata', {}), ensure_ascii=False),
+            content_hash,
+            current_time,
+            event.get('start_epoch', iso_to_epoch(event.get('start_time'))),
+            event.get('end_epoch', iso_to_epoch(event.get('end_time')))
+        )
+    
+    @staticmethod
+    def _attendee_rows(event: Dict) -> List[tuple]:
+        """构造参与者表的写入参数"""
+        rows = []
+        for attendee in event.get('attendees', []):
+            if isinstance(attendee, str):
+                rows.append((event['uid'], attendee, None, 'REQ-PARTICIPANT', 'NEEDS-ACTION'))
+            else:
+                rows.append((
+                    event['uid'],
+                    attendee.get('email', ''),
+                    attendee.get('name', ''),
+                    attendee.get('role', 'REQ-PARTICIPANT'),
+                    attendee.get('status', 'NEEDS-ACTION')
                 ))
-                
-                # 处理参与者
-                attendees = event.get('attendees', [])
-                cursor.execute('DELETE FROM attendees WHERE event_uid = ?', (event.get('uid'),))
-                
-                for attendee in attendees:
-                    if isinstance(attendee, str):
-                        cursor.execute('''
-                            INSERT INTO attendees (event_uid, email) VALUES (?, ?)
-                        ''', (event.get('uid'), attendee))
-                    else:
-                        cursor.execute('''
-                            INSERT INTO attendees (event_uid, email, name, role, status)
-                            VALUES (?, ?, ?, ?, ?)
-                        ''', (
-                            event.get('uid'),
-                            attendee.get('email', ''),
-                            attendee.get('name', ''),
-                            attendee.get('role', 'REQ-PARTICIPANT'),
-                            attendee.get('status', 'NEEDS-ACTION')
-                        ))
-                
-                success_count += 1
-                
+        return rows
+    
+    @staticmethod
+    def _load_content_hashes(cursor, uids: List[str]) -> Dict[str, tuple]:
+        """分批查询已有事件的 (content_hash, is_deleted)"""
+        existing = {}
+        for offset in range(0, len(uids), SQL_IN_CHUNK):
+            chunk = uids[offset:offset + SQL_IN_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(
+                f'SELECT uid, content_hash, is_deleted FROM events WHERE uid IN ({placeholders})',
+                chunk
+            )
+            for uid, content_hash, is_deleted in cursor.fetchall():
+                existing[uid] = (content_hash, is_deleted)
+        return existing
+    
+    def _occurrence_window(self) -> tuple:
+        """当前应展开的实例窗口 (开始, 结束) 时间戳，按天对齐"""
+        now = int(datetime.now().timestamp())
+        window_start = now - self.recurrence_past_days * 86400
+        window_end = now + self.recurrence_future_days * 86400
+        return (
+            window_start - window_start % WINDOW_STEP,
+            window_end - window_end % WINDOW_STEP + WINDOW_STEP
+        )
+    
+    @staticmethod
+    def _materialize_occurrences(cursor, events: List[Dict], window: tuple):
+        """重新生成给定事件的实例行"""
+        cursor.executemany(
+            'DELETE FROM occurrences WHERE event_uid = ?',
+            [(event['uid'],) for event in events]
+        )
+        rows = []
+        for event in events:
+            try:
+                rows.extend(expand_event(event, window[0], window[1]))
             except Exception as e:
-                logger.error(f"保存事件失败 {event.get('uid')}: {e}")
-                self._log_error('save_events', f"保存事件失败 {event.get('uid')}", str(e))
-                continue
+                # 无法解析的重复规则只保留主事件本身
+                logger.error(f"展开重复事件失败 {event.get('uid')}: {e}")
+                rows.extend(expand_event(dict(event, recurrence_rule=None, metadata={}), *window))
+        cursor.executemany('''
+            INSERT INTO occurrences (
+                event_uid, start_epoch, end_epoch, start_time, end_time, recurrence_id, overrides
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+    
+    def _roll_occurrence_window(self, cursor):
+        """窗口移动后重新展开重复事件；首次建表时展开全部事件"""
+        window = self._occurrence_window()
+        cursor.execute('SELECT window_start, window_end FROM occurrence_window WHERE id = 1')
+        stored = cursor.fetchone()
+        if stored is not None and tuple(stored) == window:
+            return
         
-        conn.commit()
-        conn.close()
+        cursor.row_factory = sqlite3.Row
+        if stored is None:
+            cursor.execute('SELECT * FROM events')
+        else:
+            # 非重复事件的实例与窗口无关，只需处理重复事件
+            cursor.execute('''
+                SELECT * FROM events
+                WHERE recurrence_rule IS NOT NULL OR metadata LIKE '%"rdate":%'
+            ''')
+        events = [self._row_to_event(row) for row in cursor.fetchall()]
+        cursor.row_factory = None
         
-        logger.info(f"成功保存 {success_count}/{len(events)} 个事件")
-        return success_count > 0
+        self._materialize_occurrences(cursor, events, window)
+        cursor.execute(
+            'INSERT OR REPLACE INTO occurrence_window (id, window_start, window_end) VALUES (1, ?, ?)',
+            window
+        )
+        self._max_duration_cache = None
+        logger.info(f"已展开 {len(events)} 个事件的实例")
     
+    @STORAGE_SECONDS.timed(operation='load_events')
     def load_events(self, start_date: Optional[str] = None, 
                    end_date: Optional[str] = None,
-                   source_calendar: Optional[str] = None) -> List[Dict]:
+                   source_calendar: Optional[str] = None,
+                   include_attendees: bool = True) -> List[Dict]:
         """从数据库加载事件"""
-        conn = self._get_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        return list(self.iter_events(start_date, end_date, source_calendar, include_attendees))
+    
+    @STORAGE_SECONDS.timed(operation='load_events_page')
+    def load_events_page(self, start_date: Optional[str] = None,
+                         end_date: Optional[str] = None,
+                         source_calendar: Optional[str] = None,
+                         include_attendees: bool = True,
+                         limit: int = 100,
+                         after: Optional[tuple] = None,
+                         fields: Optional[List[str]] = None) -> Tuple[List[Dict], Optional[tuple]]:
+        """按 (开始时间戳, UID) 顺序分页加载事件，返回 (事件, 下一页的起点)，没有下一页时起点为 None"""
+        rows = self._iter_event_rows(
+            start_date, end_date, source_calendar, include_attendees, after, limit + 1, fields
+        )
+        page = list(rows)
+        if len(page) <= limit:
+            return [event for _, event in page], None
+        page = page[:limit]
+        return [event for _, event in page], page[-1][0]
+    
+    def iter_events(self, start_date: Optional[str] = None,
+                    end_date: Optional[str] = None,
+                    source_calendar: Optional[str] = None,
+                    include_attendees: bool = False,
+                    after: Optional[tuple] = None,
+                    fields: Optional[List[str]] = None) -> Iterator[Dict]:
+        """通过游标逐批读取事件，内存占用与结果数量无关"""
+        rows = self._iter_event_rows(start_date, end_date, source_calendar, include_attendees, after, fields=fields)
+        for _, event in rows:
+            yield event
+    
+    def _iter_event_rows(self, start_date: Optional[str], end_date: Optional[str],
+                         source_calendar: Optional[str], include_attendees: bool,
+                         after: Optional[tuple] = None,
+                         limit: Optional[int] = None,
+                         fields: Optional[List[str]] = None) -> Iterator[Tuple[tuple, Dict]]:
+        """按 (开始时间戳, UID) 顺序逐批读取事件，返回 (排序键, 事件)，排序键为 (开始时间戳, UID, RECURRENCE-ID)
         
-        query = "SELECT * FROM events WHERE is_deleted = 0"
+        查询在第一次取值时执行；指定 fields 时只查询并解码这些字段，未请求 attendees 时不查询参与者表。
+        """
+        fields = normalize_fields(fields)
+        columns = None
+        if fields is not None:
+            include_attendees = include_attendees and 'attendees' in fields
+            columns = [column for column in EVENT_COLUMNS if column in fields]
+        
+        query, params = self._build_events_query(
+            start_date, end_date, source_calendar, after, limit, columns
+        )
+        yield from self._iter_query_rows(query, params, include_attendees, fields)
+    
+    def iter_feed_events(self, sources: Optional[List[str]] = None,
+                         categories: Optional[List[str]] = None,
+                         start_epoch: Optional[int] = None,
+                         end_epoch: Optional[int] = None) -> Iterator[Dict]:
+        """按日历源、分类与时间窗口过滤主事件（不含参与者），用于渲染筛选后的订阅
+        
+        分类不区分大小写，命中任一分类即可；时间窗口按实例判断，
+        重复事件在窗口内有实例时返回带 RRULE 的主事件。结果顺序与 iter_events 相同。
+        """
+        query = "SELECT *, start_epoch AS sort_epoch, '' AS sort_recurrence FROM events WHERE is_deleted = 0"
+        params: List[Any] = []
+        if sources:
+            query += f" AND source_calendar IN ({','.join('?' * len(sources))})"
+            params.extend(sources)
+        if categories:
+            query += (
+                " AND EXISTS (SELECT 1 FROM json_each(events.categories)"
+                f" WHERE lower(json_each.value) IN ({','.join('?' * len(categories))}))"
+            )
+            params.extend(category.lower() for category in categories)
+        if start_epoch is not None or end_epoch is not None:
+            window = []
+            if start_epoch is not None:
+                window.append("end_epoch >= ? AND start_epoch >= ?")
+                params.extend([start_epoch, start_epoch - self._max_duration()])
+            if end_epoch is not None:
+                window.append("start_epoch <= ?")
+                params.append(end_epoch)
+            query += f" AND uid IN (SELECT event_uid FROM occurrences WHERE {' AND '.join(window)})"
+        query += " ORDER BY start_epoch, uid"
+        
+        for _, event in self._iter_query_rows(query, params, False):
+            yield event
+    
+    def _iter_query_rows(self, query: str, params: List[Any], include_attendees: bool,
+                         fields: Optional[Tuple[str, ...]] = None) -> Iterator[Tuple[tuple, Dict]]:
+        """执行事件查询并逐批转换结果，返回 (排序键, 事件)
+        
+        查询需返回 sort_epoch 与 sort_recurrence 列；参与者按批查询，每批只占用 FETCH_BATCH 行的内存。
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            attendee_cursor = None
+            if include_attendees:
+                attendee_cursor = conn.cursor()
+                attendee_cursor.row_factory = sqlite3.Row
+            
+            cursor.execute(query, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(FETCH_BATCH)
+                    if not rows:
+                        break
+                    batch = []
+                    for row in rows:
+                        try:
+                            batch.append(((row['sort_epoch'], row['uid'], row['sort_recurrence']), self._row_to_event(row)))
+                        except Exception as e:
+                            logger.error(f"解析事件失败 {row['uid']}: {e}")
+                            continue
+                    
+                    # 批量加载参与者，避免每个事件一次查询
+                    if attendee_cursor is not None:
+                        attendees = self._load_attendees(
+                            attendee_cursor, list({event['uid'] for _, event in batch})
+                        )
+                        for _, event in batch:
+                            event['attendees'] = attendees.get(event['uid'], [])
+                    
+                    if fields is not None:
+                        batch = [(key, project_event(event, fields)) for key, event in batch]
+                    yield from batch
+            finally:
+                cursor.close()
+                if attendee_cursor is not None:
+                    attendee_cursor.close()
+    
+    def _build_events_query(self, start_date: Optional[str], end_date: Optional[str],
+                            source_calendar: Optional[str],
+                            after: Optional[tuple] = None,
+                            limit: Optional[int] = None,
+                            columns: Optional[List[str]] = None) -> tuple:
+        """构造事件查询
+        
+        不带时间范围时返回主事件；带时间范围时从 occurrences 表按实例查询，
+        重复事件的每个实例返回一行（start_time/end_time 为实例时间，并带 recurrence_id）。
+        按 UTC 时间戳比较，不受时区偏移和全天日期格式影响。end_date 为纯日期时包含当天。
+        区间重叠条件 end >= 起点 只能在索引内过滤，因此额外加上
+        start_epoch >= 起点 - 最长实例时长，使两端都能利用 idx_occurrences_order 收窄扫描范围。
+        结果按 (开始时间戳, UID) 排序（实例再按 RECURRENCE-ID），after 为上一页最后一行的排序键（键集分页）。
+        columns 为要查询的事件表列（总是包含 uid），None 表示全部列。
+        """
+        if not start_date and not end_date:
+            selected = '*' if columns is None else ', '.join(['uid'] + [c for c in columns if c != 'uid'])
+            query = f"SELECT {selected}, start_epoch AS sort_epoch, '' AS sort_recurrence FROM events WHERE is_deleted = 0"
+            params: List[Any] = []
+            if source_calendar:
+                query += " AND source_calendar = ?"
+                params.append(source_calendar)
+            if after is not None:
+                # UID 唯一，主事件只需 (开始时间戳, UID) 定位
+                after_epoch, after_uid = after[0], after[1]
+                if after_epoch is None:
+                    # 开始时间无法解析的事件排在最前
+                    query += " AND (start_epoch IS NOT NULL OR uid > ?)"
+                    params.append(after_uid)
+                else:
+                    query += " AND (start_epoch, uid) > (?, ?)"
+                    params.extend([after_epoch, after_uid])
+            query += " ORDER BY start_epoch, uid"
+            if limit is not None:
+                query += " LIMIT ?"
+                params.append(limit)
+            return query, params
+        
+        # CROSS JOIN 固定以 occurrences 为外层循环，按时间索引顺序扫描，无需额外排序
+        selected = 'e.*'
+        if columns is not None:
+            # 实例的起止时间来自 occurrences 表
+            selected = ', '.join(
+                ['e.uid'] + [f'e.{c}' for c in columns if c not in ('uid', 'start_time', 'end_time')]
+            )
+        query = f'''
+            SELECT {selected}, o.start_time AS occurrence_start, o.end_time AS occurrence_end,
+                   o.recurrence_id AS recurrence_id, o.overrides AS occurrence_overrides,
+                   o.start_epoch AS sort_epoch, COALESCE(o.recurrence_id, '') AS sort_recurrence
+            FROM occurrences o INDEXED BY idx_occurrences_order
+            CROSS JOIN events e ON e.uid = o.event_uid
+            WHERE e.is_deleted = 0
+        '''
         params = []
         
         if start_date:
-            query += " AND end_time >= ?"
-            params.append(start_date)
+            range_start = iso_to_epoch(start_date)
+            if range_start is None:
+                raise ValueError(f"无效的开始时间: {start_date}")
+            query += " AND o.end_epoch >= ? AND o.start_epoch >= ?"
+            params.extend([range_start, range_start - self._max_duration()])
         
         if end_date:
-            query += " AND start_time <= ?"
-            params.append(end_date)
+            range_end = iso_to_epoch(end_date)
+            if range_end is None:
+                raise ValueError(f"无效的结束时间: {end_date}")
+            if len(end_date) == 10:
+                range_end += 86400 - 1
+            query += " AND o.start_epoch <= ?"
+            params.append(range_end)
         
         if source_calendar:
-            query += " AND source_calendar = ?"
+            query += " AND e.source_calendar = ?"
             params.append(source_calendar)
         
-        query += " ORDER BY start_time"
+        if after is not None:
+            # 同一事件的多个实例可能开始时间相同，以 RECURRENCE-ID 区分（非重复事件只有一行，为 NULL）
+            query += " AND (o.start_epoch, o.event_uid, COALESCE(o.recurrence_id, '')) > (?, ?, ?)"
+            params.extend(after)
         
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
+        query += " ORDER BY o.start_epoch, o.event_uid, o.recurrence_id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        return query, params
+    
+    def _max_duration(self) -> int:
+        """最长实例时长（秒），写入后失效"""
+        if self._max_duration_cache is None:
+            with self._connection() as conn:
+                row = conn.execute(
+                    'SELECT MAX(end_epoch - start_epoch) FROM occurrences'
+                ).fetchone()
+            self._max_duration_cache = max(int(row[0] or 0), 0)
+        return self._max_duration_cache
+    
+    @staticmethod
+    def _row_to_event(row) -> Dict:
+        """将事件表（或实例查询）的行转换为事件字典"""
+        event = dict(row)
+        for column in INTERNAL_COLUMNS:
+            event.pop(column, None)
         
-        events = []
-        for row in rows:
-            try:
-                event = dict(row)
-                
-                # 解析JSON字段
-                if event['categories']:
-                    event['categories'] = json.loads(event['categories'])
-                else:
-                    event['categories'] = []
-                    
-                if event['metadata']:
-                    event['metadata'] = json.loads(event['metadata'])
-                else:
-                    event['metadata'] = {}
-                
-                # 加载参与者
-                cursor.execute('SELECT * FROM attendees WHERE event_uid = ?', (event['uid'],))
-                attendees = [dict(attendee) for attendee in cursor.fetchall()]
-                event['attendees'] = attendees
-                
-                events.append(event)
-            except Exception as e:
-                logger.error(f"解析事件失败 {row['uid']}: {e}")
-                continue
+        # 实例查询：使用实例的起止时间，并应用例外实例修改的字段
+        if 'occurrence_start' in event:
+            event['start_time'] = event.pop('occurrence_start')
+            event['end_time'] = event.pop('occurrence_end')
+            overrides = event.pop('occurrence_overrides')
+            if overrides:
+                event.update(json.loads(overrides))
         
-        conn.close()
-        return events
+        # 解析JSON字段（投影查询未选择的字段不解码）
+        if 'categories' in event:
+            if event['categories']:
+                event['categories'] = json.loads(event['categories'])
+            else:
+                event['categories'] = []
+        
+        if 'metadata' in event:
+            if event['metadata']:
+                event['metadata'] = json.loads(event['metadata'])
+            else:
+                event['metadata'] = {}
+        
+        return event
+    
+    @staticmethod
+    def _load_attendees(cursor, uids: List[str]) -> Dict[str, List[Dict]]:
+        """分批查询参与者并按事件 UID 分组"""
+        attendees: Dict[str, List[Dict]] = {}
+        for offset in range(0, len(uids), SQL_IN_CHUNK):
+            chunk = uids[offset:offset + SQL_IN_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(
+                f'SELECT * FROM attendees WHERE event_uid IN ({placeholders}) ORDER BY id',
+                chunk
+            )
+            for attendee in cursor.fetchall():
+                attendee = dict(attendee)
+                attendees.setdefault(attendee['event_uid'], []).append(attendee)
+        return attendees
     
     def delete_event(self, event_uid: str) -> bool:
         """软删除事件"""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                'UPDATE events SET is_deleted = 1, last_updated = ? WHERE uid = ?',
-                (datetime.now().isoformat(), event_uid)
-            )
-            
-            conn.commit()
-            conn.close()
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute(
+                    'UPDATE events SET is_deleted = 1, last_updated = ? WHERE uid = ?',
+                    (datetime.now().isoformat(), event_uid)
+                )
+                
+                conn.commit()
             return cursor.rowcount > 0
         except Exception as e:
             logger.error(f"删除事件失败 {event_uid}: {e}")
             return False
     
+    def delete_events(self, event_uids: List[str]) -> int:
+        """批量软删除事件，已删除的事件不重复计数"""
+        if not event_uids:
+            return 0
+        
+        current_time = datetime.now().isoformat()
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany(
+                    'UPDATE events SET is_deleted = 1, last_updated = ? WHERE uid = ? AND is_deleted = 0',
+                    [(current_time, uid) for uid in event_uids]
+                )
+                
+                conn.commit()
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"批量删除事件失败: {e}")
+            return 0
+    
+    def sweep_events(self, source_calendar: str, seen_uids: Set[str],
+                     start_epoch: int, end_epoch: int, include_recurring: bool = False,
+                     max_fraction: float = 1.0, min_guarded: int = 0) -> Dict[str, Any]:
+        """软删除日历源在同步范围内、本次同步未出现的事件
+        
+        本次出现的 UID 写入连接内的临时表，再用一条 UPDATE 完成标记-清除。
+        """
+        result = {'deleted': 0, 'candidates': 0, 'total': 0, 'blocked': False}
+        scope = '''
+            source_calendar = ? AND is_deleted = 0 AND (
+                (recurrence_rule IS NULL AND end_epoch >= ? AND start_epoch <= ?)
+                OR (? AND recurrence_rule IS NOT NULL)
+            )
+        '''
+        params = (source_calendar, start_epoch, end_epoch, int(include_recurring))
+        
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('CREATE TEMP TABLE IF NOT EXISTS sweep_seen (uid TEXT PRIMARY KEY)')
+                cursor.execute('DELETE FROM sweep_seen')
+                cursor.executemany(
+                    'INSERT OR IGNORE INTO sweep_seen (uid) VALUES (?)',
+                    [(uid,) for uid in seen_uids]
+                )
+                
+                cursor.execute(f'''
+                    SELECT COUNT(*), COUNT(*) - COUNT(s.uid)
+                    FROM events LEFT JOIN sweep_seen s ON s.uid = events.uid
+                    WHERE {scope}
+                ''', params)
+                result['total'], result['candidates'] = cursor.fetchone()
+                
+                # 删除比例异常时不执行，防止上游返回不完整的结果时清空该源
+                candidates = result['candidates']
+                if candidates > min_guarded and candidates > result['total'] * max_fraction:
+                    result['blocked'] = True
+                elif candidates:
+                    cursor.execute(f'''
+                        UPDATE events SET is_deleted = 1, last_updated = ?
+                        WHERE {scope} AND uid NOT IN (SELECT uid FROM sweep_seen)
+                    ''', (datetime.now().isoformat(),) + params)
+                    result['deleted'] = cursor.rowcount
+                
+                cursor.execute('DELETE FROM sweep_seen')
+                conn.commit()
+        except Exception as e:
+            logger.error(f"删除检测失败 {source_calendar}: {e}")
+            return result
+        
+        if result['deleted']:
+            self._max_duration_cache = None
+        return result
+    
     def get_event(self, event_uid: str) -> Optional[Dict]:
-        """获取单个事件"""
-        events = self.load_events()
-        for event in events:
-            if event['uid'] == event_uid:
-                return event
-        return None
+        """获取单个事件（通过 uid 索引查询）"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            
+            cursor.execute(
+                'SELECT * FROM events INDEXED BY idx_events_uid WHERE uid = ? AND is_deleted = 0',
+                (event_uid,)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            
+            event = self._row_to_event(row)
+            event['attendees'] = self._load_attendees(cursor, [event_uid]).get(event_uid, [])
+            return event
     
     def backup(self) -> str:
         """创建数据库备份"""
         try:
             backup_path = f"{self.db_path}.backup.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
             
-            conn = self._get_connection()
             backup_conn = sqlite3.connect(backup_path)
             
-            conn.backup(backup_conn)
+            with self._connection() as conn:
+                conn.backup(backup_conn)
             
-            conn.close()
             backup_conn.close()
             
             logger.info(f"数据库备份已创建: {backup_path}")
@@ -275,42 +929,103 @@ class SQLiteCalendarStorage(BaseCalendarStorage):
     
     def get_stats(self) -> Dict[str, Any]:
         """获取统计信息"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        stats = {}
-        
-        # 总事件数
-        cursor.execute('SELECT COUNT(*) FROM events WHERE is_deleted = 0')
-        stats['total_events'] = cursor.fetchone()[0]
-        
-        # 按来源统计
-        cursor.execute('''
-            SELECT source_calendar, COUNT(*) 
-            FROM events WHERE is_deleted = 0 
-            GROUP BY source_calendar
-        ''')
-        stats['events_by_source'] = dict(cursor.fetchall())
-        
-        # 最近同步时间
-        cursor.execute('''
-            SELECT MAX(sync_time) FROM sync_logs 
-            WHERE errors IS NULL OR errors = ''
-        ''')
-        stats['last_sync'] = cursor.fetchone()[0]
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            
+            stats = {}
+            
+            # 总事件数
+            cursor.execute('SELECT COUNT(*) FROM events WHERE is_deleted = 0')
+            stats['total_events'] = cursor.fetchone()[0]
+            
+            # 按来源统计
+            cursor.execute('''
+                SELECT source_calendar, COUNT(*) 
+                FROM events WHERE is_deleted = 0 
+                GROUP BY source_calendar
+            ''')
+            stats['events_by_source'] = dict(cursor.fetchall())
+            
+            # 最近同步时间
+            cursor.execute('''
+                SELECT MAX(sync_time) FROM sync_logs 
+                WHERE errors IS NULL OR errors = ''
+            ''')
+            stats['last_sync'] = cursor.fetchone()[0]
         
-        conn.close()
         return stats
     
+    def load_sync_state(self, source_calendar: str) -> Optional[Dict[str, Any]]:
+        """加载日历源的增量同步状态"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                'SELECT sync_token, ctag FROM sync_state WHERE source_calendar = ?',
+                (source_calendar,)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            
+            objects = {}
+            cursor.execute(
+                'SELECT href, etag, events FROM sync_objects WHERE source_calendar = ?',
+                (source_calendar,)
+            )
+            for href, etag, events in cursor.fetchall():
+                try:
+                    objects[href] = {'etag': etag, 'events': json.loads(events) if events else []}
+                except ValueError as e:
+                    # 缓存损坏的对象不载入，下次同步时会重新下载
+                    logger.error(f"解析同步对象失败 {href}: {e}")
+        
+        return {'sync_token': row[0], 'ctag': row[1], 'objects': objects}
+    
+    def save_sync_state(self, source_calendar: str, sync_token: Optional[str],
+                        ctag: Optional[str], updated: Dict[str, Dict],
+                        removed: List[str], reset: bool = False) -> bool:
+        """保存日历源的增量同步状态"""
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                
+                if reset:
+                    cursor.execute('DELETE FROM sync_objects WHERE source_calendar = ?', (source_calendar,))
+                
+                cursor.executemany(
+                    'DELETE FROM sync_objects WHERE source_calendar = ? AND href = ?',
+                    [(source_calendar, href) for href in removed]
+                )
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO sync_objects (source_calendar, href, etag, events)
+                    VALUES (?, ?, ?, ?)
+                ''', [
+                    (source_calendar, href, entry.get('etag'),
+                     json.dumps(entry.get('events', []), ensure_ascii=False))
+                    for href, entry in updated.items()
+                ])
+                cursor.execute('''
+                    INSERT OR REPLACE INTO sync_state (source_calendar, sync_token, ctag, last_sync)
+                    VALUES (?, ?, ?, ?)
+                ''', (source_calendar, sync_token, ctag, datetime.now().isoformat()))
+                
+                conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"保存同步状态失败 {source_calendar}: {e}")
+            return False
+    
     def _log_error(self, module: str, message: str, details: str = ""):
         """记录错误日志"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        with self._connection() as conn:
+            self._log_errors(conn.cursor(), [(datetime.now().isoformat(), module, message, details)])
+            conn.commit()
+    
+    @staticmethod
+    def _log_errors(cursor, errors: List[tuple]):
+        """在已有连接上批量记录错误日志，errors 为 (timestamp, module, message, details)"""
+        cursor.executemany('''
             INSERT INTO error_logs (timestamp, module, message, details)
             VALUES (?, ?, ?, ?)
-        ''', (datetime.now().isoformat(), module, message, details))
-        
-        conn.commit()
-        conn.close()
\ No newline at end of file
+        ''', errors)